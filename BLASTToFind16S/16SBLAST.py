@@ -4,26 +4,55 @@
 # Created by: Lee Bergstrand
 # Description: A simple python program that use BLASTn to search for 16S genes within a geneome.
 #              Extracts the aligned query sequence from the BLAST results (This should be the 16S
-#              gene in the query genome).
+#              gene in the query genome). Multiple genomes (or a directory of genomes) can be passed
+#              at once, in which case they are sent to BLASTn together in large multi-query batches.
+#              BLAST results are parsed as they stream out of BLASTn. With --coords-only BLASTn only reports
+#              hit coordinates and the 16S is cut directly from the genome. With --cache results are reused
+#              for genomes that have already been searched against the same database. With --amplicon-first
+#              the 27F-1492R amplicon is cut directly from genomes that have both primer sites and only the
+#              rest are BLASTed. Headers then record the tier that found each 16S. With --metrics the time, CPU,
+#              bytes and memory used by each stage are logged as JSON lines. With --store results (with the
+#              strand and bit score of each 16S) go to an SQLite store made by SixteenSResultStore.py instead of
+#              the Found16SGenesBLAST.fna and No16SGenomesBLAST.txt files.
 #
 # Requirements: - This program requires the Biopython module: http://biopython.org/wiki/Download
 #               - This script requires BLAST+ 2.2.9 or later.
 #               - MakeNABlastDB must be used to create BLASTn databases for both query and subject proteomes.
 #               - BLAST databases require that the FASTA file they were made from remain in the same directory.
-#  
-# Usage: 16SBLAST.py <QueryGenome.faa> <16SDataBase.faa>
-# Example: 16SBLAST.py QueryGenome.faa RDPActinoBacter16S.faa
+#
+# Usage: 16SBLAST.py [--batch-size N] [--coords-only] [--amplicon-first] [--cache <CacheDirectory>] [--metrics <Metrics.jsonl>]
+#                    [--store <Results.db>]
+#                    <QueryGenome.fna|GenomeDirectory> [QueryGenome2.fna ...] <16SDataBase.fna>
+# Example: 16SBLAST.py QueryGenome.fna RDPActinoBacter16S.fna
+# Example: 16SBLAST.py --batch-size 500 ./Genomes/ RDPActinoBacter16S.fna
+# Example: 16SBLAST.py --metrics 16SBLASTMetrics.jsonl ./Genomes/ RDPActinoBacter16S.fna
+# Example: 16SBLAST.py --store 16SResults.db ./Genomes/ RDPActinoBacter16S.fna
 # ----------------------------------------------------------------------------------------
 # ===========================================================================================================
 
 # Imports & Setup:
+import argparse
+import atexit
 import csv
 import subprocess
 import sys
+import threading
+import time
 from multiprocessing import cpu_count
-from os import path
+from os import listdir, path
+
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "..", "SupplementaryScripts"))
+import PipelineMetrics
+import SixteenSCache
+import SixteenSResultStore
+
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "..", "PrimersToFind16S"))
+import AmpliconExtract16S
 
 processors = cpu_count()  # Gets number of processor cores for BLAST.
+tierTag = "tier=blast"  # Added to the FASTA headers of 16S genes found by BLAST when running with --amplicon-first.
+metrics = PipelineMetrics.MetricsRecorder()  # Replaced by a recording instance when running with --metrics.
+store = None  # The SixteenSResultStore.ResultStore results are written to when running with --store.
 
 
 # ===========================================================================================================
@@ -35,38 +64,142 @@ def argsCheck():
         print("16S Gene Finder")
         print("By Lee Bergstrand\n")
         print("Please refer to source code for documentation\n")
-        print("Usage: " + sys.argv[0] + "<QueryGenome.faa> <16SDataBase.faa>\n")
-        print("Examples:" + sys.argv[0] + "QueryGenome.faa RDPActinoBacter16S.faa")
+        print("Usage: " + sys.argv[0] + "<QueryGenome.fna|GenomeDirectory> [QueryGenome2.fna ...] <16SDataBase.fna>\n")
+        print("Examples:" + sys.argv[0] + "QueryGenome.fna RDPActinoBacter16S.fna")
         exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
 
+    parser = argparse.ArgumentParser(description="Uses BLASTn to search for 16S genes within genomes.")
+    parser.add_argument("genomes", nargs="+", help="Query genome FASTA files or directories of them.")
+    parser.add_argument("BLASTDBFile", help="The 16S BLAST database (FASTA file used by makeblastdb).")
+    parser.add_argument("--batch-size", type=int, default=250,
+                        help="Number of genomes sent to each blastn process (default: 250).")
+    parser.add_argument("--coords-only", action="store_true",
+                        help="Only have blastn report hit coordinates and cut the 16S from the genome.")
+    parser.add_argument("--amplicon-first", action="store_true",
+                        help="Try cutting the 27F-1492R amplicon before falling back to blastn.")
+    parser.add_argument("--cache", metavar="CacheDirectory",
+                        help="Reuse (and store) results from a persistent cache in this directory.")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="Size limit of the cache in megabytes (default: 1024).")
+    parser.add_argument("--metrics", metavar="Metrics.jsonl",
+                        help="Append per batch and per genome timing and resource metrics to this JSON lines file.")
+    parser.add_argument("--store", metavar="Results.db",
+                        help="Write results to this SQLite result store instead of the output files.")
+    return parser.parse_args()
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Expands any directories passed on the command line into the genome FASTA files they contain.
+def getGenomeFiles(inputs):
+    genomes = []
+    for item in inputs:
+        if path.isdir(item):
+            for fileName in sorted(listdir(item)):
+                if fileName.endswith(".fna"):
+                    genomes.append(path.join(item, fileName))
+        else:
+            if not item.endswith(".fna"):  # File extension check
+                print("[Warning] " + item + " may not be a nucleic acid fasta file!")
+            genomes.append(item)
+    return genomes
+
 
 # -------------------------------------------------------------------------------------------------
-# 2: Runs BLASTn with settings specific for extracting subject sequences.
-def runBLASTFor16S(query, BLASTDBFile):
-    # Runs BLASTn and saves the output to a string.
+# 3: Writes a batch of genomes to BLASTn's stdin as a single multi-query FASTA. Each contig is renamed
+#    to Q<GenomeIndex>_<ContigIndex> so that BLAST results can be split back out by their source file.
+#    The indexes of genomes that could not be read are added to unreadableGenomes, so that they are reported as
+#    errors rather than as genomes without a 16S.
+def writeQueryBatch(batch, BLASTIn, unreadableGenomes):
+    try:
+        for genomeIndex, genome in batch:
+            contigIndex = 0
+            line = "\n"
+            try:
+                inFile = open(genome, "r")
+            except IOError:
+                print("Failed to open " + genome)
+                unreadableGenomes.add(genomeIndex)
+                continue
+            try:
+                for line in inFile:
+                    if line.startswith(">"):
+                        contigIndex += 1
+                        BLASTIn.write(">Q" + str(genomeIndex) + "_" + str(contigIndex) + "\n")
+                    else:
+                        BLASTIn.write(line)
+            except BrokenPipeError:
+                raise  # BLASTn exited early. This is not the genome's fault, so it is not marked unreadable.
+            except (IOError, ValueError):  # Includes genomes that are not text.
+                print("Failed to read " + genome)
+                unreadableGenomes.add(genomeIndex)
+                line = ""  # Any part of the genome already written is ended so the next genome starts cleanly.
+            finally:
+                inFile.close()
+            if not line.endswith("\n"):
+                BLASTIn.write("\n")
+    finally:
+        BLASTIn.close()
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Runs BLASTn with settings specific for extracting subject sequences. If a set is passed as unreadableGenomes
+#    the indexes of genomes that could not be read are added to it once every row has been read.
+def runBLASTFor16S(batch, BLASTDBFile, coordsOnly=False, unreadableGenomes=None):
+    # Runs BLASTn and yields its output one csv row at a time as it is read from the pipe.
     # Blastn is set to output a csv which can be parsed by Pythons CSV module.
-    BLASTOut = subprocess.check_output(
-        ["blastn", "-db", BLASTDBFile, "-query", query, "-num_threads", str(processors), "-outfmt",
-         "10 qseqid sseqid length qseq evalue bitscore"])
-    return BLASTOut
+    # Query genomes are streamed to BLASTn's stdin from a separate thread so that the batch never has to
+    # be held in memory and BLASTn's output pipe can be drained at the same time.
+    if unreadableGenomes is None:
+        unreadableGenomes = set()
+    if coordsOnly:
+        outputFormat = "10 qseqid sseqid length qstart qend sstrand evalue bitscore"
+    else:
+        outputFormat = "10 qseqid sseqid length qseq evalue bitscore sstrand"
+    # The blastn stage only counts time spent in this generator: waiting for BLASTn's output (timed by
+    # timeIterable, which also counts its bytes) and waiting for BLASTn to exit. Time the caller spends on each row
+    # is not counted.
+    startChildCPU = PipelineMetrics.getChildCPUTime()
+    process = subprocess.Popen(
+        ["blastn", "-db", BLASTDBFile, "-query", "-", "-num_threads", str(processors), "-outfmt", outputFormat],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+    feeder = threading.Thread(target=writeQueryBatch, args=(batch, process.stdin, unreadableGenomes))
+    feeder.start()
+    metrics.addBytes("blastn", bytesIn=sum(path.getsize(genome) for genomeIndex, genome in batch
+                                           if path.isfile(genome)))
+    for row in csv.reader(metrics.timeIterable("blastn", process.stdout)):  # Reads BLAST csv rows as a csv.
+        yield row
+    waitStart = time.time()
+    feeder.join()
+    process.stdout.close()
+    metrics.setExitStatus("blastn", process.wait())
+    metrics.add("blastn", wallSeconds=time.time() - waitStart,
+                childCPUSeconds=PipelineMetrics.getChildCPUTime() - startChildCPU)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, "blastn")
 
 
 # -------------------------------------------------------------------------------------------------
-# 3: Appends genome accession to a file that acts as a list of bad accessions.
+# 5: Appends genome accession to a file that acts as a list of bad accessions (or records it in the --store).
 def appendBadGenomeList(genome):
     global outfile
     badAccession = path.split(genome)[1].strip(".fna")
+    if store:
+        with metrics.stage("writeOutput"):
+            store.add(badAccession, "blast", genome=genome)
+        return
     try:
-        outfile = open("No16SGenomesBLAST.txt", "a")
-        outfile.write(badAccession + "\n")
-        outfile.close()
+        with metrics.stage("writeOutput"):
+            outfile = open("No16SGenomesBLAST.txt", "a")
+            outfile.write(badAccession + "\n")
+            outfile.close()
+        metrics.addBytes("writeOutput", bytesOut=len(badAccession) + 1)
     except IOError:
         print("Failed to open {0}".format(outfile))
         exit(1)
 
 
 # -------------------------------------------------------------------------------------------------
-# 4: Cleans up FASTA formatted sequences.
+# 6: Cleans up FASTA formatted sequences.
 def fastaClean(FASTA):
     FASTAHeader, FASTACode = FASTA.split("\n", 1)  # Splits FASTA's into header and genetic code.
     # Removes alignment markers and converts FASTA file sequence into a single line.
@@ -75,64 +208,223 @@ def fastaClean(FASTA):
     return FASTA
 
 
+# -------------------------------------------------------------------------------------------------
+# 7: Adds a 16S gene to a FASTA file (or to the --store, with its strand, bit score and tier).
+def write16SToFile(FASTA, genome=None, strand=None, score=None):
+    if store:
+        header, sequence = FASTA.split("\n", 1)
+        headerFields = header[1:].split()
+        tiers = [field.split("=", 1)[1] for field in headerFields if field.startswith("tier=")]
+        with metrics.stage("writeOutput"):
+            store.add(headerFields[0], "blast", sequence.replace("\n", ""), strand, score,
+                      (tiers or ["blast"])[0], genome)
+        return
+    try:
+        with metrics.stage("writeOutput"):
+            fileWriter = open("Found16SGenesBLAST.fna", "a")
+            fileWriter.write(FASTA + "\n")
+            fileWriter.close()
+        metrics.addBytes("writeOutput", bytesOut=len(FASTA) + 1)
+    except IOError:
+        print("Error writing " + "Found16SGenesBLAST.fna" + " to file.")
+
+
+# -------------------------------------------------------------------------------------------------
+# 8: Picks the longest 16S sized hit for each genome in a batch as BLAST csv rows stream in. Only the current
+#    best hit of each genome is kept. Returns a dictionary of genome index -> (alignment length, top hit, strand,
+#    bit score) and the set of genome indexes with any hits. The top hit is the aligned query sequence, or in
+#    coordinates-only mode a (contig index, qstart, qend, strand) tuple.
+def getTop16SPerGenome(BLASTRows, coordsOnly=False):
+    Top16SGenes = {}
+    genomesWithHits = set()
+    for row in BLASTRows:
+        qseqid = row[0][1:].split("_", 1)  # Gets the genome and contig indexes back out of the renamed qseqid.
+        genomeIndex = int(qseqid[0])
+        genomesWithHits.add(genomeIndex)
+        Current16SLength = int(row[2])  # Alignment length, which is the length of the (gapped) qseq.
+        # 16S genes are around 1500 B.P. Below filters out partial sequence or really large sequences.
+        if 2000 > Current16SLength > 1000:
+            if Current16SLength > Top16SGenes.get(genomeIndex, (0, None))[0]:
+                if coordsOnly:
+                    Top16SGenes[genomeIndex] = (Current16SLength, (int(qseqid[1]), int(row[3]), int(row[4]), row[5]),
+                                                row[5], float(row[7]))
+                else:
+                    Top16SGenes[genomeIndex] = (Current16SLength, row[3], row[6], float(row[5]))
+    return Top16SGenes, genomesWithHits
+
+
+# -------------------------------------------------------------------------------------------------
+# 9: Cuts a region (1-based and inclusive, as reported by BLAST) out of a contig of a genome FASTA file.
+#    Only the requested region is kept in memory. BLAST reports query coordinates on the plus strand so
+#    the region is returned in the same orientation as the qseq that BLAST would have reported.
+def cutRegionFromGenome(genome, contigIndex, start, end):
+    region = []
+    currentContig = 0
+    position = 0  # Number of bases of the current contig read so far.
+    inFile = open(genome, "r")
+    for line in inFile:
+        if line.startswith(">"):
+            if currentContig == contigIndex:
+                break
+            currentContig += 1
+            position = 0
+        elif currentContig == contigIndex:
+            line = line.strip()
+            lineStart = position
+            position += len(line)
+            if position >= start:
+                region.append(line[max(start - 1 - lineStart, 0):end - lineStart])
+            if position >= end:
+                break
+    inFile.close()
+    return "".join(region)
+
+
+# -------------------------------------------------------------------------------------------------
+# 10: Gets the accession used in the FASTA header of a genome's 16S gene. When running with --amplicon-first
+#     the tier that found the 16S is recorded after the accession.
+def getHeaderAccession(genome, tiered=False):
+    subjectAccession = path.split(genome)[1].strip(".fna")
+    if tiered:
+        subjectAccession += " " + tierTag
+    return subjectAccession
+
+
 # ===========================================================================================================
 # Main program code:
-# House keeping...
-argsCheck()  # Checks if the number of arguments are correct.
-
-queryFile = sys.argv[1]
-print("Opening " + queryFile + "...")
-
-subjectAccession = path.split(queryFile)[1].strip(".fna")
-
-# File extension check
-if not queryFile.endswith(".fna"):
-    print("[Warning] " + queryFile + " may not be a nucleic acid fasta file!")
-
-BLASTDBFile = sys.argv[2]
-print("Opening " + BLASTDBFile + "...")
-print("Blasting " + queryFile + " against " + BLASTDBFile + "...")
-BLASTResults = runBLASTFor16S(queryFile, BLASTDBFile)
-
-if not BLASTResults:  # If there are no BLAST results aborts the program.
-    print("\nUnfortunately there are no 16S BLAST results for " + queryFile + ". Try using another BLAST DB. or")
-    print("you may also want to try another method to find 16S other than BLAST (eg. HMMs).\n")
-    print("Writing genome accession to No16SGenomesBLAST.txt")
-    appendBadGenomeList(queryFile)
-    exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
-
-BLASTCSVOut = BLASTResults.splitlines(True)  # Converts raw BLAST csv output into list of csv rows.
-BLASTreader = csv.reader(BLASTCSVOut)  # Reads BLAST csv rows as a csv.
-
-Found16S = False
-Top16S = ""
-Top16SLength = 0
-for row in BLASTreader:
-    Current16S = row[3]
-    Current16SLength = len(Current16S)
-    # 16S genes are around 1500 B.P. Below filters out partial sequence or really large sequences.
-    if 2000 > Current16SLength > 1000:
-        if Current16SLength > Top16SLength:
-            Found16S = True
-            Top16S = Current16S
-            Top16SLength = Current16SLength
-
-if not Found16S:  # If there are no BLAST that are around the size of 16S rRNA abort the program.
-    print("\nUnfortunately there are no 16S BLAST results for " + queryFile + ". Try using another BLAST DB or")
-    print("you may also want to try another method to find 16S other than BLAST (eg. HMMs).\n")
-    print("Writing genome accession to No16SGenomesBLAST.txt")
-    appendBadGenomeList(queryFile)
-    exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
-
-print("Extracting 16S BLAST Results!")
-FASTA = ">" + subjectAccession + "\n" + Top16S
-FASTA = fastaClean(FASTA)
-
-print("Writing results to file.")
-try:
-    fileWriter = open("Found16SGenesBLAST.fna", "a")
-    fileWriter.write(FASTA + "\n")
-    fileWriter.close()
-except IOError:
-    print("Error writing " + "Found16SGenesBLAST.fna" + " to file.")
-print("Done.\n")
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    genomes = getGenomeFiles(args.genomes)
+    if not genomes:
+        print("No genome FASTA files found in " + ", ".join(args.genomes))
+        exit(1)
+
+    BLASTDBFile = args.BLASTDBFile
+    if args.metrics:
+        try:
+            metrics = PipelineMetrics.MetricsRecorder(args.metrics, "16SBLAST.py")
+        except IOError:
+            print("Failed to open " + args.metrics)
+            exit(1)
+    if args.store:
+        try:
+            store = SixteenSResultStore.ResultStore(args.store)
+        except SixteenSResultStore.StoreError:
+            print("Failed to open " + args.store)
+            exit(1)
+        atexit.register(store.close)  # Writes any buffered results, even if the run is aborted.
+    print("Opening " + BLASTDBFile + "...")
+
+    failedGenomes = 0
+    unreadableCount = 0  # Genomes that could not be read while being sent to BLASTn.
+    indexedGenomes = list(enumerate(genomes))
+
+    if args.amplicon_first:
+        remainingGenomes = []
+        for genomeIndex, queryFile in indexedGenomes:
+            try:
+                with metrics.stage("amplicon"):
+                    amplicon = AmpliconExtract16S.extractAmplicon(queryFile)
+            except IOError:
+                print("Failed to open " + queryFile)
+                exit(1)
+            if amplicon:
+                print("Found a 16S amplicon between the 27F and 1492R primer sites of " + queryFile + ".")
+                write16SToFile(">" + path.split(queryFile)[1].strip(".fna") + " " + AmpliconExtract16S.tierTag + "\n" +
+                               amplicon, queryFile)
+                metrics.emit("genome", genome=queryFile, result="found", tier="amplicon")
+            else:
+                metrics.emit("miss", genome=queryFile, tier="amplicon")
+                remainingGenomes.append((genomeIndex, queryFile))
+        indexedGenomes = remainingGenomes
+
+    cacheKeys = {}
+    if args.cache:
+        if not path.isfile(BLASTDBFile):  # The database's FASTA file is hashed as part of every cache key.
+            print("Failed to open " + BLASTDBFile)
+            exit(1)
+        cache = SixteenSCache.ResultCache(args.cache, args.cache_size * 1024 * 1024)
+        uncachedGenomes = []
+        for genomeIndex, queryFile in indexedGenomes:
+            try:
+                with metrics.stage("cacheLookup"):
+                    cacheKeys[genomeIndex] = cache.makeKey(queryFile, BLASTDBFile, "16SBLAST 1000<length<2000")
+                    cachedResult = cache.get(cacheKeys[genomeIndex])
+            except IOError:
+                print("Failed to open " + queryFile)
+                exit(1)
+            if cachedResult is None:
+                uncachedGenomes.append((genomeIndex, queryFile))
+                metrics.emit("miss", genome=queryFile, tier="cache")
+                continue
+            print("Using cached result for " + queryFile + ".")
+            Found16S, Top16S = cachedResult
+            if Found16S:
+                write16SToFile(">" + getHeaderAccession(queryFile, args.amplicon_first) + "\n" + Top16S, queryFile)
+            else:
+                print("Writing genome accession to No16SGenomesBLAST.txt")
+                appendBadGenomeList(queryFile)
+                failedGenomes += 1
+            metrics.emit("genome", genome=queryFile, result="found" if Found16S else "none", tier="cache")
+        indexedGenomes = uncachedGenomes
+    for batchStart in range(0, len(indexedGenomes), args.batch_size):
+        batch = indexedGenomes[batchStart:batchStart + args.batch_size]
+        for genomeIndex, queryFile in batch:
+            print("Opening " + queryFile + "...")
+        print("Blasting " + str(len(batch)) + " genome(s) against " + BLASTDBFile + "...")
+        unreadableGenomes = set()
+        BLASTRows = runBLASTFor16S(batch, BLASTDBFile, args.coords_only, unreadableGenomes)
+        Top16SGenes, genomesWithHits = getTop16SPerGenome(BLASTRows, args.coords_only)
+        # BLASTn searches the batch as a whole, so its stages are recorded per batch rather than per genome.
+        metrics.emit("batch", genomes=len(batch), genomesWithHits=len(genomesWithHits), found=len(Top16SGenes))
+
+        for genomeIndex, queryFile in batch:
+            if genomeIndex in unreadableGenomes:
+                # Unreadable genomes were not (fully) searched, so they are left out of the results and the cache.
+                print("Skipping " + queryFile + " as it could not be read.")
+                unreadableCount += 1
+                metrics.emit("genome", genome=queryFile, tier="blast", result="error")
+                continue
+            if genomeIndex not in Top16SGenes:
+                # If there are no BLAST results (or none that are around the size of 16S rRNA) for this genome.
+                if genomeIndex not in genomesWithHits:
+                    print("\nUnfortunately there are no 16S BLAST results for " + queryFile + ". Try using another BLAST DB. or")
+                else:
+                    print("\nUnfortunately there are no 16S BLAST results for " + queryFile + ". Try using another BLAST DB or")
+                print("you may also want to try another method to find 16S other than BLAST (eg. HMMs).\n")
+                print("Writing genome accession to No16SGenomesBLAST.txt")
+                appendBadGenomeList(queryFile)
+                failedGenomes += 1
+                if args.cache:
+                    cache.put(cacheKeys[genomeIndex], None)
+                metrics.emit("genome", genome=queryFile, tier="blast",
+                             result="partial" if genomeIndex in genomesWithHits else "none")
+                continue
+
+            print("Extracting 16S BLAST Results for " + queryFile + "!")
+            subjectAccession = getHeaderAccession(queryFile, args.amplicon_first)
+            Top16SLength, Top16S, strand, score = Top16SGenes[genomeIndex]
+            if args.coords_only:
+                contigIndex, start, end, strand = Top16S
+                with metrics.stage("cutRegion"):
+                    Top16S = cutRegionFromGenome(queryFile, contigIndex, start, end)
+            FASTA = ">" + subjectAccession + "\n" + Top16S
+            FASTA = fastaClean(FASTA)
+
+            print("Writing results to file.")
+            write16SToFile(FASTA, queryFile, strand, score)
+            if args.cache:
+                cache.put(cacheKeys[genomeIndex], FASTA.split("\n", 1)[1])
+            metrics.emit("genome", genome=queryFile, result="found", tier="blast")
+
+    if args.cache:
+        cache.report()
+    metrics.close()
+    if unreadableCount:
+        print(str(unreadableCount) + " genome(s) could not be read.")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+    if len(genomes) == 1 and failedGenomes:
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+    print("Done.\n")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: Builds nucleotide BLAST databases for 16SBLAST.py from FASTA files, only rebuilding what changed.
+#              The size, modification time and content hash of each database's source FASTA files are recorded
+#              in a manifest. A database is only rebuilt when its sources have changed (a changed size or
+#              modification time triggers a rehash, so touched but unchanged files are not rebuilt), when its
+#              makeblastdb settings have changed or when its files are missing. Databases are built in parallel
+#              with up to --cpus makeblastdb processes at once. With --merge the FASTA files are combined into one
+#              FASTA file (sequences with an ID already seen are skipped) and a single database is built from
+#              it, which is faster to search than many small ones. As with makeNABlastDB.sh, each database is
+#              named after the FASTA file it is built from, which 16SBLAST.py needs to stay beside it.
+#
+# Requirements: - This script requires BLAST+ 2.2.9 or later.
+#
+# Usage: BlastDBManager.py [--cpus N] [--merge <Merged.fna>] [--manifest <Manifest.json>] [--force] [--dry-run]
+#                          <References.fna|ReferenceDirectory> [References2.fna ...]
+# Example: BlastDBManager.py ./Example16DB/RDPActinoBacteria16S.fna
+# Example: BlastDBManager.py --cpus 8 ./References/
+# Example: BlastDBManager.py --merge All16S.fna ./References/
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports & Setup:
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from os import path
+
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "..", "SupplementaryScripts"))
+import SixteenSCache
+
+defaultManifest = "BlastDBManifest.json"
+FASTAExtensions = (".fna", ".fa", ".fasta")
+makeBlastDBOptions = ["-input_type", "fasta", "-dbtype", "nucl", "-parse_seqids"]  # Same as makeNABlastDB.sh.
+indexExtensions = [".nin", ".nal"]  # A single volume database has a .nin file, a multi-volume one a .nal file.
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Checks if in proper number of arguments are passed gives instructions on proper use.
+def argsCheck():
+    if len(sys.argv) < 2:
+        print("BLAST Database Manager")
+        print("By Lee Bergstrand\n")
+        print("Please refer to source code for documentation\n")
+        print("Usage: " + sys.argv[0] + " [--cpus N] [--merge <Merged.fna>] <References.fna|ReferenceDirectory>"
+                                        " [References2.fna ...]")
+        print("Examples: " + sys.argv[0] + " ./Example16DB/RDPActinoBacteria16S.fna\n")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+
+    parser = argparse.ArgumentParser(description="Builds BLAST databases, only rebuilding those that changed.")
+    parser.add_argument("references", nargs="+", help="Reference FASTA files or directories of them.")
+    parser.add_argument("--cpus", type=int, default=0,
+                        help="Most makeblastdb processes run at once (default: 0, all cores).")
+    parser.add_argument("--merge", metavar="Merged.fna",
+                        help="Combine the references into this FASTA file and build a single database from it.")
+    parser.add_argument("--manifest", metavar="Manifest.json", default=defaultManifest,
+                        help="The manifest of source fingerprints (default: " + defaultManifest + ").")
+    parser.add_argument("--force", action="store_true", help="Rebuild every database, changed or not.")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the databases that would be built.")
+    return parser.parse_args()
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Expands any directories passed on the command line into the FASTA files they contain.
+def getReferenceFiles(inputs):
+    references = []
+    for item in inputs:
+        if path.isdir(item):
+            for fileName in sorted(os.listdir(item)):
+                if fileName.endswith(FASTAExtensions):
+                    references.append(path.join(item, fileName))
+        else:
+            if not item.endswith(FASTAExtensions):  # File extension check
+                print("[Warning] " + item + " may not be a nucleic acid fasta file!")
+            references.append(item)
+    return references
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: Loads the manifest. Returns a dictionary of database path -> {"sources": {source path: fingerprint},
+#    "command": makeblastdb options, "built": build time}. A missing manifest is empty.
+def loadManifest(manifestFile):
+    if not path.isfile(manifestFile):
+        return {}
+    manifestHandle = open(manifestFile, "r")
+    manifest = json.load(manifestHandle)
+    manifestHandle.close()
+    return manifest.get("databases", {})
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Writes the manifest to a temporary file and renames it into place, so it is never left half written.
+def saveManifest(manifestFile, databases):
+    manifestDirectory = path.dirname(path.abspath(manifestFile))
+    tempHandle, tempPath = tempfile.mkstemp(dir=manifestDirectory, suffix=".tmp")
+    with os.fdopen(tempHandle, "w") as manifestHandle:
+        json.dump({"databases": databases}, manifestHandle, indent=1, sort_keys=True)
+    os.rename(tempPath, manifestFile)
+
+
+# -------------------------------------------------------------------------------------------------
+# 5: Gets a file's fingerprint (size, modification time and content hash). The file is only rehashed if its size
+#    or modification time differ from its previous fingerprint.
+def getFingerprint(filePath, previous=None):
+    fileStat = os.stat(filePath)
+    fingerprint = {"size": fileStat.st_size, "mtime": fileStat.st_mtime}
+    if previous and previous["size"] == fingerprint["size"] and previous["mtime"] == fingerprint["mtime"]:
+        fingerprint["sha256"] = previous["sha256"]
+    else:
+        fingerprint["sha256"] = SixteenSCache.hashFile(filePath)
+    return fingerprint
+
+
+# -------------------------------------------------------------------------------------------------
+# 6: Checks whether a database needs (re)building. Returns the reason it does, or None if it is up to date.
+def getRebuildReason(database, fingerprints, entry):
+    if entry is None:
+        return "new"
+    if not any(path.isfile(database + extension) for extension in indexExtensions):
+        return "database files missing"
+    if entry["command"] != makeBlastDBOptions:
+        return "makeblastdb settings changed"
+    if set(entry["sources"]) != set(fingerprints):
+        return "sources changed"
+    for source, fingerprint in fingerprints.items():
+        if entry["sources"][source]["sha256"] != fingerprint["sha256"]:
+            return path.basename(source) + " changed"
+    return None
+
+
+# -------------------------------------------------------------------------------------------------
+# 7: Combines FASTA files into one. Sequences with an ID already written are skipped, as makeblastdb
+#    -parse_seqids rejects duplicate IDs. The merged file is written to a temporary file and renamed into
+#    place. Returns (sequences written, duplicates skipped).
+def mergeFastaFiles(references, mergedFile):
+    seenIDs = set()
+    written = 0
+    skipped = 0
+    tempHandle, tempPath = tempfile.mkstemp(dir=path.dirname(path.abspath(mergedFile)), suffix=".tmp")
+    with os.fdopen(tempHandle, "w") as outFile:
+        for reference in references:
+            keep = False
+            inFile = open(reference, "r")
+            for line in inFile:
+                if line.startswith(">"):
+                    sequenceID = (line[1:].split(None, 1) or [""])[0]
+                    keep = sequenceID not in seenIDs
+                    if keep:
+                        seenIDs.add(sequenceID)
+                        written += 1
+                    else:
+                        skipped += 1
+                if keep:
+                    outFile.write(line if line.endswith("\n") else line + "\n")
+            inFile.close()
+    os.rename(tempPath, mergedFile)
+    return written, skipped
+
+
+# -------------------------------------------------------------------------------------------------
+# 8: Builds one BLAST database with makeblastdb. Runs in a thread of the build pool.
+#    Returns (database, error message or None, seconds taken).
+def buildDatabase(database):
+    startTime = time.time()
+    process = subprocess.Popen(["makeblastdb", "-in", database] + makeBlastDBOptions,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        return database, output.strip() or "makeblastdb exited with status " + str(process.returncode), 0
+    return database, None, time.time() - startTime
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    references = getReferenceFiles(args.references)
+    if not references:
+        print("No reference FASTA files found in " + ", ".join(args.references))
+        exit(1)
+
+    try:
+        databases = loadManifest(args.manifest)
+    except (IOError, ValueError):
+        print("Failed to read " + args.manifest)
+        exit(1)
+
+    # Each database is keyed on the absolute path of its FASTA file, with its own source files.
+    if args.merge:
+        plannedDatabases = {path.abspath(args.merge): [path.abspath(reference) for reference in references
+                                                       if path.abspath(reference) != path.abspath(args.merge)]}
+    else:
+        plannedDatabases = dict((path.abspath(reference), [path.abspath(reference)]) for reference in references)
+
+    toBuild = []
+    sourceFingerprints = {}
+    for database, sources in sorted(plannedDatabases.items()):
+        entry = databases.get(database)
+        try:
+            previous = entry["sources"] if entry else {}
+            sourceFingerprints[database] = dict((source, getFingerprint(source, previous.get(source)))
+                                                for source in sources)
+        except (IOError, OSError):
+            print("Failed to open a source of " + database)
+            exit(1)
+        reason = "forced" if args.force else getRebuildReason(database, sourceFingerprints[database], entry)
+        if reason:
+            print("Building " + database + " (" + reason + ").")
+            toBuild.append(database)
+        else:
+            print(database + " is up to date.")
+            # Records new modification times of touched but unchanged sources, so they are not rehashed next time.
+            databases[database]["sources"] = sourceFingerprints[database]
+
+    if args.dry_run or not toBuild:
+        if not args.dry_run:
+            saveManifest(args.manifest, databases)
+        print(str(len(toBuild)) + " database(s) to build.")
+        exit(0)
+
+    if args.merge:
+        print("Merging " + str(len(references)) + " FASTA file(s) into " + args.merge + "...")
+        try:
+            written, skipped = mergeFastaFiles(plannedDatabases[toBuild[0]], args.merge)
+        except IOError:
+            print("Failed to merge the references into " + args.merge)
+            exit(1)
+        print(str(written) + " sequence(s) merged, " + str(skipped) + " with duplicate IDs skipped.")
+
+    cpus = args.cpus if args.cpus > 0 else cpu_count()
+    pool = ThreadPool(min(cpus, len(toBuild)))  # Each thread waits on one makeblastdb process.
+    failedBuilds = 0
+    startTime = time.time()
+    for database, error, seconds in pool.imap_unordered(buildDatabase, toBuild):
+        if error:
+            print("Failed to build " + database + ":\n" + error)
+            databases.pop(database, None)
+            failedBuilds += 1
+            continue
+        print("Built " + database + " in " + "{0:.1f}".format(seconds) + " seconds.")
+        databases[database] = {"sources": sourceFingerprints[database], "command": makeBlastDBOptions,
+                               "built": time.time()}
+        saveManifest(args.manifest, databases)  # Saved after every build, so finished builds survive an interrupt.
+    pool.close()
+    pool.join()
+    if failedBuilds:
+        saveManifest(args.manifest, databases)
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+    print("All databases built in " + "{0:.1f}".format(time.time() - startTime) + " seconds.\n")
@@ -1,10 +1,8 @@
 #!/usr/bin/env bash
 # A simple script for the batch creation of blast databases from a directory with fasta files.
+# Databases are built by BlastDBManager.py, which builds them in parallel and skips any whose fasta file is unchanged.
 
-for fasta;
-do
-	echo Makeing blast database for ${fasta}
-	makeblastdb -in ${fasta} -input_type fasta -dbtype nucl -parse_seqids;
-done
+echo Making blast databases for $# fasta file\(s\)
+python "$(dirname "$0")/BlastDBManager.py" "$@" || exit 1
 echo All databases created.
 exit 0
@@ -1,11 +1,9 @@
 #!/usr/bin/env bash
 # A simple script for the batch creation of blast databases from a directory with fasta files.
+# All genomes are passed to a single 16SBLAST.py run so that they are BLASTed together in batches.
 
-for fasta;
-do
-	echo Running blast on ${fasta}
-	python 16SBLAST.py ${fasta} ./Example16DB/RDPActinoBacteria16S.fna
-	done
+echo Running blast on $# genome file\(s\)
+python 16SBLAST.py "$@" ./Example16DB/RDPActinoBacteria16S.fna
 echo All files BLASTed.
 exit 0
 
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: A reproducible benchmark for the 16S extraction scripts. Synthetic genomes of configurable
+#              size and contig count are generated from a fixed seed, with copies of 16S genes from
+#              Example16DB/RDPActinoBacteria16S.fna planted on either strand. Each stage (16SBLAST.py, 16SHMMER.py
+#              and AmpliconExtract16S.py in their different modes) is then run on every genome size, and its wall
+#              time, peak RSS and throughput are reported along with how many of the planted 16S genes it found.
+#              By default the deterministic blastn and hmmsearch stand-ins in StandIns/ are used, so only the
+#              scripts' own overhead is measured. With --tools real (or auto) the real binaries are used.
+#
+# Requirements: - BLAST+ and HMMER 3.0 or later when running with --tools real.
+#
+# Usage: Benchmark16S.py [--sizes MB [MB ...]] [--genomes N] [--contigs N] [--copies N] [--stages STAGE [...]]
+#                        [--tools standin|real|auto] [--repeat N] [--seed N] [--work-dir DIR] [--output Results.tsv]
+# Example: Benchmark16S.py
+# Example: Benchmark16S.py --sizes 1 5 10 --genomes 4 --stages blast hmmer --output Results.tsv
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports & Setup:
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from os import path
+
+benchmarkDirectory = path.dirname(path.abspath(__file__))
+repositoryDirectory = path.dirname(benchmarkDirectory)
+standInDirectory = path.join(benchmarkDirectory, "StandIns")
+sys.path.insert(0, standInDirectory)
+import StandInSearch
+
+referenceFile = path.join(repositoryDirectory, "BLASTToFind16S", "Example16DB", "RDPActinoBacteria16S.fna")
+HMMFile = path.join(repositoryDirectory, "HMMToFind16S", "16S.hmm")
+bases = "ACGT"
+byteToBases = ["".join(bases[(byte >> shift) & 3] for shift in (6, 4, 2, 0)) for byte in range(256)]
+
+# Stage name -> (script, extra arguments, reference type, tool needed, output FASTA file).
+stages = {
+    "blast": (path.join("BLASTToFind16S", "16SBLAST.py"), [], "blastdb", "blastn", "Found16SGenesBLAST.fna"),
+    "blast-coords": (path.join("BLASTToFind16S", "16SBLAST.py"), ["--coords-only"], "blastdb", "blastn",
+                     "Found16SGenesBLAST.fna"),
+    "hmmer": (path.join("HMMToFind16S", "16SHMMER.py"), [], "hmm", "hmmsearch", "Found16SGenesHMM.fna"),
+    "hmmer-single-pass": (path.join("HMMToFind16S", "16SHMMER.py"), ["--single-pass"], "hmm", "hmmsearch",
+                          "Found16SGenesHMM.fna"),
+    "amplicon": (path.join("PrimersToFind16S", "AmpliconExtract16S.py"), [], None, None,
+                 "Found16SGenesAmplicon.fna"),
+}
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Parses the command line arguments.
+def argsCheck():
+    parser = argparse.ArgumentParser(description="Benchmarks the 16S extraction scripts on synthetic genomes.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1.0, 5.0],
+                        help="Genome sizes to benchmark, in megabases (default: 1 5).")
+    parser.add_argument("--genomes", type=int, default=2, help="Genomes generated per size (default: 2).")
+    parser.add_argument("--contigs", type=int, default=10, help="Contigs per genome (default: 10).")
+    parser.add_argument("--copies", type=int, default=2, help="16S genes planted per genome (default: 2).")
+    parser.add_argument("--stages", nargs="+", choices=sorted(stages), default=["blast", "hmmer"],
+                        help="Stages to benchmark (default: blast hmmer).")
+    parser.add_argument("--tools", choices=["standin", "real", "auto"], default="standin",
+                        help="Use the stand-in blastn and hmmsearch, the real ones, or the real ones when they "
+                             "are installed (default: standin).")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Times each stage is run. The median wall time is reported (default: 1).")
+    parser.add_argument("--seed", type=int, default=16, help="Seed for genome generation (default: 16).")
+    parser.add_argument("--work-dir", help="Directory for genomes and run output (default: a temporary directory "
+                                           "which is removed afterwards).")
+    parser.add_argument("--output", metavar="Results.tsv", help="Also write the results as TSV.")
+    return parser.parse_args()
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Generates a random DNA sequence from a seeded random number generator.
+def getRandomDNA(rng, length):
+    byteCount = (length + 3) // 4
+    randomBytes = bytearray(rng.getrandbits(8 * byteCount).to_bytes(byteCount, "little")) if byteCount else b""
+    return "".join([byteToBases[byte] for byte in randomBytes])[:length]
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: Writes a synthetic genome with copies of reference 16S genes planted at random positions on either strand.
+#    Returns the number of 16S genes planted.
+def writeSyntheticGenome(genomeFile, rng, size, contigCount, copies, references):
+    contigLengths = [size // contigCount] * contigCount
+    for i in range(size % contigCount):
+        contigLengths[i] += 1
+    contigs = [list(getRandomDNA(rng, length)) for length in contigLengths]
+
+    planted = 0
+    for i in range(copies):
+        name, forward, reverse = rng.choice(references)
+        sequence = forward if rng.random() < 0.5 else reverse
+        contig = contigs[rng.randrange(contigCount)]
+        if len(contig) <= len(sequence):
+            continue  # Contig too small to hold a 16S gene.
+        # A copy may overwrite part of an earlier one, but the last copy planted is always intact.
+        start = rng.randrange(len(contig) - len(sequence))
+        contig[start:start + len(sequence)] = sequence
+        planted += 1
+
+    outFile = open(genomeFile, "w")
+    for index, contig in enumerate(contigs):
+        outFile.write(">contig" + str(index + 1) + "\n")
+        contig = "".join(contig)
+        outFile.write("".join(contig[i:i + 80] + "\n" for i in range(0, len(contig), 80)))
+    outFile.close()
+    return planted
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Generates the synthetic genomes for one genome size. Returns (genome files, genomes with a 16S planted).
+def generateGenomes(genomeDirectory, size, genomeCount, contigCount, copies, seed, references):
+    if not path.isdir(genomeDirectory):
+        os.makedirs(genomeDirectory)
+    rng = random.Random(seed * 1000003 + size)
+    genomeFiles = []
+    genomesWith16S = 0
+    for index in range(genomeCount):
+        genomeFile = path.join(genomeDirectory, "Synthetic" + str(size) + "_" + str(index + 1) + ".fna")
+        if writeSyntheticGenome(genomeFile, rng, size, contigCount, copies, references):
+            genomesWith16S += 1
+        genomeFiles.append(genomeFile)
+    return genomeFiles, genomesWith16S
+
+
+# -------------------------------------------------------------------------------------------------
+# 5: Decides whether the stand-ins or the real tools are used. Returns the PATH to run the scripts with.
+def getToolPath(toolMode, stageNames):
+    neededTools = set(stages[stage][3] for stage in stageNames if stages[stage][3])
+    if "blastn" in neededTools:
+        neededTools.add("makeblastdb")
+    installed = all(shutil.which(tool) for tool in neededTools)
+    if toolMode == "real" and not installed:
+        print("[Error] --tools real needs " + ", ".join(sorted(neededTools)) + " on the PATH.")
+        exit(1)
+    if toolMode == "standin" or (toolMode == "auto" and not installed):
+        return "standin", standInDirectory + os.pathsep + os.environ.get("PATH", "")
+    return "real", os.environ.get("PATH", "")
+
+
+# -------------------------------------------------------------------------------------------------
+# 6: Gets the BLAST database to search. The reference FASTA is copied into the work directory, and when real
+#    BLAST is used a database is built next to it (the stand-in blastn reads the FASTA directly).
+def prepareBLASTDatabase(workDirectory, tools):
+    databaseDirectory = path.join(workDirectory, "BLASTDB")
+    if not path.isdir(databaseDirectory):
+        os.makedirs(databaseDirectory)
+    database = path.join(databaseDirectory, path.basename(referenceFile))
+    shutil.copyfile(referenceFile, database)
+    if tools == "real":
+        subprocess.check_call(["makeblastdb", "-in", database, "-dbtype", "nucl", "-out", database],
+                              stdout=open(os.devnull, "w"))
+    return database
+
+
+# -------------------------------------------------------------------------------------------------
+# 7: Runs a command and waits for it with wait4 so its resource usage can be read. Returns (exit code,
+#    wall time in seconds, peak RSS in megabytes). The peak RSS is of the largest process in the run,
+#    which includes blastn or hmmsearch as they are waited on by the script.
+def runMeasured(command, runDirectory, environment):
+    logFile = open(path.join(runDirectory, "run.log"), "w")
+    startTime = time.time()
+    process = subprocess.Popen(command, cwd=runDirectory, env=environment, stdout=logFile,
+                               stderr=subprocess.STDOUT)
+    pid, status, usage = os.wait4(process.pid, 0)
+    wallTime = time.time() - startTime
+    process.returncode = os.waitstatus_to_exitcode(status)
+    logFile.close()
+    return process.returncode, wallTime, usage.ru_maxrss / 1024.0  # ru_maxrss is in kilobytes on Linux.
+
+
+# -------------------------------------------------------------------------------------------------
+# 8: Counts the records in a FASTA file.
+def countFastaRecords(FASTAFile):
+    if not path.exists(FASTAFile):
+        return 0
+    inFile = open(FASTAFile, "r")
+    recordCount = sum(1 for line in inFile if line.startswith(">"))
+    inFile.close()
+    return recordCount
+
+
+# -------------------------------------------------------------------------------------------------
+# 9: Runs one stage over a set of genomes. Returns the result as a dictionary.
+def benchmarkStage(stage, genomeFiles, workDirectory, database, environment, repeat):
+    script, extraArguments, referenceType, tool, foundFile = stages[stage]
+    command = [sys.executable, path.join(repositoryDirectory, script)] + extraArguments + genomeFiles
+    if referenceType == "blastdb":
+        command.append(database)
+    elif referenceType == "hmm":
+        command.append(HMMFile)
+
+    wallTimes = []
+    peakRSS = 0.0
+    exitCode = 0
+    found = 0
+    for run in range(repeat):
+        runDirectory = tempfile.mkdtemp(prefix=stage + "_", dir=workDirectory)
+        runExitCode, wallTime, runPeakRSS = runMeasured(command, runDirectory, environment)
+        exitCode = exitCode or runExitCode
+        wallTimes.append(wallTime)
+        peakRSS = max(peakRSS, runPeakRSS)
+        found = countFastaRecords(path.join(runDirectory, foundFile))
+    wallTimes.sort()
+    return {"wallTime": wallTimes[len(wallTimes) // 2], "peakRSS": peakRSS, "exitCode": exitCode, "found": found}
+
+
+# -------------------------------------------------------------------------------------------------
+# 10: Formats results as rows of a table.
+def getResultRows(results):
+    header = ["Stage", "Tools", "GenomeMb", "Genomes", "Contigs", "WallSeconds", "PeakRSSMb", "MbPerSecond",
+              "GenomesPerSecond", "Found16S", "Expected16S", "ExitCode"]
+    rows = [header]
+    for result in results:
+        wallTime = max(result["wallTime"], 1e-9)
+        rows.append([result["stage"], result["tools"], "{0:g}".format(result["size"]), str(result["genomes"]),
+                     str(result["contigs"]), "{0:.2f}".format(result["wallTime"]),
+                     "{0:.1f}".format(result["peakRSS"]),
+                     "{0:.2f}".format(result["size"] * result["genomes"] / wallTime),
+                     "{0:.2f}".format(result["genomes"] / wallTime), str(result["found"]),
+                     str(result["expected"]), str(result["exitCode"])])
+    return rows
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()
+
+    tools, toolPath = getToolPath(args.tools, args.stages)
+    environment = dict(os.environ)
+    environment["PATH"] = toolPath
+    environment[StandInSearch.referenceVariable] = referenceFile
+    print(">> Using " + ("the blastn and hmmsearch stand-ins." if tools == "standin" else "the real tools."))
+
+    references = StandInSearch.loadReferences(referenceFile)
+    workDirectory = args.work_dir or tempfile.mkdtemp(prefix="Benchmark16S_")
+    if not path.isdir(workDirectory):
+        os.makedirs(workDirectory)
+    workDirectory = path.abspath(workDirectory)
+
+    results = []
+    try:
+        database = None
+        if any(stages[stage][2] == "blastdb" for stage in args.stages):
+            database = prepareBLASTDatabase(workDirectory, tools)
+
+        for sizeMb in args.sizes:
+            size = int(sizeMb * 1000000)
+            print(">> Generating " + str(args.genomes) + " genome(s) of " + "{0:g}".format(sizeMb) + " Mb...")
+            startTime = time.time()
+            genomeFiles, expected = generateGenomes(path.join(workDirectory, "Genomes" + str(size)), size,
+                                                   args.genomes, args.contigs, args.copies, args.seed, references)
+            print("   Generated in " + "{0:.2f}".format(time.time() - startTime) + " s.")
+            for stage in args.stages:
+                print(">> Running " + stage + " on " + "{0:g}".format(sizeMb) + " Mb genomes...")
+                result = benchmarkStage(stage, genomeFiles, workDirectory, database, environment, args.repeat)
+                result.update({"stage": stage, "tools": tools, "size": sizeMb, "genomes": len(genomeFiles),
+                               "contigs": args.contigs, "expected": expected})
+                if result["exitCode"] != 0:
+                    print("[Warning] " + stage + " exited with code " + str(result["exitCode"]) + ".")
+                results.append(result)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(workDirectory, ignore_errors=True)
+
+    rows = getResultRows(results)
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    print("")
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+    if args.output:
+        try:
+            outFile = open(args.output, "w")
+            for row in rows:
+                outFile.write("\t".join(row) + "\n")
+            outFile.close()
+        except IOError:
+            print("Failed to open " + args.output)
+            exit(1)
+    print(">> Done.")
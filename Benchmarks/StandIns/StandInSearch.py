@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: Shared code for the deterministic blastn and hmmsearch stand-ins used by Benchmark16S.py.
+#              Rather than aligning, the stand-ins look for exact copies of the reference 16S genes that
+#              Benchmark16S.py plants in its synthetic genomes, and report them in the same formats as the real
+#              tools (BLAST csv and Stockholm). This isolates the time spent in the extraction scripts themselves
+#              from the time spent in BLAST or HMMER. The blastn stand-in reads the references from the FASTA file
+#              given as its database. The hmmsearch stand-in reads them from the file named by the
+#              BENCHMARK_16S_REFERENCE environment variable, as it is only given an HMM.
+#
+# Requirements: - None beyond the Python standard library.
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports:
+import csv
+import os
+import sys
+
+referenceVariable = "BENCHMARK_16S_REFERENCE"  # Environment variable naming the hmmsearch stand-in's references.
+complementTable = str.maketrans("ACGTURYKMBVDHSWN", "TGCAAYRMKVBHDSWN")
+stockholmWidth = 200  # Alignment columns per Stockholm block.
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Reads a FASTA file one record at a time, yielding (sequence ID, upper case sequence) tuples.
+def readFastaRecords(handle):
+    name = None
+    sequence = []
+    for line in handle:
+        line = line.strip()
+        if line.startswith(">"):
+            if name is not None:
+                yield name, "".join(sequence).upper()
+            name = (line[1:].split() or [""])[0]
+            sequence = []
+        elif line:
+            sequence.append(line)
+    if name is not None:
+        yield name, "".join(sequence).upper()
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Loads the reference 16S genes. Returns a list of (reference ID, forward sequence, reverse complement).
+def loadReferences(referenceFile):
+    inFile = open(referenceFile, "r")
+    references = [(name, sequence, sequence.translate(complementTable)[::-1])
+                  for name, sequence in readFastaRecords(inFile)]
+    inFile.close()
+    return references
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: Finds every exact copy of a reference in a sequence. Returns (reference ID, strand, start, end) tuples with
+#    0-based half open coordinates on the sequence.
+def findReferenceCopies(sequence, references, bothStrands=True):
+    hits = []
+    for name, forward, reverse in references:
+        probes = [("plus", forward), ("minus", reverse)] if bothStrands else [("plus", forward)]
+        for strand, probe in probes:
+            start = sequence.find(probe)
+            while start >= 0:
+                hits.append((name, strand, start, start + len(probe)))
+                start = sequence.find(probe, start + 1)
+    return hits
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Gets the value of a command line option, or a default if it was not given.
+def getOption(arguments, option, default=None):
+    if option in arguments:
+        return arguments[arguments.index(option) + 1]
+    return default
+
+
+# -------------------------------------------------------------------------------------------------
+# 5: Opens a query or target file, where "-" is stdin.
+def openSequences(sequenceFile):
+    if sequenceFile == "-":
+        return sys.stdin
+    return open(sequenceFile, "r")
+
+
+# -------------------------------------------------------------------------------------------------
+# 6: Stand-in for blastn. Supports -db (a FASTA file), -query and -outfmt 10 (csv) with the qseqid, sseqid,
+#    pident, length, qseq, qstart, qend, sstart, send, sstrand, evalue and bitscore fields.
+def runBlastn(arguments):
+    references = loadReferences(getOption(arguments, "-db"))
+    fields = getOption(arguments, "-outfmt", "10 qseqid sseqid length evalue bitscore").split()[1:]
+    handle = openSequences(getOption(arguments, "-query", "-"))
+    writer = csv.writer(sys.stdout, lineterminator="\n")
+    for contig, sequence in readFastaRecords(handle):
+        for name, strand, start, end in findReferenceCopies(sequence, references):
+            length = end - start
+            values = {"qseqid": contig, "sseqid": name, "pident": "100.000", "length": length,
+                      "qseq": sequence[start:end], "qstart": start + 1, "qend": end,
+                      "sstart": 1 if strand == "plus" else length, "send": length if strand == "plus" else 1,
+                      "sstrand": strand, "evalue": "0.0", "bitscore": int(length * 1.85)}
+            writer.writerow([values.get(field, "") for field in fields])
+    handle.close()
+    return 0
+
+
+# -------------------------------------------------------------------------------------------------
+# 7: Stand-in for hmmsearch. Supports -o, -A, --acc and --cpu followed by the HMM and target file. Like the
+#    real hmmsearch on a nucleotide HMM, only the strand given is searched. Hits are written as an RNA alignment.
+def runHMMSearch(arguments):
+    references = loadReferences(os.environ[referenceVariable])
+    handle = openSequences(arguments[-1])
+    hits = []
+    for contig, sequence in readFastaRecords(handle):
+        # Like HMMER, overlapping matches (from references contained in other references) are reported once,
+        # as the longest of them.
+        regions = []
+        for name, strand, start, end in sorted(findReferenceCopies(sequence, references, bothStrands=False),
+                                               key=lambda hit: (hit[2], hit[2] - hit[3])):
+            if regions and start < regions[-1][1]:
+                if end - start > regions[-1][1] - regions[-1][0]:
+                    regions[-1] = (start, end)
+            else:
+                regions.append((start, end))
+        for start, end in regions:
+            hits.append((contig + "/" + str(start + 1) + "-" + str(end), sequence[start:end].replace("T", "U")))
+    handle.close()
+
+    summary = str(len(hits)) + " hit(s) from the hmmsearch stand-in.\n"
+    outputFile = getOption(arguments, "-o")
+    if outputFile:
+        writer = open(outputFile, "w")
+        writer.write(summary)
+        writer.close()
+    else:
+        sys.stdout.write(summary)
+
+    alignmentFile = getOption(arguments, "-A")
+    if alignmentFile and hits:
+        width = max(len(hit[0]) for hit in hits) + 2
+        length = max(len(hit[1]) for hit in hits)
+        writer = open(alignmentFile, "w")
+        writer.write("# STOCKHOLM 1.0\n\n")
+        for blockStart in range(0, length, stockholmWidth):
+            for name, sequence in hits:
+                block = sequence.ljust(length, "-")[blockStart:blockStart + stockholmWidth]
+                writer.write(name.ljust(width) + block + "\n")
+            writer.write("\n")
+        writer.write("//\n")
+        writer.close()
+    return 0
@@ -1,26 +1,78 @@
 #!/usr/bin/env python 
 # Created by: Lee Bergstrand
 # Description: A simple python program that uses HMMER to search for 16S genes within a genome. Checks
-# 			both the forward and reverse strand DNA strand of the genome.          
+# 			both the forward and reverse strand DNA strand of the genome. With --single-pass both strands
+#             are searched together by a single hmmsearch run instead of two back to back runs. The genome
+#             is streamed to hmmsearch record by record so only one contig is held in memory at a time.
+#             Each hmmsearch run writes its alignment to its own pipe, so several copies of this script can
+#             safely run at once from the same working directory. Several genomes can be searched in one run
+#             and with --cache results are reused for genomes that have already been searched. With
+#             --amplicon-first the 27F-1492R amplicon is cut directly from genomes that have both primer sites
+#             and only the rest are searched with HMMER. Headers then record the tier that found each 16S.
+#             With --seed-reference a k-mer index of known 16S genes is used to find candidate loci and only
+#             windows around them (on the matching strand) are searched, falling back to the whole genome
+#             when no seeds are found. Genomes packed into .2bit stores by TwoBitGenomeStore.py can be
+#             searched directly, in which case contigs are decoded from the memory-mapped store chunk by chunk.
+#             With --metrics the time, CPU, bytes and memory used by each stage are logged as JSON lines.
+#             With --store results (with the strand of each 16S) go to an SQLite store made by
+#             SixteenSResultStore.py instead of the Found16SGenesHMM.fna and No16SGenomesHMM.txt files.
+#             With --gyrb-hmm each genome is also searched for Gyrase B in the same pass: every contig is read
+#             once and passed both to the 16S hmmsearch (on both strands) and, translated in all six reading
+#             frames, to a Gyrase B hmmsearch running alongside it. The best Gyrase B hit of each genome is
+#             picked as for 16S and written to FoundGyrBGenesHMM.faa (or NoGyrBGenomesHMM.txt).
+#             Each hmmsearch run uses every core unless --cpus is given. To search many genomes at once within a
+#             budget of cores use HMMBatchScheduler.py.
 #
-# Requirements: - This program requires the Biopython module: http://biopython.org/wiki/Download
-#               - This script requires HMMER 3.0 or later.
+# Requirements: - This script requires HMMER 3.0 or later.
 #  
-# Usage: BackBLAST.py <Querygenome.faa> <16S.hmm>
-# Example: BackBLAST.py <Querygenome.faa> AUUJ00000000.faa
+# Usage: 16SHMMER.py [--single-pass] [--amplicon-first] [--cache <CacheDirectory>] [--seed-reference <16S.fna>]
+#                   [--store <Results.db>] [--gyrb-hmm <GyraseB.hmm>] [--cpus N]
+#                   <Querygenome.fna> [Querygenome2.fna ...] <16S.hmm>
+# Example: 16SHMMER.py AUUJ00000000.fna 16S.hmm
+# Example: 16SHMMER.py --cache ./16SCache *.fna 16S.hmm
+# Example: 16SHMMER.py AUUJ00000000.2bit 16S.hmm
+# Example: 16SHMMER.py --metrics 16SHMMERMetrics.jsonl *.fna 16S.hmm
+# Example: 16SHMMER.py --store 16SResults.db *.fna 16S.hmm
+# Example: 16SHMMER.py --gyrb-hmm ../HMMtoFindGyraseB/GyraseB.hmm *.fna 16S.hmm
+# Example: 16SHMMER.py --seed-reference ../BLASTToFind16S/Example16DB/RDPActinoBacteria16S.fna *.fna 16S.hmm
 # ----------------------------------------------------------------------------------------
 # ===========================================================================================================
 
-import cStringIO
-import subprocess
 # Imports & Setup:
+import argparse
+import atexit
+import collections
+import itertools
+import subprocess
 import sys
+import tempfile
+import threading
 from multiprocessing import cpu_count
-from os import path
+from os import devnull, path
+
+import RNAStockholmToFASTA
+import TwoBitGenomeStore
 
-from Bio import SeqIO
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "..", "SupplementaryScripts"))
+import PipelineMetrics
+import SixteenSCache
+import SixteenSResultStore
+
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "..", "PrimersToFind16S"))
+import AmpliconExtract16S
 
 processors = cpu_count()  # Gets number of processor cores for HMMER.
+reverseStrandTag = "_revcomp"  # Added to the IDs of reverse complemented contigs when searching in a single pass.
+tierTag = "tier=hmm"  # Added to the FASTA headers of 16S genes found by HMMER when running with --amplicon-first.
+# Translation table for complementing DNA (including IUPAC ambiguity codes) without Biopython.
+complementTable = str.maketrans("ACGTURYKMBVDHSWNacgturykmbvdhswn", "TGCAAYRMKVBHDSWNtgcaayrmkvbhdswn")
+metrics = PipelineMetrics.MetricsRecorder()  # Replaced by a recording instance when running with --metrics.
+store = None  # The SixteenSResultStore.ResultStore results are written to when running with --store.
+# The standard genetic code. Codons with bases other than A, C, G or T are translated as X.
+codonTable = collections.defaultdict(lambda: "X",
+                                     zip([a + b + c for a in "TCAG" for b in "TCAG" for c in "TCAG"],
+                                         "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"))
+gyrBLengths = (500, 1200)  # Gyrase B hits (in amino acids) outside this range are treated as partial or spurious.
 
 
 # ===========================================================================================================
@@ -36,68 +88,133 @@ def argsCheck():
         print("Examples:" + sys.argv[0] + "Querygenome.faa <16S.hmm>")
         exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
 
+    parser = argparse.ArgumentParser(description="Uses HMMER to search for 16S genes within genomes.")
+    parser.add_argument("genomes", nargs="+", help="The query genome FASTA (or .2bit) files.")
+    parser.add_argument("HMMERDBFile", help="The 16S HMM.")
+    parser.add_argument("--single-pass", action="store_true",
+                        help="Search the forward and reverse strand with a single hmmsearch run.")
+    parser.add_argument("--amplicon-first", action="store_true",
+                        help="Try cutting the 27F-1492R amplicon before falling back to hmmsearch.")
+    parser.add_argument("--seed-reference", metavar="Reference16S.fna",
+                        help="Only search windows around k-mer seeds shared with these 16S genes.")
+    parser.add_argument("--seed-k", type=int, default=16, help="K-mer length used for seeding (default: 16).")
+    parser.add_argument("--seed-flank", type=int, default=2000,
+                        help="Bases searched on either side of a seed cluster (default: 2000).")
+    parser.add_argument("--cache", metavar="CacheDirectory",
+                        help="Reuse (and store) results from a persistent cache in this directory.")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="Size limit of the cache in megabytes (default: 1024).")
+    parser.add_argument("--metrics", metavar="Metrics.jsonl",
+                        help="Append per genome timing and resource metrics to this JSON lines file.")
+    parser.add_argument("--store", metavar="Results.db",
+                        help="Write results to this SQLite result store instead of the output files.")
+    parser.add_argument("--gyrb-hmm", metavar="GyraseB.hmm",
+                        help="Also search each genome (in all six reading frames) with this Gyrase B protein HMM.")
+    parser.add_argument("--cpus", type=int, default=0,
+                        help="Cores given to each hmmsearch run (default: 0, all cores).")
+    return parser.parse_args()
+
 
 # -------------------------------------------------------------------------------------------------
-# 2: Runs HMMER with settings specific for extracting subject sequences.
-def runHMMSearch(FASTA, HMMERDBFile):
-    Found16S = True
-    process = subprocess.Popen(
-        ["hmmsearch", "--acc", "--cpu", str(processors), "-A", "tempAlign.sto", HMMERDBFile, "-"],
-        stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=1)
-    stdout = process.communicate(FASTA)[
-        0]  # This returns a list with both stderr and stdout. Only want stdout which is first element.
-    if "No hits detected that satisfy reporting thresholds" in stdout:
-        Found16S = False
-    return Found16S
+# 2: Writes chunks of FASTA from a generator to hmmsearch's stdin. Runs in its own thread so that hmmsearch's
+#    stdout can be drained at the same time. Errors raised while the genome is read are added to feedErrors, so
+#    that runHMMSearch can fail the genome rather than use the results of a search of part of it.
+def feedHMMSearch(FASTAChunks, HMMERIn, feedErrors):
+    try:
+        for chunk in FASTAChunks:
+            HMMERIn.write(chunk)
+    except BrokenPipeError:
+        pass  # hmmsearch exited early. Its exit status is checked by runHMMSearch.
+    except Exception as error:  # Any error, so a genome that was only partly read is never treated as searched.
+        feedErrors.append(error)
+    finally:
+        try:
+            HMMERIn.close()
+        except (IOError, OSError):
+            pass
 
 
 # -------------------------------------------------------------------------------------------------
-# 3: Converts the sequence record object from an RNA Stockholm file to a DNA FASTA file.
-def getDNAFasta(SeqRecord):
-    SeqRecord.letter_annotations = {}  # Removes per letter annotations. Biopython throws an error if you try to
-    # reverse complement a sequence with per letter annotations (since afterward
-    # these annotations would no longer be valid). We strip these per letter
-    # annotions since they are not a part of the FASTA format anyways.
-    DNA = SeqRecord.seq.back_transcribe()
-    SeqRecord.seq = DNA
-    FASTA = SeqRecord.format("fasta")
-    FASTA = fastaClean(FASTA)
-    return FASTA
+# 3: Runs HMMER with settings specific for extracting subject sequences.
+#    FASTAChunks is an iterable of FASTA formatted strings which are streamed to hmmsearch's stdin.
+#    The human readable output is discarded and the alignment of the hits is written to hmmsearch's stdout,
+#    where it is parsed straight from the pipe and added to SixteenSSubunits. Returns true if a 16S was found.
+def runHMMSearch(FASTAChunks, HMMERDBFile, SixteenSSubunits):
+    with metrics.stage("hmmsearch"):
+        process = subprocess.Popen(
+            ["hmmsearch", "--acc", "--cpu", str(processors), "-o", devnull, "-A", "/dev/stdout", HMMERDBFile, "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+        feedErrors = []
+        feeder = threading.Thread(target=feedHMMSearch,
+                                  args=(metrics.countBytes("hmmsearch", FASTAChunks, "bytesIn"), process.stdin,
+                                        feedErrors))
+        feeder.start()
+        hitCount = add16SSequences(SixteenSSubunits, metrics.countBytes("hmmsearch", process.stdout, "bytesOut"))
+        feeder.join()
+        process.stdout.close()
+        metrics.setExitStatus("hmmsearch", process.wait())
+    if feedErrors:
+        raise feedErrors[0]
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, "hmmsearch")
+    return hitCount > 0
 
 
 # -------------------------------------------------------------------------------------------------
-# 4: Addes sequence files to the lists.
-def add16SSequences(SixteenSSubunits):
-    handle2 = open("tempAlign.sto", "rU")  # Read in the alignment file created by runHMMSearch.
-    SixTeens = SeqIO.parse(handle2, "stockholm")  # Parse the alignment file into sequence record objects
-    for Sixteen in SixTeens:
-        SixteenFasta = getDNAFasta(Sixteen)
-        SixteenSSubunits.append(SixteenFasta)
-    handle2.close()
+# 4: Addes sequence files to the lists. Returns the number of sequences added.
+def add16SSequences(SixteenSSubunits, alignmentHandle, translationTable=RNAStockholmToFASTA.DNATable):
+    hitCount = 0
+    # The alignment is streamed into degapped DNA sequences without being loaded whole.
+    with metrics.stage("stockholmParse"):
+        for header, sequence in RNAStockholmToFASTA.readStockholmRecords(alignmentHandle, translationTable):
+            SixteenSSubunits.append(header + "\n" + sequence)
+            hitCount += 1
+    return hitCount
 
 
 # -------------------------------------------------------------------------------------------------
-# 5: Converts sequence record object as a reverse complement FASTA formatted sequence.
-def getReverseComplementFasta(SeqRecord):
-    reverseCompSeq = SeqRecord.seq.reverse_complement()
-    SeqRecord.seq = reverseCompSeq
-    FASTA = SeqRecord.format("fasta")
-    FASTA = fastaClean(FASTA)
-    return FASTA
+# 5: Reads a FASTA file one record at a time. Yields (header, sequence) tuples so that only a single contig
+#    is ever held in memory.
+def readFastaRecords(handle):
+    header = None
+    sequence = []
+    for line in handle:
+        line = line.rstrip()
+        if line.startswith(">"):
+            if header is not None:
+                yield header, "".join(sequence)
+            header = line
+            sequence = []
+        elif line:
+            sequence.append(line)
+    if header is not None:
+        yield header, "".join(sequence)
 
 
 # -------------------------------------------------------------------------------------------------
-# 6: Cleans up FASTA formatted sequences.
-def fastaClean(FASTA):
-    FASTAHeader, FASTACode = FASTA.split("\n", 1)  # Splits FASTA's into header and genetic code.
-    # Removes alignment markers and converts FASTA file sequence into a single line.
-    FASTACode = FASTACode.replace("-", "").replace("\n", "")
-    FASTA = FASTAHeader + "\n" + FASTACode
-    return FASTA
+# 6: Streams the forward strand of a genome FASTA file line by line.
+def getForwardFastaStream(handle):
+    handle.seek(0)
+    for line in handle:
+        if not line.endswith("\n"):
+            line += "\n"
+        yield line
 
 
 # -------------------------------------------------------------------------------------------------
-# 7: Creates a more informative header for the 16S gene.
+# 7: Streams the reverse complement of a genome FASTA file one contig at a time. If tagRecords is set, the
+#    reverse strand tag is added to each contig ID so that its hits can be told apart from forward strand hits.
+def getReverseComplementFastaStream(handle, tagRecords=False):
+    handle.seek(0)
+    for header, sequence in readFastaRecords(handle):
+        if tagRecords:
+            header = header.split(None, 1)[0] + reverseStrandTag
+        yield header + "\n"
+        yield sequence.translate(complementTable)[::-1] + "\n"
+
+
+# -------------------------------------------------------------------------------------------------
+# 8: Creates a more informative header for the 16S gene.
 def fastaHeaderSwap(FASTA, subjectAccession):
     FASTAHeader, FASTACode = FASTA.split("\n", 1)  # Splits FASTA's into header and genetic code.
     FASTAHeader = ">" + subjectAccession
@@ -106,87 +223,102 @@ def fastaHeaderSwap(FASTA, subjectAccession):
 
 
 # -------------------------------------------------------------------------------------------------
-# 8: Appends genome accession to a file that acts as a list of bad accessions..
+# 9: Appends genome accession to a file that acts as a list of bad accessions (or records it in the --store).
 def appendBadGenomeList(genome):
     global outfile
-    badAccession = path.split(genome)[1].strip(".fna")
+    badAccession = getAccession(genome)
+    if store:
+        with metrics.stage("writeOutput"):
+            store.add(badAccession, "hmm", genome=genome)
+        return
     try:
-        outfile = open("No16SGenomesHMM.txt", "a")
-        outfile.write(badAccession + "\n")
-        outfile.close()
+        with metrics.stage("writeOutput"):
+            outfile = open("No16SGenomesHMM.txt", "a")
+            outfile.write(badAccession + "\n")
+            outfile.close()
+        metrics.addBytes("writeOutput", bytesOut=len(badAccession) + 1)
     except IOError:
         print("Failed to open {0}".format(outfile))
         exit(1)
 
 
 # -------------------------------------------------------------------------------------------------
-# 9: Adds SixteenS gene to a FASTA file.
-def write16SToFile(SixteenSGene):
+# 10: Adds SixteenS gene to a FASTA file (or to the --store, with its strand and tier).
+def write16SToFile(SixteenSGene, genome=None, strand=None):
     global outfile
+    if store:
+        header, sequence = SixteenSGene.split("\n", 1)
+        headerFields = header[1:].split()
+        tiers = [field.split("=", 1)[1] for field in headerFields if field.startswith("tier=")]
+        with metrics.stage("writeOutput"):
+            store.add(headerFields[0], "hmm", sequence.replace("\n", ""), strand, tier=(tiers or ["hmm"])[0],
+                      genome=genome)
+        return
     try:
-        outfile = open("Found16SGenesHMM.fna", "a")
-        outfile.write(SixteenSGene + "\n")
-        outfile.close()
+        with metrics.stage("writeOutput"):
+            outfile = open("Found16SGenesHMM.fna", "a")
+            outfile.write(SixteenSGene + "\n")
+            outfile.close()
+        metrics.addBytes("writeOutput", bytesOut=len(SixteenSGene) + 1)
     except IOError:
         print("Failed to open {0}".format(outfile))
         exit(1)
 
 
-# ===========================================================================================================
-# Main program code:
-# House keeping...
-argsCheck()  # Checks if the number of arguments are correct.
-
-genome = sys.argv[1]
-print("Opening " + genome + "...")
-
-subjectAccession = path.split(genome)[1].strip(".fna")
-
-# File extension check
-if not genome.endswith(".fna"):
-    print("[Warning] " + genome + " may not be a nucleic acid fasta file!")
-
-HMMERDBFile = sys.argv[2]
-print("Opening " + HMMERDBFile + "...")
-print("Searching " + genome + " with " + HMMERDBFile + "...")
-
-SixteenSSubunits = []
-Found16S = False
-try:
-    inFile = open(genome, "rU")
-    FASTA = inFile.read()
-    inFile.close()
-    Found16S = runHMMSearch(FASTA,
-                            HMMERDBFile)  # Pass this FASTA to hmmsearch. runHMMSearch returns true if a 16S was found.
-    if Found16S:  # If we get a result from hmmsearch, check the alignment file.
-        print("Found a 16S in the positive strand.")
-        add16SSequences(SixteenSSubunits)
+# -------------------------------------------------------------------------------------------------
+# 11: Searches both strands of a genome for 16S genes. Returns a list of every 16S hit as FASTA.
+#     If a k-mer index is given only windows around seeded loci are searched unless there are no seeds.
+def search16SInGenome(genome, HMMERDBFile, singlePass=False, kmerIndex=None, seedK=16, seedFlank=2000):
+    SixteenSSubunits = []
+    if genome.endswith(".2bit"):
+        inFile = TwoBitGenomeStore.TwoBitGenome(genome)
     else:
-        print("No 16S found in the positive strand.")
-
-    handle = cStringIO.StringIO(
-        FASTA)  # Instead reading from the file again we make a virtual file from a string and pass this.
-    FASTA = []
-    SeqRecords = SeqIO.parse(handle, "fasta")
-    for record in SeqRecords:
-        FASTA.append(getReverseComplementFasta(record))
-    FASTA = "\n".join(FASTA)
-    handle.close()
-
-    Found16S = runHMMSearch(FASTA,
-                            HMMERDBFile)  # Pass this FASTA to hmmsearch. runHMMSearch returns true if a 16S was found.
-    if Found16S:  # If we get a result from hmmsearch, check the alignment file.
-        print("Found a 16S in the negative strand.")
-        add16SSequences(SixteenSSubunits)
+        inFile = open(genome, "r")
+    seedWindows = None
+    if kmerIndex is not None:
+        with metrics.stage("seedWindows"):
+            seedWindows = getSeedWindows(inFile, kmerIndex, seedK, seedFlank)
+        if seedWindows:
+            print("Searching " + str(len(seedWindows) // 2) + " seeded window(s).")
+        else:
+            print("No 16S seeds found. Searching the whole genome.")
+    if seedWindows:
+        runHMMSearch(seedWindows, HMMERDBFile, SixteenSSubunits)
+        reportStrandHits(SixteenSSubunits)
+    elif singlePass:
+        # Both strands go to hmmsearch together. Reverse strand hits are told apart by the reverse strand tag.
+        FASTA = itertools.chain(metrics.timeIterable("readGenome", getGenomeStream(inFile)),
+                                metrics.timeIterable("reverseComplement",
+                                                     getGenomeStream(inFile, reverse=True, tagRecords=True)))
+        runHMMSearch(FASTA, HMMERDBFile, SixteenSSubunits)
+        reportStrandHits(SixteenSSubunits)
     else:
-        print("No 16S found in the negative strand.")
-except IOError:
-    print("Failed to open " + genome)
-    exit(1)
+        FASTA = metrics.timeIterable("readGenome", getGenomeStream(inFile))
+        Found16S = runHMMSearch(FASTA, HMMERDBFile,
+                                SixteenSSubunits)  # Pass this FASTA to hmmsearch. runHMMSearch returns true if a 16S was found.
+        if Found16S:
+            print("Found a 16S in the positive strand.")
+        else:
+            print("No 16S found in the positive strand.")
+
+        # Reverse strand contigs are tagged so the strand of the top 16S is known.
+        FASTA = metrics.timeIterable("reverseComplement", getGenomeStream(inFile, reverse=True, tagRecords=True))
+
+        Found16S = runHMMSearch(FASTA, HMMERDBFile,
+                                SixteenSSubunits)  # Pass this FASTA to hmmsearch. runHMMSearch returns true if a 16S was found.
+        if Found16S:
+            print("Found a 16S in the negative strand.")
+        else:
+            print("No 16S found in the negative strand.")
+    inFile.close()
+    return SixteenSSubunits
 
-Top16S = ""
-if SixteenSSubunits:
 
+# -------------------------------------------------------------------------------------------------
+# 12: Picks the longest 16S hit. Returns it as FASTA if it is around the size of a 16S gene (or within another
+#     marker's length range), otherwise None.
+def getTop16S(SixteenSSubunits, lengthRange=(1000, 2000)):
+    Top16S = ""
     Top16SLength = 0
     for s in SixteenSSubunits:
         Current16SSeqLength = len(
@@ -195,16 +327,387 @@ if SixteenSSubunits:
             Top16S = s
             Top16SLength = Current16SSeqLength
     # 16S genes are around 1500 B.P. This filters out partial sequence or really large sequences.
-    if len(Top16S) < 2000 and len(
-            Top16S) > 1000:
-        Top16S = fastaHeaderSwap(Top16S, subjectAccession)
-        write16SToFile(Top16S)
-        print("Writing best 16S to file.")
+    # Only the sequence is measured, so the length of the hit's header does not matter.
+    if lengthRange[0] < Top16SLength < lengthRange[1]:
+        return Top16S
+    return None
+
+
+# -------------------------------------------------------------------------------------------------
+# 13: Reports which strands 16S hits were found on, when both strands were searched in one hmmsearch run.
+def reportStrandHits(SixteenSSubunits):
+    reverseHits = [s for s in SixteenSSubunits if reverseStrandTag + "/" in s.split("\n", 1)[0]]
+    if len(reverseHits) < len(SixteenSSubunits):
+        print("Found a 16S in the positive strand.")
+    else:
+        print("No 16S found in the positive strand.")
+    if reverseHits:
+        print("Found a 16S in the negative strand.")
+    else:
+        print("No 16S found in the negative strand.")
+
+
+# -------------------------------------------------------------------------------------------------
+# 14: Builds an index of every k-mer in a set of reference 16S genes. Maps each k-mer to the genome strand a
+#     match implies: 1 if it is found in the references as is (positive strand), 2 if its reverse complement is
+#     (negative strand) or 3 for both.
+def buildKmerIndex(referenceFile, k):
+    kmerIndex = {}
+    inFile = open(referenceFile, "r")
+    for header, sequence in readFastaRecords(inFile):
+        sequence = sequence.upper().replace("U", "T")
+        reverseSequence = sequence.translate(complementTable)[::-1]
+        for strand, strandSequence in ((1, sequence), (2, reverseSequence)):
+            for i in range(len(strandSequence) - k + 1):
+                kmer = strandSequence[i:i + k]
+                kmerIndex[kmer] = kmerIndex.get(kmer, 0) | strand
+    inFile.close()
+    return kmerIndex
+
+
+# -------------------------------------------------------------------------------------------------
+# 15: Seeds candidate 16S loci in a genome from k-mers shared with the reference index. Every stride-th k-mer of
+#     each contig is looked up, so any exact shared run of k + stride - 1 bases is seeded. Seeds on the same contig
+#     and strand are clustered and windows of flank bases either side of each cluster with at least minSeeds
+#     seeds are cut out. Negative strand windows are reverse complemented and tagged. Returns a list of FASTA
+#     strings (header, sequence) ready for runHMMSearch.
+def getSeedWindows(genomeSource, kmerIndex, k, flank, stride=4, minSeeds=2):
+    windows = []
+    for header, sequence in getGenomeRecords(genomeSource):
+        contigID = header[1:].split(None, 1)[0] if len(header) > 1 else "contig"
+        upperSequence = sequence.upper()
+        seeds = {1: [], 2: []}
+        for i in range(0, len(upperSequence) - k + 1, stride):
+            strand = kmerIndex.get(upperSequence[i:i + k])
+            if strand:
+                if strand & 1:
+                    seeds[1].append(i)
+                if strand & 2:
+                    seeds[2].append(i)
+        for strand in (1, 2):
+            clusters = []
+            for position in seeds[strand]:
+                if clusters and position - clusters[-1][1] <= flank:
+                    clusters[-1][1] = position
+                    clusters[-1][2] += 1
+                else:
+                    clusters.append([position, position, 1])
+            for clusterStart, clusterEnd, seedCount in clusters:
+                if seedCount < minSeeds:
+                    continue
+                start = max(clusterStart - flank, 0)
+                end = min(clusterEnd + k + flank, len(sequence))
+                window = sequence[start:end]
+                windowID = contigID + "_" + str(start + 1) + "-" + str(end)
+                if strand == 2:
+                    window = window.translate(complementTable)[::-1]
+                    windowID += reverseStrandTag
+                windows.append(">" + windowID + "\n")
+                windows.append(window + "\n")
+    return windows
+
+
+# -------------------------------------------------------------------------------------------------
+# 16: Gets a genome's accession from its file name.
+def getAccession(genome):
+    if genome.endswith(".2bit"):
+        return path.split(genome)[1][:-len(".2bit")]
+    return path.split(genome)[1].strip(".fna")
+
+
+# -------------------------------------------------------------------------------------------------
+# 17: Streams a .2bit genome store as FASTA one chunk at a time. The reverse strand is decoded from the end of
+#     each contig backwards so no contig is ever fully decoded.
+def getTwoBitFastaStream(store, reverse=False, tagRecords=False):
+    for name in store.names:
+        yield ">" + name + (reverseStrandTag if tagRecords else "") + "\n"
+        for chunk in store.iterChunks(name, "-" if reverse else "+"):
+            yield chunk + "\n"
+
+
+# -------------------------------------------------------------------------------------------------
+# 18: Streams one strand of a genome as FASTA from either a FASTA file handle or a .2bit store.
+def getGenomeStream(genomeSource, reverse=False, tagRecords=False):
+    if isinstance(genomeSource, TwoBitGenomeStore.TwoBitGenome):
+        return getTwoBitFastaStream(genomeSource, reverse, tagRecords)
+    if reverse:
+        return getReverseComplementFastaStream(genomeSource, tagRecords)
+    return getForwardFastaStream(genomeSource)
+
+
+# -------------------------------------------------------------------------------------------------
+# 19: Reads a genome one record at a time from either a FASTA file handle or a .2bit store.
+#     Yields (header, sequence) tuples.
+def getGenomeRecords(genomeSource):
+    if isinstance(genomeSource, TwoBitGenomeStore.TwoBitGenome):
+        for name in genomeSource.names:
+            yield ">" + name, genomeSource.getSlice(name, 0, genomeSource.getLength(name))
     else:
-        appendBadGenomeList(genome)  # If 16S gene is too partial to be used.
-        print("Though a partial 16S was found, it was of low quality.")
-        print("Writing genome accession to No16SGenomesHMM.txt")
-else:
-    appendBadGenomeList(genome)
-    print("No 16S found. Writing genome accession to No16SGenomesHMM.txt")
-print("Done!\n")
+        genomeSource.seek(0)
+        for record in readFastaRecords(genomeSource):
+            yield record
+
+
+# -------------------------------------------------------------------------------------------------
+# 20: Gets the strand ("plus" or "minus") a 16S hit was found on from its reverse strand tag.
+def getStrand(SixteenSGene):
+    return "minus" if reverseStrandTag + "/" in SixteenSGene.split("\n", 1)[0] else "plus"
+
+
+# -------------------------------------------------------------------------------------------------
+# 21: Translates one reading frame (0, 1 or 2) of a DNA sequence into protein.
+def translateFrame(sequence, frame):
+    sequence = sequence.upper()
+    return "".join([codonTable[sequence[i:i + 3]] for i in range(frame, len(sequence) - 2, 3)])
+
+
+# -------------------------------------------------------------------------------------------------
+# 22: Gets the six reading frame translations of a contig as FASTA strings. Frames of the reverse strand are
+#     tagged with the reverse strand tag so the strand of a hit is known.
+def getSixFrameFasta(contigID, sequence, reverseSequence):
+    frames = []
+    for frame in range(3):
+        frames.append(">" + contigID + "_f" + str(frame + 1) + "\n" + translateFrame(sequence, frame) + "\n")
+        frames.append(">" + contigID + "_f" + str(frame + 1) + reverseStrandTag + "\n" +
+                      translateFrame(reverseSequence, frame) + "\n")
+    return frames
+
+
+# -------------------------------------------------------------------------------------------------
+# 23: Searches a genome for several markers in a single read of the genome. Markers are (name, HMM file,
+#     is protein) tuples and each has its own hmmsearch running at once. Each contig (and its reverse complement)
+#     is passed to every marker's hmmsearch: as DNA for nucleotide HMMs and in all six reading frames for protein
+#     HMMs. The cores are split between the hmmsearch runs. Returns a dictionary of marker name -> list of every hit
+#     as FASTA.
+def searchMarkersInGenome(genome, markers):
+    if genome.endswith(".2bit"):
+        inFile = TwoBitGenomeStore.TwoBitGenome(genome)
+    else:
+        inFile = open(genome, "r")
+    markerHits = {}
+    searches = []
+    brokenSearches = set()  # Names of markers whose hmmsearch exited before the whole genome was written to it.
+    with metrics.stage("hmmsearch"):
+        for markerIndex, (name, HMMFile, isProtein) in enumerate(markers):
+            # Any cores left over from an even split go to the first markers.
+            markerCPUs = max(1, processors // len(markers) + (1 if markerIndex < processors % len(markers) else 0))
+            errorFile = tempfile.TemporaryFile()  # hmmsearch's error messages, reported if the search fails.
+            process = subprocess.Popen(
+                ["hmmsearch", "--acc", "--cpu", str(markerCPUs), "-o", devnull, "-A", "/dev/stdout", HMMFile, "-"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errorFile, universal_newlines=True)
+            markerHits[name] = []
+            # Each alignment is parsed in its own thread so no hmmsearch is left blocked on a full pipe.
+            table = RNAStockholmToFASTA.proteinTable if isProtein else RNAStockholmToFASTA.DNATable
+            reader = threading.Thread(target=add16SSequences, args=(markerHits[name], process.stdout, table))
+            reader.start()
+            searches.append((name, isProtein, process, reader, errorFile))
+        try:
+            for header, sequence in metrics.timeIterable("readGenome", getGenomeRecords(inFile)):
+                contigID = header[1:].split(None, 1)[0] if len(header) > 1 else "contig"
+                with metrics.stage("reverseComplement"):
+                    reverseSequence = sequence.translate(complementTable)[::-1]
+                for name, isProtein, process, reader, errorFile in searches:
+                    if isProtein:
+                        with metrics.stage("translate"):
+                            records = getSixFrameFasta(contigID, sequence, reverseSequence)
+                    else:
+                        records = [">" + contigID + "\n" + sequence + "\n",
+                                   ">" + contigID + reverseStrandTag + "\n" + reverseSequence + "\n"]
+                    try:
+                        for record in records:
+                            process.stdin.write(record)
+                    except BrokenPipeError:
+                        brokenSearches.add(name)
+                if brokenSearches:
+                    break  # The genome cannot be fully searched, so the rest of it is not read.
+        finally:
+            for name, isProtein, process, reader, errorFile in searches:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    brokenSearches.add(name)
+                except (IOError, OSError):
+                    pass  # hmmsearch has already exited. Its exit status is checked below.
+            inFile.close()
+        for name, isProtein, process, reader, errorFile in searches:
+            reader.join()
+            process.stdout.close()
+            metrics.setExitStatus("hmmsearch", process.wait())
+    searchError = None
+    for name, isProtein, process, reader, errorFile in searches:
+        errorFile.seek(0)
+        errorMessage = errorFile.read().decode("utf-8", "replace").strip()
+        errorFile.close()
+        if (process.returncode != 0 or name in brokenSearches) and searchError is None:
+            searchError = subprocess.CalledProcessError(process.returncode, "hmmsearch (" + name + ")",
+                                                        stderr=errorMessage)
+    if searchError:
+        raise searchError
+    return markerHits
+
+
+# -------------------------------------------------------------------------------------------------
+# 24: Picks a genome's best Gyrase B hit in the same way as its best 16S and writes it to FoundGyrBGenesHMM.faa.
+#     Genomes without one are added to NoGyrBGenomesHMM.txt. With --store results are added to the store instead.
+def writeTopGyrB(genome, GyrBHits):
+    accession = getAccession(genome)
+    TopGyrB = getTop16S(GyrBHits, gyrBLengths) if GyrBHits else None
+    if TopGyrB:
+        print("Writing best Gyrase B to file.")
+    else:
+        print("No full length Gyrase B found. Writing genome accession to NoGyrBGenomesHMM.txt")
+    if store:
+        with metrics.stage("writeOutput"):
+            store.add(accession, "gyrB", TopGyrB.split("\n", 1)[1] if TopGyrB else None,
+                      getStrand(TopGyrB) if TopGyrB else None, tier="hmm", genome=genome)
+        return
+    try:
+        with metrics.stage("writeOutput"):
+            if TopGyrB:
+                outFile = open("FoundGyrBGenesHMM.faa", "a")
+                outFile.write(fastaHeaderSwap(TopGyrB, accession) + "\n")
+            else:
+                outFile = open("NoGyrBGenomesHMM.txt", "a")
+                outFile.write(accession + "\n")
+            outFile.close()
+    except IOError:
+        print("Failed to write the Gyrase B result for " + genome)
+        exit(1)
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    HMMERDBFile = args.HMMERDBFile
+    if args.cpus > 0:
+        processors = args.cpus
+    if args.metrics:
+        try:
+            metrics = PipelineMetrics.MetricsRecorder(args.metrics, "16SHMMER.py")
+        except IOError:
+            print("Failed to open " + args.metrics)
+            exit(1)
+    if args.store:
+        try:
+            store = SixteenSResultStore.ResultStore(args.store)
+        except SixteenSResultStore.StoreError:
+            print("Failed to open " + args.store)
+            exit(1)
+        atexit.register(store.close)  # Writes any buffered results, even if the run is aborted.
+    print("Opening " + HMMERDBFile + "...")
+
+    cache = None
+    kmerIndex = None
+    sixteenSMarker = ("16S", HMMERDBFile, False)
+    gyrBMarker = ("gyrB", args.gyrb_hmm, True) if args.gyrb_hmm else None
+    if args.seed_reference:
+        print("Building " + str(args.seed_k) + "-mer seed index from " + args.seed_reference + "...")
+        try:
+            kmerIndex = buildKmerIndex(args.seed_reference, args.seed_k)
+        except IOError:
+            print("Failed to open " + args.seed_reference)
+            exit(1)
+
+    if args.cache:
+        if not path.isfile(HMMERDBFile):  # The HMM is hashed as part of every cache key.
+            print("Failed to open " + HMMERDBFile)
+            exit(1)
+        cache = SixteenSCache.ResultCache(args.cache, args.cache_size * 1024 * 1024)
+        cacheParameters = "16SHMMER 1000<length<2000"
+        if kmerIndex is not None:  # Seeded searches only look at part of the genome so are cached separately.
+            cacheParameters += " seeded k=" + str(args.seed_k) + " flank=" + str(args.seed_flank) + " reference=" + \
+                               SixteenSCache.hashFile(args.seed_reference)
+
+    for genome in args.genomes:
+        print("Opening " + genome + "...")
+
+        subjectAccession = getAccession(genome)
+        headerAccession = subjectAccession + " " + tierTag if args.amplicon_first else subjectAccession
+
+        # File extension check
+        if not genome.endswith(".fna") and not genome.endswith(".2bit"):
+            print("[Warning] " + genome + " may not be a nucleic acid fasta file!")
+
+        cacheKey = None
+        Top16S = None
+        try:
+            if args.amplicon_first and not genome.endswith(".2bit"):  # The amplicon tier only reads FASTA files.
+                with metrics.stage("amplicon"):
+                    amplicon = AmpliconExtract16S.extractAmplicon(genome)
+                if amplicon:
+                    print("Found a 16S amplicon between the 27F and 1492R primer sites.")
+                    write16SToFile(">" + subjectAccession + " " + AmpliconExtract16S.tierTag + "\n" + amplicon, genome)
+                    print("Writing best 16S to file.")
+                    if gyrBMarker:
+                        writeTopGyrB(genome, searchMarkersInGenome(genome, [gyrBMarker])["gyrB"])
+                    metrics.emit("genome", genome=genome, result="found", tier="amplicon")
+                    print("Done!\n")
+                    continue
+
+            print("Searching " + genome + " with " + HMMERDBFile + "...")
+            if cache:
+                with metrics.stage("cacheLookup"):
+                    cacheKey = cache.makeKey(genome, HMMERDBFile, cacheParameters)
+                    cachedResult = cache.get(cacheKey)
+                if cachedResult is not None:
+                    print("Using cached result for " + genome + ".")
+                    Found16S, Top16SSeq = cachedResult
+                    if Found16S:
+                        write16SToFile(">" + headerAccession + "\n" + Top16SSeq, genome)
+                        print("Writing best 16S to file.")
+                    else:
+                        appendBadGenomeList(genome)
+                        print("No 16S found. Writing genome accession to No16SGenomesHMM.txt")
+                    if gyrBMarker:
+                        writeTopGyrB(genome, searchMarkersInGenome(genome, [gyrBMarker])["gyrB"])
+                    metrics.emit("genome", genome=genome, result="found" if Found16S else "none", tier="cache")
+                    print("Done!\n")
+                    continue
+            if gyrBMarker and kmerIndex is None:
+                # Both markers are searched in a single read of the genome.
+                markerHits = searchMarkersInGenome(genome, [sixteenSMarker, gyrBMarker])
+                SixteenSSubunits = markerHits["16S"]
+                reportStrandHits(SixteenSSubunits)
+                writeTopGyrB(genome, markerHits["gyrB"])
+            else:
+                SixteenSSubunits = search16SInGenome(genome, HMMERDBFile, args.single_pass, kmerIndex, args.seed_k,
+                                                     args.seed_flank)
+                if gyrBMarker:  # Seeded 16S searches only read part of the genome, so Gyrase B is searched alone.
+                    writeTopGyrB(genome, searchMarkersInGenome(genome, [gyrBMarker])["gyrB"])
+        except subprocess.CalledProcessError as error:
+            print("Failed to search " + genome + ": " + str(error))
+            if error.stderr:
+                print(error.stderr)
+            exit(1)
+        except (IOError, ValueError) as error:
+            print("Failed to read " + genome + ": " + str(error))
+            exit(1)
+
+        result = "none"
+        if SixteenSSubunits:
+            Top16S = getTop16S(SixteenSSubunits)
+            result = "found" if Top16S else "partial"
+            if Top16S:
+                strand = getStrand(Top16S)
+                Top16S = fastaHeaderSwap(Top16S, headerAccession)
+                write16SToFile(Top16S, genome, strand)
+                print("Writing best 16S to file.")
+            else:
+                appendBadGenomeList(genome)  # If 16S gene is too partial to be used.
+                print("Though a partial 16S was found, it was of low quality.")
+                print("Writing genome accession to No16SGenomesHMM.txt")
+        else:
+            appendBadGenomeList(genome)
+            print("No 16S found. Writing genome accession to No16SGenomesHMM.txt")
+
+        if cache:
+            cache.put(cacheKey, Top16S.split("\n", 1)[1] if Top16S else None)
+        metrics.emit("genome", genome=genome, result=result, tier="hmm", hits=len(SixteenSSubunits))
+        print("Done!\n")
+
+    if cache:
+        cache.report()
+    metrics.close()
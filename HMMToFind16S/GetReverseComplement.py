@@ -1,34 +1,56 @@
-#!/usr/bin/env python 
-# Created by: Lee Bergstrand 
+#!/usr/bin/env python
+# Created by: Lee Bergstrand
 # Description: A simple program that takes a nucleotide FASTA file and returns the exact same FASTA
 #              file with a reverse complemented sequence. Also works with multi-sequence FASTA files.
+#              With --stream each sequence is reverse complemented in fixed size chunks, read from the end of
+#              the sequence back towards its start, so memory use stays bounded even for very large contigs.
+#              Multiple FASTA files can be given and are processed in parallel. Throughput is reported in bases
+#              per second for both modes.
 #
 # Requirements: - This script requires the Biopython module: http://biopython.org/wiki/Download
-#     
-# Usage: getGenbankSeqs.py <sequences.fna> 
-# Example: getGenbankSeqs.py mySeqs.fna
+#
+# Usage: GetReverseComplement.py [--stream] [--chunk-size BYTES] [--processes N] <sequences.fna> [sequences2.fna ...]
+# Example: GetReverseComplement.py mySeqs.fna
+# Example: GetReverseComplement.py --stream --processes 4 *.fna
 # ----------------------------------------------------------------------------------------
 # ===========================================================================================================
 
 # Imports:
+import argparse
 import sys
+import time
+from multiprocessing import Pool, cpu_count
 
 from Bio import SeqIO
 
+lineWidth = 60  # Same line width as Biopython's FASTA writer.
+complementTable = bytes.maketrans(b"ACGTURYKMBVDHSWNacgturykmbvdhswn", b"TGCAAYRMKVBHDSWNtgcaayrmkvbhdswn")
+whitespace = b" \t\r\n"
+
 
 # ===========================================================================================================
 # Functions:
 
 # 1: Checks if in proper number of arguments are passed gives instructions on proper use.
-def argsCheck(numArgs):
-    if len(sys.argv) < numArgs or len(sys.argv) > numArgs:
+def argsCheck():
+    if len(sys.argv) < 2:
         print(
             "Takes a nucleotide FASTA file and returns the exact same FASTA file with a reverse complemented sequence.")
         print("By Lee Bergstrand\n")
-        print("Usage: " + sys.argv[0] + " <sequences.fna>")
+        print("Usage: " + sys.argv[0] + " [--stream] [--processes N] <sequences.fna> [sequences2.fna ...]")
         print("Examples: " + sys.argv[0] + " mySeq.fna\n")
         exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
 
+    parser = argparse.ArgumentParser(description="Reverse complements nucleotide FASTA files.")
+    parser.add_argument("FASTAFiles", nargs="+", help="The FASTA files to reverse complement.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Reverse complement in fixed size chunks instead of loading whole sequences.")
+    parser.add_argument("--chunk-size", type=int, default=4 * 1024 * 1024,
+                        help="Bytes of sequence read per chunk in streaming mode (default: 4 MB).")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Number of FASTA files to process in parallel (default: 1, 0 for all cores).")
+    return parser.parse_args()
+
 
 # 2: Converts sequence record object as a reverse complement FASTA formatted sequence.
 def getReverseComplementFasta(SeqRecord):
@@ -37,33 +59,126 @@ def getReverseComplementFasta(SeqRecord):
     return SeqRecord.format("fasta")
 
 
-# ===========================================================================================================
-# Main program code:
+# 3: Reverse complements a FASTA file with Biopython. Returns the number of bases written.
+def reverseComplementFile(inFile, outFile):
+    baseCount = 0
+    writer = open(outFile, "w")
+    handle = open(inFile, "r")
+    for record in SeqIO.parse(handle, "fasta"):
+        baseCount += len(record)
+        writer.write(getReverseComplementFasta(record))
+    handle.close()
+    writer.close()
+    return baseCount
 
-# House keeping...
-argsCheck(2)  # Checks if the number of arguments are correct.
 
-# Stores file one for input checking.
-print(">> Opening FASTA file...")
-inFile = sys.argv[1]
-outFile = inFile + ".out"
+# 4: Indexes a FASTA file. Returns a list of (header line, sequence start offset, sequence end offset) tuples
+#    so sequences can be read back in any order without holding them in memory.
+def indexFasta(handle):
+    records = []
+    header = None
+    sequenceStart = 0
+    position = 0
+    for line in handle:
+        if line.startswith(b">"):
+            if header is not None:
+                records.append((header, sequenceStart, position))
+            header = line.strip()
+            sequenceStart = position + len(line)
+        position += len(line)
+    if header is not None:
+        records.append((header, sequenceStart, position))
+    return records
 
-# File extension check
-if not inFile.endswith(".fna"):
-    print("[Warning] " + inFile + " may not be a FASTA file!")
 
-try:
-    writer = open(outFile, "w")
-    handle = open(inFile, "rU")
-    SeqRecords = SeqIO.parse(handle, "fasta")
-    print(">> Creating Reverse Complement...")
-    for record in SeqRecords:
-        FASTA = getReverseComplementFasta(record)
-        writer.write(FASTA)
+# 5: Reads a region of a file in blocks, from its end back towards its start. Each block is stripped of line
+#    breaks, complemented with a byte translation table and reversed.
+def getReverseComplementBlocks(handle, start, end, chunkSize):
+    while end > start:
+        blockStart = max(start, end - chunkSize)
+        handle.seek(blockStart)
+        block = handle.read(end - blockStart)
+        yield block.translate(complementTable, whitespace)[::-1]
+        end = blockStart
+
+
+# 6: Reverse complements a FASTA file in fixed size chunks. Sequence blocks are written in reverse order and
+#    re-wrapped to the FASTA line width. Returns the number of bases written.
+def streamReverseComplementFile(inFile, outFile, chunkSize):
+    baseCount = 0
+    handle = open(inFile, "rb")
+    writer = open(outFile, "wb")
+    for header, sequenceStart, sequenceEnd in indexFasta(handle):
+        writer.write(header + b"\n")
+        carry = b""  # Bases left over from the last block that did not fill a line.
+        for block in getReverseComplementBlocks(handle, sequenceStart, sequenceEnd, chunkSize):
+            baseCount += len(block)
+            block = carry + block
+            fullLines = len(block) - len(block) % lineWidth
+            writer.write(b"".join(block[i:i + lineWidth] + b"\n" for i in range(0, fullLines, lineWidth)))
+            carry = block[fullLines:]
+        if carry:
+            writer.write(carry + b"\n")
     handle.close()
     writer.close()
-except IOError:
-    print("Failed to open " + inFile + " or " + outFile)
-    exit(1)
+    return baseCount
+
+
+# 7: Reverse complements one FASTA file in a worker process. Returns (file, bases, seconds, error).
+def reverseComplementWorker(job):
+    inFile, stream, chunkSize = job
+    outFile = inFile + ".out"
+    startTime = time.time()
+    try:
+        if stream:
+            baseCount = streamReverseComplementFile(inFile, outFile, chunkSize)
+        else:
+            baseCount = reverseComplementFile(inFile, outFile)
+    except IOError:
+        return inFile, 0, 0.0, "Failed to open " + inFile + " or " + outFile
+    return inFile, baseCount, time.time() - startTime, None
+
+
+# 8: Formats a throughput in bases per second.
+def getThroughput(baseCount, seconds):
+    return "{0:,.0f} bases/s".format(baseCount / seconds if seconds > 0 else 0)
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    # File extension check
+    for inFile in args.FASTAFiles:
+        if not inFile.endswith(".fna"):
+            print("[Warning] " + inFile + " may not be a FASTA file!")
+
+    print(">> Creating Reverse Complement...")
+    jobs = [(inFile, args.stream, args.chunk_size) for inFile in args.FASTAFiles]
+    processes = args.processes if args.processes > 0 else cpu_count()
+    startTime = time.time()
+    if processes > 1 and len(jobs) > 1:
+        pool = Pool(min(processes, len(jobs)))
+        results = pool.imap(reverseComplementWorker, jobs)
+    else:
+        pool = None
+        results = map(reverseComplementWorker, jobs)
+
+    totalBases = 0
+    for inFile, baseCount, seconds, error in results:
+        if error:
+            print(error)
+            exit(1)
+        totalBases += baseCount
+        print(inFile + ": " + str(baseCount) + " bases in " + "{0:.2f}".format(seconds) + " s (" +
+              getThroughput(baseCount, seconds) + ")")
+    if pool:
+        pool.close()
+        pool.join()
 
-print(">> Done.")
+    totalSeconds = time.time() - startTime
+    print(">> Reverse complemented " + str(totalBases) + " bases in " + "{0:.2f}".format(totalSeconds) + " s (" +
+          getThroughput(totalBases, totalSeconds) + ").")
+    print(">> Done.")
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: Searches a batch of genomes for 16S genes with many hmmsearch runs at once, sharing a fixed budget
+#              of CPU cores between them. 16SHMMER.py gives every hmmsearch all of the machine's cores and
+#              searches genomes one after another, but hmmsearch scales poorly past a few threads, so most cores
+#              sit idle. Here genomes are searched largest first and each hmmsearch is given a share of the free
+#              cores in proportion to the size of its genome, compared with the genomes waiting to start
+#              alongside it (at most --max-job-cpus cores each). Big genomes get more threads and many small
+#              genomes run side by side. When a search finishes its cores go back to the budget for the next
+#              genomes. Both strands of each genome are searched in a single hmmsearch run (as with 16SHMMER.py
+#              --single-pass) and the genome is streamed to hmmsearch from a background thread, so the
+#              scheduler never waits on disk. The alignment is parsed line by line as hmmsearch writes it rather
+#              than being held whole in memory. A search that fails or runs longer than --timeout seconds is
+#              killed and retried up to --retries times. The best 16S of each genome is picked as in
+#              16SHMMER.py and written to Found16SGenesHMM.fna (or No16SGenomesHMM.txt), or with --store to an
+#              SQLite store made by SixteenSResultStore.py. Results are written as searches finish, so they are
+#              not in the order the genomes were given. Genomes whose search failed are not written, so they
+#              are searched again on a rerun.
+#
+# Requirements: - This script requires HMMER 3.0 or later.
+#
+# Usage: HMMBatchScheduler.py [--cpus N] [--max-job-cpus N] [--retries N] [--timeout Seconds] [--store <Results.db>]
+#                             <Querygenome.fna> [Querygenome2.fna ...] <16S.hmm>
+# Example: HMMBatchScheduler.py *.fna 16S.hmm
+# Example: HMMBatchScheduler.py --cpus 32 --timeout 3600 ./Genomes/*.2bit 16S.hmm
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports & Setup:
+import argparse
+import asyncio
+import atexit
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+from os import devnull, path
+
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), "..", "SupplementaryScripts"))
+import SixteenSResultStore
+import SixteenSWorker
+
+blockSize = 1024 * 1024  # Characters of FASTA written to hmmsearch at a time.
+finder = None  # 16SHMMER.py, loaded as a module.
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Checks if in proper number of arguments are passed gives instructions on proper use.
+def argsCheck():
+    if len(sys.argv) < 3:
+        print("HMMER Batch Scheduler")
+        print("By Lee Bergstrand\n")
+        print("Please refer to source code for documentation\n")
+        print("Usage: " + sys.argv[0] + " [--cpus N] [--timeout Seconds] <Querygenome.fna> [Querygenome2.fna ...]"
+                                        " <16S.hmm>")
+        print("Examples: " + sys.argv[0] + " *.fna 16S.hmm\n")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+
+    parser = argparse.ArgumentParser(description="Searches many genomes for 16S genes with hmmsearch runs at once.")
+    parser.add_argument("genomes", nargs="+", help="The query genome FASTA (or .2bit) files.")
+    parser.add_argument("HMMERDBFile", help="The 16S HMM.")
+    parser.add_argument("--cpus", type=int, default=0,
+                        help="Cores shared between the hmmsearch runs (default: 0, all cores).")
+    parser.add_argument("--max-job-cpus", type=int, default=8,
+                        help="Most cores given to one hmmsearch run (default: 8).")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="Times a failed or timed out search is retried (default: 1).")
+    parser.add_argument("--timeout", type=float, default=0,
+                        help="Seconds before a search is killed (default: 0, no limit).")
+    parser.add_argument("--store", metavar="Results.db",
+                        help="Write results to this SQLite result store instead of the output files.")
+    return parser.parse_args()
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Gets the size of a genome in bases (for FASTA files, in bytes, which is close enough for sharing out cores).
+def getGenomeSize(genome):
+    if genome.endswith(".2bit"):
+        twoBitGenome = finder.TwoBitGenomeStore.TwoBitGenome(genome)
+        size = sum(twoBitGenome.getLength(name) for name in twoBitGenome.names)
+        twoBitGenome.close()
+        return size
+    return path.getsize(genome)
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: Gets the number of cores to give a search that is about to start. The free cores are shared between it and
+#    the genomes that could start alongside it (the next waiting genomes, one per remaining free core) in
+#    proportion to their sizes. Every search gets at least one core and at most maxJobCPUs, and a core is left for
+#    each of the genomes sharing the free cores with it.
+def allocateCPUs(genomeSize, freeCPUs, waitingSizes, maxJobCPUs):
+    sharedSizes = [genomeSize] + waitingSizes[:freeCPUs - 1]
+    share = float(genomeSize) / sum(sharedSizes) if sum(sharedSizes) else 1.0
+    return max(1, min(maxJobCPUs, freeCPUs - (len(sharedSizes) - 1), int(round(freeCPUs * share))))
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Streams both strands of a genome as FASTA in blocks of about blockSize characters. Reverse strand contigs
+#    are tagged so the strand of each hit is known.
+def getFastaBlocks(genomeSource):
+    block = []
+    blockLength = 0
+    for chunk in itertools.chain(finder.getGenomeStream(genomeSource),
+                                 finder.getGenomeStream(genomeSource, reverse=True, tagRecords=True)):
+        block.append(chunk)
+        blockLength += len(chunk)
+        if blockLength >= blockSize:
+            yield "".join(block)
+            block = []
+            blockLength = 0
+    if block:
+        yield "".join(block)
+
+
+# -------------------------------------------------------------------------------------------------
+# 5: Writes a genome to hmmsearch's stdin. Each block is read (and reverse complemented) in a background thread,
+#    so the event loop keeps serving the other searches in the meantime.
+async def feedHMMSearch(genome, HMMERIn):
+    loop = asyncio.get_running_loop()
+    if genome.endswith(".2bit"):
+        inFile = finder.TwoBitGenomeStore.TwoBitGenome(genome)
+    else:
+        inFile = open(genome, "r")
+    blocks = getFastaBlocks(inFile)
+    nextBlock = None
+    try:
+        while True:
+            nextBlock = loop.run_in_executor(None, next, blocks, None)
+            # Shielded, so a timed out search still waits for the thread to finish with the genome file below.
+            block = await asyncio.shield(nextBlock)
+            if block is None:
+                break
+            HMMERIn.write(block.encode())
+            await HMMERIn.drain()
+        HMMERIn.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # hmmsearch exited early. Its exit status is checked by runHMMSearch.
+    finally:
+        if nextBlock is not None and not nextBlock.done():
+            await asyncio.wait([nextBlock])
+        inFile.close()
+
+
+# -------------------------------------------------------------------------------------------------
+# 6: Searches both strands of a genome with one hmmsearch run using the given number of cores. The genome is
+#    written to hmmsearch's stdin while its alignment is parsed straight from a pipe in a thread of the search's
+#    own, so the alignment is never held whole in memory. hmmsearch runs in its own process group which is killed
+#    if the search is cancelled (eg. when it times out). Returns a list of every 16S hit as FASTA.
+async def runHMMSearch(genome, HMMERDBFile, cpus):
+    loop = asyncio.get_running_loop()
+    readEnd, writeEnd = os.pipe()
+    alignmentHandle = open(readEnd, "r")
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "hmmsearch", "--acc", "--cpu", str(cpus), "-o", devnull, "-A", "/dev/stdout", HMMERDBFile, "-",
+            stdin=asyncio.subprocess.PIPE, stdout=writeEnd, start_new_session=True)
+    except BaseException:
+        alignmentHandle.close()
+        raise
+    finally:
+        os.close(writeEnd)  # hmmsearch holds the only write end, so the parse ends when it exits.
+
+    SixteenSSubunits = []
+    parser = ThreadPoolExecutor(max_workers=1)  # Not the shared executor, which the genome feeds rely on.
+    parse = loop.run_in_executor(parser, parseAlignment, alignmentHandle, SixteenSSubunits)
+    try:
+        await asyncio.gather(feedHMMSearch(genome, process.stdin), asyncio.shield(parse))
+        await process.wait()
+    finally:
+        if process.returncode is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass  # hmmsearch has already exited.
+            await process.wait()
+        await asyncio.wait([parse])  # The killed hmmsearch closes the pipe, so the thread finishes.
+        parser.shutdown()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, "hmmsearch")
+    return SixteenSSubunits
+
+
+# -------------------------------------------------------------------------------------------------
+# 7: Parses an hmmsearch alignment line by line from a pipe into a list of 16S hits, closing the pipe when done.
+def parseAlignment(alignmentHandle, SixteenSSubunits):
+    with alignmentHandle:
+        finder.add16SSequences(SixteenSSubunits, alignmentHandle)
+
+
+# -------------------------------------------------------------------------------------------------
+# 8: Picks the best 16S of a genome's hits and writes it to Found16SGenesHMM.fna (or the genome's accession to
+#    No16SGenomesHMM.txt). Returns the result ("found", "partial" or "none").
+def writeTop16S(genome, SixteenSSubunits):
+    accession = finder.getAccession(genome)
+    Top16S = finder.getTop16S(SixteenSSubunits) if SixteenSSubunits else None
+    if Top16S:
+        result = SixteenSWorker.makeResult("hmm", genome, accession, "found", finder.fastaHeaderSwap(Top16S, accession),
+                                           strand=finder.getStrand(Top16S))
+    else:
+        result = SixteenSWorker.makeResult("hmm", genome, accession, "partial" if SixteenSSubunits else "none")
+    SixteenSWorker.writeResult(result)
+    return result["result"]
+
+
+# -------------------------------------------------------------------------------------------------
+# 9: Runs hmmsearch on a batch of genomes within a budget of cores. Genomes are started largest first whenever
+#    cores are free, each with the cores given to it by allocateCPUs.
+class HMMBatchScheduler(object):
+    def __init__(self, HMMERDBFile, cpus, maxJobCPUs=8, retries=1, timeout=0):
+        self.HMMERDBFile = HMMERDBFile
+        self.cpus = cpus
+        self.maxJobCPUs = maxJobCPUs
+        self.retries = retries
+        self.timeout = timeout
+        self.freeCPUs = cpus
+        self.waiting = []  # [genome, size, attempts] lists, largest genome first.
+        self.failed = []
+        self.results = {}
+        self.busyCPUSeconds = 0.0  # Cores in use multiplied by the time they were in use.
+
+    # Searches the genomes. Returns the genomes that could not be searched.
+    async def run(self, genomes):
+        self.waiting = sorted([[genome, getGenomeSize(genome), 0] for genome in genomes], key=lambda job: -job[1])
+        running = set()
+        while self.waiting or running:
+            while self.waiting and self.freeCPUs > 0:
+                job = self.waiting.pop(0)
+                jobCPUs = allocateCPUs(job[1], self.freeCPUs, [waitingJob[1] for waitingJob in self.waiting],
+                                       self.maxJobCPUs)
+                self.freeCPUs -= jobCPUs
+                running.add(asyncio.ensure_future(self.runJob(job, jobCPUs)))
+            finished, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                task.result()  # Raises any unexpected error.
+        return self.failed
+
+    # Searches one genome and writes its result. A failed search goes back to the front of the queue until it has
+    # been retried self.retries times. The job's cores are given back when it finishes.
+    async def runJob(self, job, jobCPUs):
+        genome, size, attempts = job
+        print("Searching " + genome + " (" + "{0:.1f}".format(size / 1e6) + " Mb) with " + str(jobCPUs) +
+              " core(s)...")
+        startTime = time.time()
+        try:
+            search = runHMMSearch(genome, self.HMMERDBFile, jobCPUs)
+            SixteenSSubunits = await asyncio.wait_for(search, self.timeout) if self.timeout else await search
+            error = None
+        except asyncio.TimeoutError:
+            error = "timed out after " + str(self.timeout) + " seconds"
+        except (IOError, OSError, ValueError, subprocess.CalledProcessError) as searchError:
+            error = str(searchError)
+        finally:
+            seconds = time.time() - startTime
+            self.busyCPUSeconds += jobCPUs * seconds
+            self.freeCPUs += jobCPUs
+
+        if error is None:
+            result = writeTop16S(genome, SixteenSSubunits)
+            self.results[result] = self.results.get(result, 0) + 1
+            print("Searched " + genome + " in " + "{0:.1f}".format(seconds) + " seconds: " + result)
+        elif attempts < self.retries:
+            print("Search of " + genome + " failed (" + error + "). Retrying...")
+            self.waiting.insert(0, [genome, size, attempts + 1])
+        else:
+            print("Search of " + genome + " failed (" + error + ").")
+            self.failed.append(genome)
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    finder = SixteenSWorker.loadFinder("hmm")
+    if args.store:
+        try:
+            SixteenSWorker.store = SixteenSResultStore.ResultStore(args.store)
+        except SixteenSResultStore.StoreError:
+            print("Failed to open " + args.store)
+            exit(1)
+        atexit.register(SixteenSWorker.store.close)  # Writes any buffered results, even if the run is aborted.
+
+    for genome in args.genomes:
+        if not path.isfile(genome):
+            print("Failed to open " + genome)
+            exit(1)
+        if not genome.endswith(".fna") and not genome.endswith(".2bit"):  # File extension check
+            print("[Warning] " + genome + " may not be a nucleic acid fasta file!")
+    if not path.isfile(args.HMMERDBFile):
+        print("Failed to open " + args.HMMERDBFile)
+        exit(1)
+    SixteenSWorker.pressHMM(args.HMMERDBFile)
+
+    cpus = args.cpus if args.cpus > 0 else cpu_count()
+    scheduler = HMMBatchScheduler(args.HMMERDBFile, cpus, max(1, args.max_job_cpus), max(0, args.retries),
+                                  args.timeout)
+    print("Searching " + str(len(args.genomes)) + " genome(s) with " + str(cpus) + " core(s)...\n")
+    startTime = time.time()
+    failedGenomes = asyncio.run(scheduler.run(args.genomes))
+    wallSeconds = time.time() - startTime
+
+    print("\n" + str(sum(scheduler.results.values())) + " genome(s) searched in " + "{0:.1f}".format(wallSeconds) +
+          " seconds" + (" (" + ", ".join(str(count) + " " + result for result, count in sorted(scheduler.results.items())) +
+                        ")" if scheduler.results else "") + ".")
+    if wallSeconds > 0:
+        print("Cores in use " + "{0:.0f}".format(100 * scheduler.busyCPUSeconds / (cpus * wallSeconds)) +
+              "% of the time.")
+    if failedGenomes:
+        print(str(len(failedGenomes)) + " genome(s) could not be searched: " + ", ".join(failedGenomes))
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+    print("Done!")
@@ -1,71 +1,154 @@
-#!/usr/bin/env python 
-# Created by: Lee Bergstrand 
+#!/usr/bin/env python
+# Created by: Lee Bergstrand
 # Descript: A simple program that takes a RNA nucleotide stockholm file and returns a DNA FASTA file.
+#           The alignment is streamed block by block rather than loaded whole. Gaps are stripped and U is
+#           converted to T with a translation table. Sequence read from each block is held in a buffer that
+#           spills to a temporary file once it grows past a size limit, so memory stays bounded for very large
+#           alignments. Multiple Stockholm files can be converted in parallel. Also used by 16SHMMER.py to read
+#           hmmsearch alignments.
 #
-# Requirements: - This script requires the Biopython module: http://biopython.org/wiki/Download
-#     
-# Usage: getGenbankSeqs.py <sequences.sto> 
-# Example: getGenbankSeqs.py mySeqs.sto
+# Requirements: - None beyond the Python standard library.
+#
+# Usage: RNAStockholmToFASTA.py [--processes N] <sequences.sto> [sequences2.sto ...]
+# Example: RNAStockholmToFASTA.py mySeqs.sto
+# Example: RNAStockholmToFASTA.py --processes 4 *.sto
 # ----------------------------------------------------------------------------------------
 # ===========================================================================================================
 
 # Imports:
+import argparse
 import sys
+import tempfile
+from multiprocessing import Pool, cpu_count
 
-from Bio import SeqIO
+lineWidth = 60  # Same line width as Biopython's FASTA writer.
+spillSize = 64 * 1024 * 1024  # Bytes of alignment sequence held in memory before spilling to a temporary file.
+DNATable = str.maketrans("Uu", "Tt", "-.")  # Converts RNA to DNA and strips gap characters.
+proteinTable = str.maketrans("", "", "-.")  # Strips gap characters from protein alignments.
 
 
 # ===========================================================================================================
 # Functions:
 
 # 1: Checks if in proper number of arguments are passed gives instructions on proper use.
-def argsCheck(numArgs):
-    if len(sys.argv) < numArgs or len(sys.argv) > numArgs:
+def argsCheck():
+    if len(sys.argv) < 2:
         print("A simple program that takes a RNA nucleotide stockholm file and returns a DNA FASTA file.")
         print("By Lee Bergstrand\n")
-        print("Usage: " + sys.argv[0] + " <sequences.txt> [email@mail.com]")
-        print("Examples: " + sys.argv[0] + " mySeqs.txt JBro@YOLO.com\n")
+        print("Usage: " + sys.argv[0] + " [--processes N] <sequences.sto> [sequences2.sto ...]")
+        print("Examples: " + sys.argv[0] + " mySeqs.sto\n")
         exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
 
-
-# 2: Converts the sequence record object from an RNA Stockholm file to a DNA FASTA file.
-def getDNAFasta(SeqRecord):
-    SeqRecord.letter_annotations = {}  # Removes per letter annitations. Biopython throws an error if you try to
-    # reverse complement a sequence with per letter annotations (since afterward
-    # these annotations would no longer be valid). We strip these per letter
-    # annotions since they are not a part of the FASTA format anyways.
-    DNA = SeqRecord.seq.back_transcribe()
-    SeqRecord.seq = DNA
-    return SeqRecord.format("fasta")
+    parser = argparse.ArgumentParser(description="Converts RNA Stockholm alignments to degapped DNA FASTA files.")
+    parser.add_argument("StockholmFiles", nargs="+", help="The Stockholm files to convert.")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Number of Stockholm files to convert in parallel (default: 1, 0 for all cores).")
+    return parser.parse_args()
 
 
-# ===========================================================================================================
-# Main program code:
+# 2: Gets every sequence of an alignment from the spill buffer, in the order they first appeared.
+def getAlignmentRecords(names, descriptions, segments, buffer):
+    for name in names:
+        sequence = []
+        for offset, length in segments[name]:
+            buffer.seek(offset)
+            sequence.append(buffer.read(length))
+        header = ">" + name
+        if name in descriptions:
+            header += " " + descriptions[name]
+        yield header, b"".join(sequence).decode("ascii")
 
-# House keeping...
-argsCheck(2)  # Checks if the number of arguments are correct.
 
-# Stores file one for input checking.
-print(">> Opening Stockholm file...")
-inFile = sys.argv[1]
-outFile = inFile + ".fna"
+# 3: Reads the sequences of a (possibly interleaved, multi-alignment) Stockholm file one line at a time.
+#    Yields (FASTA header, degapped DNA sequence) tuples. Each alignment block's sequence lines are converted as
+#    they are read and appended to a buffer. Only the offsets of each sequence's pieces are kept in memory.
+#    Protein alignments can be read by passing proteinTable as the translation table.
+def readStockholmRecords(handle, translationTable=DNATable):
+    names = []  # Sequence names in the order they first appeared.
+    descriptions = {}
+    segments = {}  # Sequence name -> list of (offset, length) of its pieces in the buffer.
+    buffer = tempfile.SpooledTemporaryFile(max_size=spillSize, mode="w+b")
+    for line in handle:
+        if line.startswith("//"):  # End of an alignment.
+            for record in getAlignmentRecords(names, descriptions, segments, buffer):
+                yield record
+            names = []
+            descriptions = {}
+            segments = {}
+            buffer.close()
+            buffer = tempfile.SpooledTemporaryFile(max_size=spillSize, mode="w+b")
+        elif line.startswith("#=GS"):
+            fields = line.split(None, 3)
+            if len(fields) == 4 and fields[2] == "DE":
+                name = fields[1]
+                descriptions[name] = (descriptions[name] + " " if name in descriptions else "") + fields[3].strip()
+        elif line.startswith("#") or not line.strip():
+            continue  # Other mark up lines and block separators.
+        else:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            name = fields[0]
+            piece = "".join(fields[1:]).translate(translationTable).encode("ascii")
+            if name not in segments:
+                names.append(name)
+                segments[name] = []
+            buffer.seek(0, 2)
+            segments[name].append((buffer.tell(), len(piece)))
+            buffer.write(piece)
+    buffer.close()
 
-# File extension check
-if not inFile.endswith(".sto"):
-    print("[Warning] " + inFile + " may not be a Stockholm file!")
 
-try:
+# 4: Converts a Stockholm file to a degapped DNA FASTA file. Returns the number of sequences written.
+def convertFile(inFile, outFile):
+    recordCount = 0
+    handle = open(inFile, "r")
     writer = open(outFile, "w")
-    handle = open(inFile, "rU")
-    SeqRecords = SeqIO.parse(handle, "stockholm")
-    print(">> Converting to FASTA...")
-    for record in SeqRecords:
-        FASTA = getDNAFasta(record)
-        writer.write(FASTA)
+    for header, sequence in readStockholmRecords(handle):
+        writer.write(header + "\n")
+        writer.write("".join(sequence[i:i + lineWidth] + "\n" for i in range(0, len(sequence), lineWidth)))
+        recordCount += 1
     handle.close()
     writer.close()
-except IOError:
-    print("Failed to open " + inFile + " or " + outFile)
-    exit(1)
+    return recordCount
+
+
+# 5: Converts one Stockholm file in a worker process. Returns (file, sequences written, error).
+def convertWorker(inFile):
+    outFile = inFile + ".fna"
+    try:
+        return inFile, convertFile(inFile, outFile), None
+    except IOError:
+        return inFile, 0, "Failed to open " + inFile + " or " + outFile
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    # File extension check
+    for inFile in args.StockholmFiles:
+        if not inFile.endswith(".sto"):
+            print("[Warning] " + inFile + " may not be a Stockholm file!")
+
+    print(">> Converting to FASTA...")
+    processes = args.processes if args.processes > 0 else cpu_count()
+    if processes > 1 and len(args.StockholmFiles) > 1:
+        pool = Pool(min(processes, len(args.StockholmFiles)))
+        results = pool.imap(convertWorker, args.StockholmFiles)
+    else:
+        pool = None
+        results = map(convertWorker, args.StockholmFiles)
+
+    for inFile, recordCount, error in results:
+        if error:
+            print(error)
+            exit(1)
+        print(inFile + ": " + str(recordCount) + " sequences written to " + inFile + ".fna")
+    if pool:
+        pool.close()
+        pool.join()
 
-print(">> Done.")
+    print(">> Done.")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: A compact genome store using the UCSC .2bit format. Sequences are packed at 2 bits per base
+#              with side tables for runs of N (and other ambiguity codes, which are stored as N) and soft-masked
+#              (lower case) runs, plus an index of contig offsets. Stores are memory-mapped so coordinate slices
+#              and reverse complement views can be read without decoding whole genomes. 16SHMMER.py can search
+#              .2bit files directly.
+#
+# Requirements: - None beyond the Python standard library.
+#
+# Usage: TwoBitGenomeStore.py pack <Genome.fna> [Genome2.fna ...]
+#        TwoBitGenomeStore.py info <Genome.2bit>
+#        TwoBitGenomeStore.py slice <Genome.2bit> <Contig> <Start> <End> [+|-]
+# Example: TwoBitGenomeStore.py pack AUUJ00000000.fna
+# Example: TwoBitGenomeStore.py slice AUUJ00000000.2bit AUUJ01000001.1 1001 2500 -
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports & Setup:
+import argparse
+import bisect
+import mmap
+import re
+import struct
+import sys
+from os import path
+
+twoBitSignature = 0x1A412743
+bases = "TCAG"  # Bases in the order of their 2 bit codes.
+packTable = {}  # Four bases -> packed byte.
+unpackTable = []  # Packed byte -> four bases.
+for code in range(256):
+    quad = bases[code >> 6] + bases[(code >> 4) & 3] + bases[(code >> 2) & 3] + bases[code & 3]
+    packTable[quad] = code
+    unpackTable.append(quad)
+complementTable = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+ambiguousRegex = re.compile("[^ACGT]+")  # Runs stored in the N block table.
+maskRegex = re.compile("[a-z]+")  # Soft-masked runs stored in the mask block table.
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Checks if in proper number of arguments are passed gives instructions on proper use.
+def argsCheck():
+    if len(sys.argv) < 3:
+        print("2 Bit Genome Store")
+        print("By Lee Bergstrand\n")
+        print("Usage: " + sys.argv[0] + " pack <Genome.fna> [Genome2.fna ...]")
+        print("       " + sys.argv[0] + " info <Genome.2bit>")
+        print("       " + sys.argv[0] + " slice <Genome.2bit> <Contig> <Start> <End> [+|-]")
+        print("Examples: " + sys.argv[0] + " pack Genome.fna\n")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+
+    parser = argparse.ArgumentParser(description="Packs genomes into memory-mapped .2bit stores.")
+    commands = parser.add_subparsers(dest="command")
+    pack = commands.add_parser("pack", help="Pack FASTA genomes into .2bit files next to them.")
+    pack.add_argument("genomes", nargs="+")
+    info = commands.add_parser("info", help="List the contigs of a .2bit file.")
+    info.add_argument("store")
+    slicer = commands.add_parser("slice", help="Print a region (1-based, inclusive) of a contig as FASTA.")
+    slicer.add_argument("store")
+    slicer.add_argument("contig")
+    slicer.add_argument("start", type=int)
+    slicer.add_argument("end", type=int)
+    slicer.add_argument("strand", nargs="?", default="+", choices=["+", "-"])
+    return parser.parse_args()
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Reads a FASTA file one record at a time, yielding (contig name, sequence) tuples.
+def readFastaRecords(handle):
+    name = None
+    sequence = []
+    for line in handle:
+        line = line.strip()
+        if line.startswith(">"):
+            if name is not None:
+                yield name, "".join(sequence)
+            name = (line[1:].split() or [""])[0]
+            sequence = []
+        elif line:
+            sequence.append(line)
+    if name is not None:
+        yield name, "".join(sequence)
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: Gets the (starts, sizes) of every run matching a regular expression.
+def getBlocks(regex, sequence):
+    starts = []
+    sizes = []
+    for match in regex.finditer(sequence):
+        starts.append(match.start())
+        sizes.append(match.end() - match.start())
+    return starts, sizes
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Encodes a single sequence as a .2bit sequence record.
+def packSequence(sequence):
+    nStarts, nSizes = getBlocks(ambiguousRegex, sequence.upper())
+    maskStarts, maskSizes = getBlocks(maskRegex, sequence)
+    # Ambiguous bases are packed as T, as in UCSC's faToTwoBit. The N block table restores them when reading.
+    DNA = ambiguousRegex.sub(lambda match: "T" * len(match.group()), sequence.upper())
+    DNA += "T" * (-len(DNA) % 4)
+    packedDNA = bytearray(packTable[DNA[i:i + 4]] for i in range(0, len(DNA), 4))
+    header = struct.pack("<II", len(sequence), len(nStarts))
+    header += struct.pack("<" + str(len(nStarts) * 2) + "I", *(nStarts + nSizes))
+    header += struct.pack("<I", len(maskStarts))
+    header += struct.pack("<" + str(len(maskStarts) * 2) + "I", *(maskStarts + maskSizes))
+    header += struct.pack("<I", 0)
+    return header + bytes(packedDNA)
+
+
+# -------------------------------------------------------------------------------------------------
+# 5: Packs a FASTA genome into a .2bit file. The FASTA file is read twice (once for the contig names, which
+#    the index at the start of the file needs, and once to pack sequences) so only one contig is in memory.
+def packGenome(genome, storeFile):
+    inFile = open(genome, "r")
+    names = [name for name, sequence in readFastaRecords(inFile)]
+    inFile.seek(0)
+
+    # Version 1 of the format uses 64 bit offsets, which are only needed when the store could pass 4 GB.
+    # A packed record is never more than 17 bytes per base (with every base in its own N and mask block).
+    indexSize = sum(1 + len(name.encode("utf-8")) + 8 for name in names)
+    version = 0 if path.getsize(genome) * 17 + 16 + indexSize < 2 ** 32 else 1
+    offset = 16 + sum(1 + len(name.encode("utf-8")) + (8 if version == 1 else 4) for name in names)
+    offsets = []
+    outFile = open(storeFile, "wb")
+    outFile.write(b"\0" * offset)  # Placeholder for the header and index.
+    for name, sequence in readFastaRecords(inFile):
+        record = packSequence(sequence)
+        offsets.append(offset)
+        outFile.write(record)
+        offset += len(record)
+    inFile.close()
+
+    outFile.seek(0)
+    outFile.write(struct.pack("<IIII", twoBitSignature, version, len(names), 0))
+    for name, sequenceOffset in zip(names, offsets):
+        encodedName = name.encode("utf-8")
+        outFile.write(struct.pack("<B", len(encodedName)) + encodedName +
+                      struct.pack("<Q" if version == 1 else "<I", sequenceOffset))
+    outFile.close()
+
+
+# -------------------------------------------------------------------------------------------------
+# 6: A read only, memory-mapped view of a .2bit file. Contig records are only parsed when first used and
+#    sequence is decoded on demand, so slicing a region only touches the bytes that cover it.
+class TwoBitGenome(object):
+    def __init__(self, storeFile):
+        self.storeFile = storeFile
+        self.handle = open(storeFile, "rb")
+        self.data = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        signature = struct.unpack("<I", self.data[:4])[0]
+        if signature == twoBitSignature:
+            self.byteOrder = "<"
+        elif struct.unpack(">I", self.data[:4])[0] == twoBitSignature:
+            self.byteOrder = ">"
+        else:
+            raise ValueError(storeFile + " is not a .2bit file.")
+        version, sequenceCount = struct.unpack(self.byteOrder + "II", self.data[4:12])
+        offsetFormat = self.byteOrder + ("Q" if version == 1 else "I")
+        offsetSize = struct.calcsize(offsetFormat)
+
+        self.names = []
+        self.offsets = {}
+        self.records = {}  # Parsed record headers, keyed by contig name.
+        position = 16
+        for i in range(sequenceCount):
+            nameSize = self.data[position]
+            name = self.data[position + 1:position + 1 + nameSize].decode("utf-8")
+            position += 1 + nameSize
+            self.offsets[name] = struct.unpack(offsetFormat, self.data[position:position + offsetSize])[0]
+            self.names.append(name)
+            position += offsetSize
+
+    def close(self):
+        self.data.close()
+        self.handle.close()
+
+    # Parses a contig's record header. Returns (length, N block starts, N block sizes, packed DNA offset).
+    def getRecord(self, name):
+        if name not in self.records:
+            position = self.offsets[name]
+            length, nBlockCount = struct.unpack(self.byteOrder + "II", self.data[position:position + 8])
+            position += 8
+            blocks = struct.unpack(self.byteOrder + str(nBlockCount * 2) + "I",
+                                   self.data[position:position + nBlockCount * 8])
+            position += nBlockCount * 8
+            maskBlockCount = struct.unpack(self.byteOrder + "I", self.data[position:position + 4])[0]
+            position += 4 + maskBlockCount * 8 + 4  # Skips the mask blocks and the reserved word.
+            self.records[name] = (length, list(blocks[:nBlockCount]), list(blocks[nBlockCount:]), position)
+        return self.records[name]
+
+    def getLength(self, name):
+        return self.getRecord(name)[0]
+
+    # Gets a region of a contig (0-based, half open) as an upper case string. Negative strand regions are
+    # reverse complemented.
+    def getSlice(self, name, start, end, strand="+"):
+        length, nStarts, nSizes, DNAOffset = self.getRecord(name)
+        start = max(start, 0)
+        end = min(end, length)
+        if start >= end:
+            return ""
+        packed = self.data[DNAOffset + start // 4:DNAOffset + (end - 1) // 4 + 1]
+        firstBase = start % 4
+        sequence = "".join([unpackTable[byte] for byte in bytearray(packed)])[firstBase:firstBase + end - start]
+
+        # Restores any N runs overlapping the region.
+        blockIndex = max(bisect.bisect_right(nStarts, start) - 1, 0)
+        if nStarts and blockIndex < len(nStarts):
+            sequence = list(sequence)
+            while blockIndex < len(nStarts) and nStarts[blockIndex] < end:
+                blockStart = max(nStarts[blockIndex], start)
+                blockEnd = min(nStarts[blockIndex] + nSizes[blockIndex], end)
+                for i in range(blockStart, blockEnd):
+                    sequence[i - start] = "N"
+                blockIndex += 1
+            sequence = "".join(sequence)
+
+        if strand == "-":
+            sequence = sequence.translate(complementTable)[::-1]
+        return sequence
+
+    # Yields a whole contig in chunks. For the negative strand chunks are read from the end of the contig back
+    # towards its start, so the reverse complement is produced in order without decoding the whole contig.
+    def iterChunks(self, name, strand="+", chunkSize=1024 * 1024):
+        length = self.getLength(name)
+        if strand == "+":
+            for start in range(0, length, chunkSize):
+                yield self.getSlice(name, start, start + chunkSize)
+        else:
+            for end in range(length, 0, -chunkSize):
+                yield self.getSlice(name, end - chunkSize, end, "-")
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    if args.command == "pack":
+        for genome in args.genomes:
+            if not genome.endswith(".fna"):  # File extension check
+                print("[Warning] " + genome + " may not be a nucleic acid fasta file!")
+            storeFile = path.splitext(genome)[0] + ".2bit"
+            print(">> Packing " + genome + " into " + storeFile + "...")
+            try:
+                packGenome(genome, storeFile)
+            except IOError:
+                print("Failed to open " + genome + " or " + storeFile)
+                exit(1)
+        print(">> Done.")
+    else:
+        try:
+            store = TwoBitGenome(args.store)
+        except (IOError, ValueError) as error:
+            print("Failed to open " + args.store + ": " + str(error))
+            exit(1)
+        if args.command == "info":
+            for name in store.names:
+                print(name + "\t" + str(store.getLength(name)))
+        else:
+            if args.contig not in store.offsets:
+                print("No contig named " + args.contig + " in " + args.store)
+                exit(1)
+            region = store.getSlice(args.contig, args.start - 1, args.end, args.strand)
+            print(">" + args.contig + ":" + str(args.start) + "-" + str(args.end) + "(" + args.strand + ")")
+            for i in range(0, len(region), 60):
+                print(region[i:i + 60])
+        store.close()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: Extracts 16S genes from genomes by in-silico PCR. The 27F and 1492R primer binding sites are
+#              found on either strand and the amplicon between them is cut straight from the genome. Only
+#              amplicons within the usual 16S size range (1000 - 2000 B.P.) are accepted, and the longest is kept.
+#              This is used as a fast first tier by 16SBLAST.py and 16SHMMER.py (--amplicon-first) so that only
+#              genomes without intact primer sites go on to the much slower BLAST or HMM search.
+#
+# Requirements: - PrimerSearch16S.py (in the same directory).
+#
+# Usage: AmpliconExtract16S.py <Genome.fna> [Genome2.fna ...]
+# Example: AmpliconExtract16S.py *.fna
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports & Setup:
+import re
+import sys
+from os import path
+
+from PrimerSearch16S import parsePrimer, primers16S, readFastaRecordLines, reverseComplementPrimer
+
+forwardPrimer = "27F"
+reversePrimer = "1492R"
+tierTag = "tier=amplicon"  # Added to the FASTA headers of 16S genes found by this tier.
+complementTable = str.maketrans("ACGTURYKMBVDHSWNacgturykmbvdhswn", "TGCAAYRMKVBHDSWNtgcaayrmkvbhdswn")
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Checks if in proper number of arguments are passed gives instructions on proper use.
+def argsCheck():
+    if len(sys.argv) < 2:
+        print("16S Amplicon Extractor")
+        print("By Lee Bergstrand\n")
+        print("Usage: " + sys.argv[0] + " <Genome.fna> [Genome2.fna ...]")
+        print("Examples: " + sys.argv[0] + " Genome.fna\n")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Builds a regular expression matching a parsed primer. A lookahead is used so overlapping sites are found.
+def buildPrimerRegex(positions):
+    pattern = "".join("[" + "".join(sorted(bases)) + "]" if len(bases) > 1 else list(bases)[0] for bases in positions)
+    return re.compile("(?=" + pattern + ")")
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: Compiles forward and reverse complement regular expressions for the 27F and 1492R primers.
+def getPrimerRegexes():
+    primers = dict(primers16S)
+    forward = parsePrimer(primers[forwardPrimer])
+    reverse = parsePrimer(primers[reversePrimer])
+    return {"forward": (buildPrimerRegex(forward), len(forward)),
+            "forwardRC": (buildPrimerRegex(reverseComplementPrimer(forward)), len(forward)),
+            "reverse": (buildPrimerRegex(reverse), len(reverse)),
+            "reverseRC": (buildPrimerRegex(reverseComplementPrimer(reverse)), len(reverse))}
+
+
+primerRegexes = getPrimerRegexes()
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Gets the start positions (0-based) of every match of a primer regular expression.
+def findSites(regex, sequence):
+    return [match.start() for match in regex.finditer(sequence)]
+
+
+# -------------------------------------------------------------------------------------------------
+# 5: Finds the longest 16S sized amplicon in a contig. Returns (length, start, end, strand) with a 0-based
+#    half open start and end on the forward strand, or None if there is no amplicon.
+def findAmplicon(sequence):
+    sequence = sequence.upper()
+    bestAmplicon = None
+    forwardRegex, forwardLength = primerRegexes["forward"]
+    forwardRCRegex, forwardRCLength = primerRegexes["forwardRC"]
+    reverseRegex, reverseLength = primerRegexes["reverse"]
+    reverseRCRegex, reverseRCLength = primerRegexes["reverseRC"]
+
+    # Positive strand: 27F followed downstream by the reverse complement of 1492R.
+    # Negative strand: 1492R followed downstream by the reverse complement of 27F.
+    pairs = [(findSites(forwardRegex, sequence), findSites(reverseRCRegex, sequence), reverseRCLength, "+"),
+             (findSites(reverseRegex, sequence), findSites(forwardRCRegex, sequence), forwardRCLength, "-")]
+    for upstreamSites, downstreamSites, downstreamLength, strand in pairs:
+        for start in upstreamSites:
+            for downstreamStart in downstreamSites:
+                end = downstreamStart + downstreamLength
+                length = end - start
+                # 16S genes are around 1500 B.P. Below filters out partial sequence or really large sequences.
+                if 2000 > length > 1000:
+                    if bestAmplicon is None or length > bestAmplicon[0]:
+                        bestAmplicon = (length, start, end, strand)
+    return bestAmplicon
+
+
+# -------------------------------------------------------------------------------------------------
+# 6: Extracts the longest 16S amplicon from a genome FASTA file, in the 16S gene's orientation.
+#    Returns the amplicon's sequence or None if no amplicon was found. One contig is held in memory at a time.
+def extractAmplicon(genome):
+    bestAmplicon = None
+    bestSequence = None
+    inFile = open(genome, "r")
+    for contig, lines in readFastaRecordLines(inFile):
+        sequence = "".join(line.strip() for line in lines)
+        amplicon = findAmplicon(sequence)
+        if amplicon and (bestAmplicon is None or amplicon[0] > bestAmplicon[0]):
+            length, start, end, strand = amplicon
+            bestAmplicon = amplicon
+            bestSequence = sequence[start:end]
+            if strand == "-":
+                bestSequence = bestSequence.translate(complementTable)[::-1]
+    inFile.close()
+    return bestSequence
+
+
+# -------------------------------------------------------------------------------------------------
+# 7: Appends genome accession to a file that acts as a list of bad accessions.
+def appendBadGenomeList(genome):
+    global outfile
+    badAccession = path.split(genome)[1].strip(".fna")
+    try:
+        outfile = open("No16SGenomesAmplicon.txt", "a")
+        outfile.write(badAccession + "\n")
+        outfile.close()
+    except IOError:
+        print("Failed to open {0}".format(outfile))
+        exit(1)
+
+
+# -------------------------------------------------------------------------------------------------
+# 8: Adds SixteenS gene to a FASTA file.
+def write16SToFile(SixteenSGene):
+    global outfile
+    try:
+        outfile = open("Found16SGenesAmplicon.fna", "a")
+        outfile.write(SixteenSGene + "\n")
+        outfile.close()
+    except IOError:
+        print("Failed to open {0}".format(outfile))
+        exit(1)
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    argsCheck()  # Checks if the number of arguments are correct.
+
+    for genome in sys.argv[1:]:
+        print("Opening " + genome + "...")
+        if not genome.endswith(".fna"):  # File extension check
+            print("[Warning] " + genome + " may not be a nucleic acid fasta file!")
+        try:
+            amplicon = extractAmplicon(genome)
+        except IOError:
+            print("Failed to open " + genome)
+            exit(1)
+        if amplicon:
+            write16SToFile(">" + path.split(genome)[1].strip(".fna") + " " + tierTag + "\n" + amplicon)
+            print("Writing 16S amplicon to file.")
+        else:
+            appendBadGenomeList(genome)
+            print("No 16S amplicon found. Writing genome accession to No16SGenomesAmplicon.txt")
+    print("Done!\n")
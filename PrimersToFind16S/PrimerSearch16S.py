@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: Searches genomes for 16S rRNA primer binding sites. Every genome is scanned once for all
+#              primers at the same time using an Aho-Corasick automaton built from the primers (and their
+#              reverse complements). Matching continues across FASTA line breaks, both strands are searched,
+#              IUPAC degenerate bases (eg. [AC] or M) are supported and an optional mismatch budget can be given.
+#              Hits are written as TSV with the contig, position and strand of each binding site.
+#
+# Requirements: - None beyond the Python standard library.
+#
+# Usage: PrimerSearch16S.py [--mismatches N] [--processes N] [--primers <Primers.tsv>] [--output <Hits.tsv>]
+#                           <Genome.fna> [Genome2.fna ...]
+# Example: PrimerSearch16S.py --mismatches 1 --processes 4 *.fna
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports & Setup:
+import argparse
+import itertools
+import sys
+from multiprocessing import Pool, cpu_count
+from os import path
+
+# The 16S primers from runPrimerSearch16S.sh.
+primers16S = [("27F", "AGAGTTTGATC[AC]TGGCTCAG"),
+              ("1492R", "GGTTACCTTGTTACGACTT"),
+              ("907R", "CCGTCAATTC[AC]TTTGAGTTT"),
+              ("63F", "CAGGCCTAACACATGCAAGTC"),
+              ("357F", "CCTACGGGAGGCAGCAG"),
+              ("518R", "ATTACCGCGGCTGCTGG")]
+
+# Bases matched by each IUPAC nucleotide code.
+IUPACCodes = {"A": "A", "C": "C", "G": "G", "T": "T", "U": "T", "R": "AG", "Y": "CT", "S": "CG", "W": "AT",
+              "K": "GT", "M": "AC", "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG", "N": "ACGT"}
+complements = {"A": "T", "C": "G", "G": "C", "T": "A"}
+maxSegmentExpansions = 4096  # Limits how many concrete sequences a degenerate primer segment may expand into.
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Checks if in proper number of arguments are passed gives instructions on proper use.
+def argsCheck():
+    if len(sys.argv) < 2:
+        print("16S Primer Site Finder")
+        print("By Lee Bergstrand\n")
+        print("Please refer to source code for documentation\n")
+        print("Usage: " + sys.argv[0] + " [--mismatches N] [--processes N] <Genome.fna> [Genome2.fna ...]\n")
+        print("Examples: " + sys.argv[0] + " --mismatches 1 Genome.fna")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+
+    parser = argparse.ArgumentParser(description="Searches genomes for 16S rRNA primer binding sites.")
+    parser.add_argument("genomes", nargs="+", help="Genome FASTA files to search.")
+    parser.add_argument("--mismatches", type=int, default=0, help="Mismatches allowed per primer (default: 0).")
+    parser.add_argument("--processes", type=int, default=cpu_count(),
+                        help="Number of genomes searched in parallel (default: number of cores).")
+    parser.add_argument("--primers", help="TSV file of primer names and sequences (default: the 16S primers).")
+    parser.add_argument("--output", help="File to write the hits to (default: stdout).")
+    return parser.parse_args()
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Reads primers from a TSV file with a name and a sequence on each line.
+def readPrimers(primerFile):
+    primers = []
+    inFile = open(primerFile, "r")
+    for line in inFile:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            name, sequence = line.split("\t")[:2]
+            primers.append((name, sequence))
+    inFile.close()
+    return primers
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: Converts a primer sequence into a list of the bases allowed at each position. Both bracketed
+#    classes (eg. [AC]) and IUPAC codes (eg. M) are supported.
+def parsePrimer(sequence):
+    positions = []
+    sequence = sequence.upper()
+    i = 0
+    while i < len(sequence):
+        if sequence[i] == "[":
+            end = sequence.index("]", i)
+            bases = "".join(IUPACCodes[code] for code in sequence[i + 1:end])
+            i = end + 1
+        else:
+            bases = IUPACCodes[sequence[i]]
+            i += 1
+        positions.append(frozenset(bases))
+    return positions
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Gets the reverse complement of a parsed primer.
+def reverseComplementPrimer(positions):
+    return [frozenset(complements[base] for base in bases) for bases in reversed(positions)]
+
+
+# -------------------------------------------------------------------------------------------------
+# 5: A multi-pattern primer matcher built on an Aho-Corasick automaton.
+#    Each primer (and its reverse complement) is split into mismatches + 1 segments. Any site within the
+#    mismatch budget must match at least one segment exactly (pigeonhole principle), so the automaton only
+#    has to find exact segment matches. These seed candidate sites which are then verified base by base.
+class PrimerAutomaton(object):
+    def __init__(self, primers, mismatches=0):
+        self.mismatches = mismatches
+        self.patterns = []  # (primer name, strand, allowed bases per position)
+        for name, sequence in primers:
+            positions = parsePrimer(sequence)
+            if len(positions) <= mismatches:
+                raise ValueError("Primer " + name + " is too short for " + str(mismatches) + " mismatches.")
+            self.patterns.append((name, "+", positions))
+            self.patterns.append((name, "-", reverseComplementPrimer(positions)))
+        self.maxLength = max(len(pattern[2]) for pattern in self.patterns)
+        self.buildAutomaton()
+
+    # Builds the trie of segments, then resolves failure links into a full transition table.
+    def buildAutomaton(self):
+        transitions = [{}]
+        outputs = [[]]  # (pattern index, offset of the segment end within the pattern) per state.
+        for patternIndex, (name, strand, positions) in enumerate(self.patterns):
+            segmentCount = self.mismatches + 1
+            segmentLength = len(positions) // segmentCount
+            for segment in range(segmentCount):
+                start = segment * segmentLength
+                end = len(positions) if segment == segmentCount - 1 else start + segmentLength
+                expansions = 1
+                for bases in positions[start:end]:
+                    expansions *= len(bases)
+                if expansions > maxSegmentExpansions:
+                    raise ValueError("Primer " + name + " is too degenerate to search for.")
+                for word in itertools.product(*[sorted(bases) for bases in positions[start:end]]):
+                    state = 0
+                    for base in word:
+                        if base not in transitions[state]:
+                            transitions.append({})
+                            outputs.append([])
+                            transitions[state][base] = len(transitions) - 1
+                        state = transitions[state][base]
+                    outputs[state].append((patternIndex, end))
+
+        # Breadth first pass to fill in failure transitions so that every state has a move for every base.
+        failure = [0] * len(transitions)
+        queue = []
+        for base in "ACGT":
+            if base in transitions[0]:
+                queue.append(transitions[0][base])
+            else:
+                transitions[0][base] = 0
+        while queue:
+            nextQueue = []
+            for state in queue:
+                outputs[state] = outputs[state] + outputs[failure[state]]
+                for base in "ACGT":
+                    if base in transitions[state]:
+                        child = transitions[state][base]
+                        failure[child] = transitions[failure[state]][base]
+                        nextQueue.append(child)
+                    else:
+                        transitions[state][base] = transitions[failure[state]][base]
+            queue = nextQueue
+        self.transitions = transitions
+        self.outputs = outputs
+
+    # Counts the mismatches between a pattern and a piece of sequence of the same length.
+    def countMismatches(self, positions, sequence):
+        mismatches = 0
+        for bases, base in zip(positions, sequence):
+            if base not in bases:
+                mismatches += 1
+                if mismatches > self.mismatches:
+                    break
+        return mismatches
+
+    # Scans a single contig given as an iterable of sequence chunks (eg. the lines of a FASTA record).
+    # Yields (primer name, strand, start, end, mismatches, matched sequence) for each binding site.
+    # Positions are 1-based and inclusive on the forward strand. Matched sequences are given in the
+    # primer's orientation. Any base other than A, C, G or T breaks a match.
+    def scan(self, chunks):
+        transitions = self.transitions
+        outputs = self.outputs
+        pending = {}  # Candidate sites keyed by the position of their last base.
+        state = 0
+        position = -1  # 0-based position of the current base in the contig.
+        tail = ""  # Last bases of the previous chunk so sites that span chunks can be verified.
+        for chunk in chunks:
+            chunk = chunk.strip().upper()
+            text = tail + chunk
+            offset = len(tail) - position - 1  # Converts contig positions into indexes of text.
+            for base in chunk:
+                position += 1
+                state = transitions[state].get(base, 0)
+                for patternIndex, segmentEnd in outputs[state]:
+                    patternLength = len(self.patterns[patternIndex][2])
+                    siteEnd = position + patternLength - segmentEnd
+                    if position - segmentEnd + 1 >= 0:
+                        pending.setdefault(siteEnd, set()).add(patternIndex)
+                if pending and position in pending:
+                    for patternIndex in sorted(pending.pop(position)):
+                        name, strand, positions = self.patterns[patternIndex]
+                        siteStart = position - len(positions) + 1
+                        site = text[siteStart + offset:position + offset + 1]
+                        mismatches = self.countMismatches(positions, site)
+                        if mismatches <= self.mismatches:
+                            if strand == "-":
+                                site = "".join(complements.get(base, "N") for base in reversed(site))
+                            yield name, strand, siteStart + 1, position + 1, mismatches, site
+            tail = text[-self.maxLength:]
+
+
+# -------------------------------------------------------------------------------------------------
+# 6: Reads a FASTA file one record at a time, yielding each contig's name and an iterator over its sequence
+#    lines. Contigs are never joined into a single string.
+def readFastaRecordLines(handle):
+    recordNumber = [0]
+
+    def getRecordNumber(line):
+        if line.startswith(">"):
+            recordNumber[0] += 1
+        return recordNumber[0]
+
+    for number, lines in itertools.groupby(handle, getRecordNumber):
+        header = next(lines)
+        if header.startswith(">"):  # Skips any text before the first record.
+            yield (header[1:].split() or [""])[0], lines
+
+
+# -------------------------------------------------------------------------------------------------
+# 7: Searches a genome for primer binding sites. Returns a list of hits as TSV rows.
+def searchGenome(genome, automaton):
+    hits = []
+    genomeName = path.split(genome)[1]
+    inFile = open(genome, "r")
+    for contig, lines in readFastaRecordLines(inFile):
+        for name, strand, start, end, mismatches, site in automaton.scan(lines):
+            hits.append([genomeName, contig, name, strand, str(start), str(end), str(mismatches), site])
+    inFile.close()
+    return hits
+
+
+# -------------------------------------------------------------------------------------------------
+# 8: Worker process setup and entry point for searching genomes across a process pool. The automaton is
+#    built once per worker rather than once per genome.
+workerAutomaton = None
+
+
+def initWorker(primers, mismatches):
+    global workerAutomaton
+    workerAutomaton = PrimerAutomaton(primers, mismatches)
+
+
+def searchGenomeWorker(genome):
+    try:
+        return genome, searchGenome(genome, workerAutomaton)
+    except IOError:
+        return genome, None
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    primers = primers16S
+    if args.primers:
+        try:
+            primers = readPrimers(args.primers)
+        except IOError:
+            print("Failed to open " + args.primers)
+            exit(1)
+
+    try:
+        PrimerAutomaton(primers, args.mismatches)  # Checks the primers are usable before starting any workers.
+    except (KeyError, ValueError) as error:
+        print("Invalid primers: " + str(error))
+        exit(1)
+
+    for genome in args.genomes:
+        if not genome.endswith(".fna"):  # File extension check
+            print("[Warning] " + genome + " may not be a nucleic acid fasta file!")
+
+    try:
+        writer = open(args.output, "w") if args.output else sys.stdout
+    except IOError:
+        print("Failed to open " + args.output)
+        exit(1)
+    writer.write("\t".join(["Genome", "Contig", "Primer", "Strand", "Start", "End", "Mismatches", "Sequence"]) + "\n")
+
+    failedGenomes = []
+    processes = max(1, min(args.processes, len(args.genomes)))
+    pool = Pool(processes, initWorker, (primers, args.mismatches))
+    for genome, hits in pool.imap(searchGenomeWorker, args.genomes):
+        if hits is None:
+            failedGenomes.append(genome)
+            continue
+        for hit in hits:
+            writer.write("\t".join(hit) + "\n")
+    pool.close()
+    pool.join()
+    if writer is not sys.stdout:
+        writer.close()
+
+    for genome in failedGenomes:
+        sys.stderr.write("Failed to open " + genome + "\n")
+    if failedGenomes:
+        exit(1)
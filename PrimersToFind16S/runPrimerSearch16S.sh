@@ -1,21 +1,9 @@
 #!/usr/bin/env bash
 # A simple script for searching for 16S primer sites within a genome.
+# Searches for the 27F, 1492R, 907R, 63F, 357F and 518R primers on both strands of every genome passed
+# using PrimerSearch16S.py, which scans each genome once for all of the primers.
 
-for fasta;
-do
-	echo "Searching for primer hits in $fasta"
-	echo "	Searching for the 27F Bacteria 16S rRNA Primer..."
-	grep "AGAGTTTGATC[AC]TGGCTCAG" ${fasta}
-	echo "	Searching for the 1492R Bacteria 16S rRNA Primer..."
-	grep "GGTTACCTTGTTACGACTT" ${fasta}
-	echo "	Searching for the 907R Bacteria 16S rRNA Primer..."
-	grep "CCGTCAATTC[AC]TTTGAGTTT" ${fasta}
-	echo "	Searching for the 63F Bacteria 16S rRNA Primer..."
-	grep "CAGGCCTAACACATGCAAGTC" ${fasta}
-	echo "	Searching for the 357F Bacteria 16S rRNA Primer..."
-	grep "CCTACGGGAGGCAGCAG" ${fasta}
-	echo "	Searching for the 518R Universal 16S rRNA Primer..."
-	grep "ATTACCGCGGCTGCTGG" ${fasta}
-	done
+echo "Searching for primer hits in $# genome file(s)"
+python "$(dirname "$0")/PrimerSearch16S.py" "$@"
 echo All files searched.
 exit 0
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: Builds a quick-look neighbor-joining tree from 16S genes (eg. Found16SGenesHMM.fna or
+#              Found16SGenesBLAST.fna) without a multiple sequence alignment. Each sequence is reduced to a
+#              MinHash sketch of its canonical k-mers, and pairwise Mash distances are computed from the
+#              sketches with NumPy, one block of the matrix at a time. The matrix is kept in a memory-mapped
+#              file so it never has to fit in RAM at once. The tree is joined with RapidNJ-style bounded
+#              searches of sorted distance rows, which take twice the matrix's space (in RAM or in scratch
+#              files, see --memory). Tens of thousands of sequences take minutes rather than hours, though
+#              the matrix grows with the square of the count (20,000 sequences need 1.6 GB, 4.8 GB in all).
+#              The tree is written as Newick, which NewickToPhyloXML.py can convert to PhyloXML.
+#
+# Requirements: - This script requires the NumPy module: http://www.numpy.org
+#
+# Usage: KmerDistanceTree.py [--kmer-size K] [--sketch-size S] [--matrix Matrix.dist] [--output Tree.nwk]
+#                            <16SGenes.fna>
+# Example: KmerDistanceTree.py Found16SGenesHMM.fna
+# Example: KmerDistanceTree.py --kmer-size 12 --sketch-size 256 --output 16STree.nwk Found16SGenesBLAST.fna
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports:
+import argparse
+import os
+import sys
+import tempfile
+from os import path
+
+import numpy as np
+
+# Maps bases to 2 bit codes. Anything other than A, C, G, T (or U) maps to 4, which breaks k-mers.
+baseCodes = np.full(256, 4, dtype=np.uint8)
+for base, code in zip(b"ACGTU", [0, 1, 2, 3, 3]):
+    baseCodes[base] = code
+    baseCodes[ord(chr(base).lower())] = code
+newickSpecialCharacters = set("()[]':;, \t")
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Checks if in proper number of arguments are passed gives instructions on proper use.
+def argsCheck():
+    if len(sys.argv) < 2:
+        print("K-mer Distance Tree Builder")
+        print("By Lee Bergstrand\n")
+        print("Usage: " + sys.argv[0] + " [--kmer-size K] [--sketch-size S] [--output Tree.nwk] <16SGenes.fna>")
+        print("Examples: " + sys.argv[0] + " Found16SGenesHMM.fna\n")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+
+    parser = argparse.ArgumentParser(description="Builds a neighbor-joining tree from k-mer distances.")
+    parser.add_argument("sequences", help="FASTA file of 16S genes.")
+    parser.add_argument("--kmer-size", type=int, default=16, help="K-mer length, up to 31 (default: 16).")
+    parser.add_argument("--sketch-size", type=int, default=128,
+                        help="Number of MinHash values per sequence (default: 128).")
+    parser.add_argument("--block-size", type=int, default=256,
+                        help="Sequences per block when computing distances (default: 256).")
+    parser.add_argument("--memory", type=int, default=2048,
+                        help="Megabytes of RAM tree building may use: three times the size of the distance matrix "
+                             "(the matrix and its sorted rows). Larger jobs are joined from memory-mapped scratch "
+                             "files beside the output (default: 2048).")
+    parser.add_argument("--matrix", metavar="Matrix.dist",
+                        help="Keep the distance matrix (float32, one row per sequence) in this file.")
+    parser.add_argument("--output", metavar="Tree.nwk", help="Newick output file (default: <16SGenes>.nwk).")
+    args = parser.parse_args()
+    if not 0 < args.kmer_size < 32:
+        parser.error("--kmer-size must be between 1 and 31.")
+    return args
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Reads a FASTA file one record at a time, yielding (sequence name, sequence) tuples.
+def readFastaRecords(handle):
+    name = None
+    sequence = []
+    for line in handle:
+        line = line.strip()
+        if line.startswith(">"):
+            if name is not None:
+                yield name, "".join(sequence)
+            name = (line[1:].split() or [""])[0]
+            sequence = []
+        elif line:
+            sequence.append(line)
+    if name is not None:
+        yield name, "".join(sequence)
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: Gets the canonical (smaller of the forward and reverse complement) 2 bit encoding of every k-mer in a
+#    sequence. K-mers containing ambiguous bases are skipped.
+def getCanonicalKmers(sequence, k):
+    codes = baseCodes[np.frombuffer(sequence.encode("ascii", "replace"), dtype=np.uint8)]
+    kmerCount = len(codes) - k + 1
+    if kmerCount < 1:
+        return np.zeros(0, dtype=np.uint64)
+    # Counts ambiguous bases so k-mers that contain one can be dropped.
+    ambiguous = np.concatenate(([0], np.cumsum(codes == 4)))
+    valid = (ambiguous[k:] - ambiguous[:kmerCount]) == 0
+    codes = np.where(codes == 4, 0, codes).astype(np.uint64)
+
+    forward = np.zeros(kmerCount, dtype=np.uint64)
+    reverse = np.zeros(kmerCount, dtype=np.uint64)
+    for offset in range(k):
+        window = codes[offset:offset + kmerCount]
+        forward = (forward << np.uint64(2)) | window
+        reverse |= (np.uint64(3) - window) << np.uint64(2 * offset)
+    return np.unique(np.minimum(forward, reverse)[valid])
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Gets the MinHash sketch of a set of k-mers: the smallest value of each of several hash functions.
+#    The hash functions are multiply-add hashes mixed with a xorshift, all wrapping at 64 bits.
+def getSketch(kmers, multipliers, increments):
+    hashes = kmers[:, None] * multipliers[None, :] + increments[None, :]
+    hashes ^= hashes >> np.uint64(29)
+    hashes *= np.uint64(0xBF58476D1CE4E5B9)
+    hashes ^= hashes >> np.uint64(32)
+    return hashes.min(axis=0)
+
+
+# -------------------------------------------------------------------------------------------------
+# 5: Sketches every sequence in a FASTA file. Returns (names, sketches), skipping sequences with no k-mers.
+def sketchSequences(FASTAFile, k, sketchSize):
+    random = np.random.RandomState(16)  # Fixed seed so sketches are the same from run to run.
+    multipliers = random.randint(1, 2 ** 62, size=sketchSize, dtype=np.int64).astype(np.uint64) * np.uint64(2) + \
+        np.uint64(1)
+    increments = random.randint(0, 2 ** 62, size=sketchSize, dtype=np.int64).astype(np.uint64)
+    names = []
+    sketches = []
+    inFile = open(FASTAFile, "r")
+    for name, sequence in readFastaRecords(inFile):
+        kmers = getCanonicalKmers(sequence, k)
+        if len(kmers) == 0:
+            print("[Warning] " + name + " has no complete k-mers and was left out of the tree.")
+            continue
+        names.append(name)
+        sketches.append(getSketch(kmers, multipliers, increments))
+    inFile.close()
+    return names, np.array(sketches, dtype=np.uint64).reshape(len(sketches), sketchSize)
+
+
+# -------------------------------------------------------------------------------------------------
+# 6: Converts estimated Jaccard similarities to Mash distances, capped at 1.
+def getMashDistances(jaccard, k):
+    with np.errstate(divide="ignore"):
+        distances = -np.log(2 * jaccard / (1 + jaccard)) / k
+    return np.minimum(distances, 1.0)
+
+
+# -------------------------------------------------------------------------------------------------
+# 7: Fills a (memory-mapped) distance matrix from the sketches one block at a time. Only the upper triangle of
+#    blocks is computed. Each is mirrored into the lower triangle.
+def fillDistanceMatrix(matrix, sketches, k, blockSize):
+    sequenceCount = len(sketches)
+    for rowStart in range(0, sequenceCount, blockSize):
+        rowSketches = sketches[rowStart:rowStart + blockSize]
+        rowEnd = rowStart + len(rowSketches)
+        for columnStart in range(rowStart, sequenceCount, blockSize):
+            columnSketches = sketches[columnStart:columnStart + blockSize]
+            columnEnd = columnStart + len(columnSketches)
+            jaccard = (rowSketches[:, None, :] == columnSketches[None, :, :]).mean(axis=2)
+            block = getMashDistances(jaccard, k).astype(np.float32)
+            matrix[rowStart:rowEnd, columnStart:columnEnd] = block
+            matrix[columnStart:columnEnd, rowStart:rowEnd] = block.T
+    for i in range(sequenceCount):
+        matrix[i, i] = 0.0
+
+
+# -------------------------------------------------------------------------------------------------
+# 8: Finds the pair of active nodes with the smallest neighbor-joining Q value, as in RapidNJ. Each row's
+#    distances are kept sorted, so (activeCount - 2) * distance - row sum - largest row sum bounds the Q value of
+#    every later entry of the row from below. The rows are searched one sorted column at a time and each row is
+#    dropped once its bound reaches the best Q value found, so usually only the first few entries of each row are
+#    read. Entries for nodes that have since been joined are skipped.
+def findClosestPair(sortedDistances, sortedNodes, rowLengths, slotOfNode, rowSums, activeCount):
+    largestRowSum = np.max(rowSums[:activeCount])
+    best = (np.inf, 0, 1)
+    rows = np.arange(activeCount)
+    column = 0
+    while len(rows):
+        rows = rows[rowLengths[rows] > column]
+        distances = sortedDistances[rows, column].astype(np.float64)
+        keep = (activeCount - 2) * distances - rowSums[rows] - largestRowSum < best[0]
+        rows = rows[keep]
+        distances = distances[keep]
+        otherSlots = slotOfNode[sortedNodes[rows, column]]
+        active = otherSlots >= 0
+        if np.any(active):
+            Q = (activeCount - 2) * distances[active] - rowSums[rows[active]] - rowSums[otherSlots[active]]
+            bestEntry = int(np.argmin(Q))
+            if Q[bestEntry] < best[0]:
+                best = (Q[bestEntry], int(rows[active][bestEntry]), int(otherSlots[active][bestEntry]))
+        column += 1
+    return best[1], best[2]
+
+
+# -------------------------------------------------------------------------------------------------
+# 9: Builds a neighbor-joining tree from a distance matrix, which is overwritten. Active nodes are kept in the
+#    first rows and columns of the matrix: a joined pair is replaced by their parent in one slot and the last
+#    active node is moved into the other. Each slot also has its row of distances sorted (with the node each
+#    distance is to) for findClosestPair. A new node's sorted row holds every node active when it was made, so each
+#    pair of active nodes is in the sorted row of at least one of them. The sorted rows go in sortedDistances
+#    (float32) and sortedNodes (int32), which are the same shape as the matrix and may be memory-mapped. Returns a
+#    list of each internal node's [(child, branch length), ...]. Nodes 0 to n - 1 are the sequences and internal
+#    node i is node n + i. The last internal node is the root.
+def neighborJoin(matrix, sortedDistances, sortedNodes):
+    sequenceCount = len(matrix)
+    slots = np.arange(sequenceCount)  # Node held in each slot of the matrix.
+    slotOfNode = np.full(2 * sequenceCount, -1, dtype=np.int64)  # Slot of each node, or -1 once it is joined.
+    slotOfNode[:sequenceCount] = slots
+    children = []
+    rowSums = np.zeros(sequenceCount, dtype=np.float64)
+    rowLengths = np.zeros(sequenceCount, dtype=np.int64)  # Entries in use in each sorted row.
+    for row in range(sequenceCount):
+        rowValues = np.asarray(matrix[row, :], dtype=np.float64)
+        rowSums[row] = np.sum(rowValues)
+        rowValues[row] = np.inf
+        order = np.argsort(rowValues, kind="stable")[:sequenceCount - 1]
+        sortedDistances[row, :sequenceCount - 1] = rowValues[order]
+        sortedNodes[row, :sequenceCount - 1] = order
+        rowLengths[row] = sequenceCount - 1
+
+    activeCount = sequenceCount
+    while activeCount > 3:
+        i, j = sorted(findClosestPair(sortedDistances, sortedNodes, rowLengths, slotOfNode, rowSums, activeCount))
+        distance = float(matrix[i, j])
+        branchLengthI = 0.5 * (distance + (rowSums[i] - rowSums[j]) / (activeCount - 2))
+        branchLengthJ = distance - branchLengthI
+        children.append([(int(slots[i]), max(branchLengthI, 0.0)), (int(slots[j]), max(branchLengthJ, 0.0))])
+
+        rowI = np.asarray(matrix[i, :activeCount], dtype=np.float64)
+        rowJ = np.asarray(matrix[j, :activeCount], dtype=np.float64)
+        newRow = 0.5 * (rowI + rowJ - distance)
+        newRow[i] = 0.0
+        newRow[j] = 0.0
+        rowSums[:activeCount] += newRow - rowI - rowJ
+        rowSums[i] = newRow.sum()
+        matrix[i, :activeCount] = newRow
+        matrix[:activeCount, i] = newRow
+        slotOfNode[slots[i]] = -1
+        slotOfNode[slots[j]] = -1
+        slots[i] = sequenceCount + len(children) - 1
+        slotOfNode[slots[i]] = i
+
+        # The new node's sorted row holds its distances (as stored) to every other active node.
+        storedRow = np.asarray(matrix[i, :activeCount], dtype=np.float64)
+        storedRow[[i, j]] = np.inf
+        order = np.argsort(storedRow, kind="stable")[:activeCount - 2]
+        sortedDistances[i, :activeCount - 2] = storedRow[order]
+        sortedNodes[i, :activeCount - 2] = slots[order]
+        rowLengths[i] = activeCount - 2
+
+        last = activeCount - 1
+        if j != last:
+            matrix[j, :activeCount] = matrix[last, :activeCount]
+            matrix[:activeCount, j] = matrix[:activeCount, last]
+            matrix[j, j] = 0.0
+            rowSums[j] = rowSums[last]
+            slots[j] = slots[last]
+            slotOfNode[slots[j]] = j
+            sortedDistances[j, :rowLengths[last]] = sortedDistances[last, :rowLengths[last]]
+            sortedNodes[j, :rowLengths[last]] = sortedNodes[last, :rowLengths[last]]
+            rowLengths[j] = rowLengths[last]
+        activeCount -= 1
+
+    # The last two or three nodes are joined at the root.
+    if activeCount == 3:
+        ab, ac, bc = float(matrix[0, 1]), float(matrix[0, 2]), float(matrix[1, 2])
+        lengths = [0.5 * (ab + ac - bc), 0.5 * (ab + bc - ac), 0.5 * (ac + bc - ab)]
+    elif activeCount == 2:
+        lengths = [0.5 * float(matrix[0, 1])] * 2
+    else:
+        lengths = [0.0]
+    children.append([(int(slots[slot]), max(lengths[slot], 0.0)) for slot in range(activeCount)])
+    return children
+
+
+# -------------------------------------------------------------------------------------------------
+# 10: Formats a sequence name as a Newick label, quoting it if needed.
+def formatNewickName(name):
+    if any(character in newickSpecialCharacters for character in name):
+        return "'" + name.replace("'", "''") + "'"
+    return name
+
+
+# -------------------------------------------------------------------------------------------------
+# 11: Writes a tree as Newick. An explicit stack is used rather than recursion so deep trees can be written.
+def writeNewick(outFile, names, children):
+    writer = open(outFile, "w")
+    stack = [";\n", len(names) + len(children) - 1]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            writer.write(item)
+        elif item < len(names):
+            writer.write(formatNewickName(names[item]))
+        else:
+            parts = ["("]
+            for index, (child, branchLength) in enumerate(children[item - len(names)]):
+                if index:
+                    parts.append(",")
+                parts.append(child)
+                parts.append(":" + "{0:.6g}".format(branchLength))
+            parts.append(")")
+            stack.extend(reversed(parts))
+    writer.close()
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    FASTAFile = args.sequences
+    outFile = args.output or path.splitext(FASTAFile)[0] + ".nwk"
+    if not FASTAFile.endswith(".fna"):  # File extension check
+        print("[Warning] " + FASTAFile + " may not be a nucleic acid fasta file!")
+
+    print(">> Sketching " + FASTAFile + "...")
+    try:
+        names, sketches = sketchSequences(FASTAFile, args.kmer_size, args.sketch_size)
+    except IOError:
+        print("Failed to open " + FASTAFile)
+        exit(1)
+    if not names:
+        print("No sequences to build a tree from.")
+        exit(1)
+
+    print(">> Computing distances between " + str(len(names)) + " sequences...")
+    scratchDirectory = path.dirname(path.abspath(outFile))
+    scratchFiles = []
+    if args.matrix:
+        matrixFile = args.matrix
+    else:
+        matrixHandle, matrixFile = tempfile.mkstemp(suffix=".dist", dir=scratchDirectory)
+        os.close(matrixHandle)
+        scratchFiles.append(matrixFile)
+    try:
+        matrix = np.memmap(matrixFile, dtype=np.float32, mode="w+", shape=(len(names), len(names)))
+        fillDistanceMatrix(matrix, sketches, args.kmer_size, args.block_size)
+        matrix.flush()
+
+        print(">> Building neighbor-joining tree...")
+        # Joining needs the matrix plus its sorted rows, which take twice its size.
+        if 3 * matrix.nbytes <= args.memory * 1024 * 1024:
+            workingMatrix = np.array(matrix)  # Small enough to join in RAM.
+            sortedDistances = np.empty(matrix.shape, dtype=np.float32)
+            sortedNodes = np.empty(matrix.shape, dtype=np.int32)
+        elif args.matrix:
+            # Joining overwrites the matrix, so a kept matrix is copied to a scratch file first.
+            scratchHandle, scratchFile = tempfile.mkstemp(suffix=".dist", dir=scratchDirectory)
+            os.close(scratchHandle)
+            scratchFiles.append(scratchFile)
+            workingMatrix = np.memmap(scratchFile, dtype=np.float32, mode="w+", shape=matrix.shape)
+            workingMatrix[:] = matrix
+        else:
+            workingMatrix = matrix  # The temporary matrix is joined in place.
+        if 3 * matrix.nbytes > args.memory * 1024 * 1024:
+            sortedArrays = []
+            for dtype in (np.float32, np.int32):
+                scratchHandle, scratchFile = tempfile.mkstemp(suffix=".sorted", dir=scratchDirectory)
+                os.close(scratchHandle)
+                scratchFiles.append(scratchFile)
+                sortedArrays.append(np.memmap(scratchFile, dtype=dtype, mode="w+", shape=matrix.shape))
+            sortedDistances, sortedNodes = sortedArrays
+        children = neighborJoin(workingMatrix, sortedDistances, sortedNodes)
+        del workingMatrix, matrix, sortedDistances, sortedNodes
+    finally:
+        for scratchFile in scratchFiles:
+            if path.exists(scratchFile):
+                os.remove(scratchFile)
+
+    try:
+        writeNewick(outFile, names, children)
+    except IOError:
+        print("Failed to open " + outFile)
+        exit(1)
+    print(">> Tree written to " + outFile)
+    print(">> Done.")
@@ -1,56 +1,286 @@
 #!/usr/bin/env python
 
 # ----------------------------------------------------------------------------------------
-# Created by: Lee Bergstrand 
+# Created by: Lee Bergstrand
 # Description: A simple program that converts Newick phylogenetic tree format to the newer PhyloXML format.
+#              Trees are converted without building them in memory. The Newick file is tokenized in chunks and
+#              PhyloXML is written as it is parsed, using an explicit stack rather than recursion so very large
+#              or deep trees can be converted. As Newick gives an internal node's label and branch length after
+#              its children, a first pass stores these in a compact table. Numeric internal node labels are
+#              written as confidence values, as Biopython does. Clades are indented up to a depth of
+#              maxIndentDepth and written flush beyond it, so the output of very deep trees grows in proportion to
+#              their size rather than to the square of their depth. Directories of .nwk files can be converted in
+#              parallel.
 #
-# Requirements: - This script requires the Biopython module: http://biopython.org/wiki/Download
+# Requirements: - None beyond the Python standard library.
 #
-# Usage: NewickToPhyloXML.py <PhyloTree.nwk>
+# Usage: NewickToPhyloXML.py [--processes N] <PhyloTree.nwk | TreeDirectory> [PhyloTree2.nwk ...]
 # Example: NewickToPhyloXML.py PhyloTree.nwk
+# Example: NewickToPhyloXML.py --processes 4 ./Trees
 # ----------------------------------------------------------------------------------------
 # ===========================================================================================================
 
 # Imports:
+import argparse
+import math
+import re
 import sys
+from array import array
+from multiprocessing import Pool, cpu_count
+from os import listdir, path, remove
+from xml.sax.saxutils import escape
 
-from Bio import Phylo
+chunkSize = 1024 * 1024  # Characters of Newick read at a time.
+maxIndentDepth = 64  # Deeper clades are written with the same indent as clades at this depth.
+# Whitespace, comments, quoted labels, punctuation and unquoted labels.
+tokenRegex = re.compile(r"\s+|\[[^\]]*\]|'(?:[^']|'')*'|[(),:;]|[^\s()\[\]':;,]+")
+PhyloXMLHeader = ('<phyloxml xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns="http://www.phyloxml.org" '
+                  'xsi:schemaLocation="http://www.phyloxml.org http://www.phyloxml.org/1.10/phyloxml.xsd">\n')
 
 
 # ===========================================================================================================
 # Functions:
 
 # 1: Checks if in proper number of arguments are passed gives instructions on proper use.
-def argsCheck(numArgs):
-    if len(sys.argv) < numArgs or len(sys.argv) > numArgs:
+def argsCheck():
+    if len(sys.argv) < 2:
         print("Sequence Downloader")
         print("By Lee Bergstrand\n")
-        print("Usage: " + sys.argv[0] + " <PhyloTree.nwk>")
+        print("Usage: " + sys.argv[0] + " [--processes N] <PhyloTree.nwk | TreeDirectory> [PhyloTree2.nwk ...]")
         print("Examples: " + sys.argv[0] + " PhyloTree.nwk\n")
         exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
 
+    parser = argparse.ArgumentParser(description="Converts Newick trees to PhyloXML.")
+    parser.add_argument("trees", nargs="+", help="Newick files, or directories of .nwk files.")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Number of trees to convert in parallel (default: 1, 0 for all cores).")
+    return parser.parse_args()
+
+
+# 2: Gets the list of Newick files to convert. Directories are expanded to the .nwk files inside them.
+def getTreeFiles(trees):
+    treeFiles = []
+    for tree in trees:
+        if path.isdir(tree):
+            treeFiles.extend(sorted(path.join(tree, treeFile) for treeFile in listdir(tree)
+                                    if treeFile.endswith(".nwk")))
+        else:
+            treeFiles.append(tree)
+    return treeFiles
+
+
+# 3: Reads a Newick file in chunks and yields its tokens. Whitespace and comments are dropped.
+def tokenizeNewick(handle):
+    buffer = ""
+    atEnd = False
+    while not atEnd:
+        chunk = handle.read(chunkSize)
+        atEnd = not chunk
+        buffer += chunk
+        position = 0
+        while position < len(buffer):
+            match = tokenRegex.match(buffer, position)
+            # Tokens running up to the end of the buffer may continue into the next chunk. A quoted label
+            # followed by a quote is only part of a label with an escaped quote, the rest of which is unread.
+            if (match is None or (match.end() == len(buffer) and not atEnd) or
+                    (buffer[position] == "'" and buffer.startswith("'", match.end()))):
+                break
+            token = match.group()
+            position = match.end()
+            if not token[0].isspace() and token[0] != "[":
+                yield token
+        buffer = buffer[position:]
+    if buffer:
+        raise ValueError("Unreadable Newick text: " + buffer[:50])
+
+
+# 4: Parses Newick tokens into a stream of (event, node index, label, branch length) tuples. Events are "open"
+#    for the start of an internal node, "close" for its end (once its label and branch length are known), "leaf"
+#    for a leaf and "end" for the end of a tree. Internal nodes are numbered in the order they are opened.
+#    Only the stack of open internal nodes is held in memory.
+def parseNewickEvents(tokens):
+    stack = []
+    nodeIndex = 0
+    node = None  # [node index (None for leaves), label, branch length] of the node being read.
+    expectingLength = False
+    for token in tokens:
+        if expectingLength:
+            node[2] = float(token)
+            expectingLength = False
+        elif token == "(":
+            yield "open", nodeIndex, None, None
+            stack.append(nodeIndex)
+            nodeIndex += 1
+        elif token in ",);":
+            if node is None:
+                node = [None, None, None]  # A leaf with no label.
+            yield ("leaf" if node[0] is None else "close"), node[0], node[1], node[2]
+            node = None
+            if token == ")":
+                if not stack:
+                    raise ValueError("Parenthesis mismatch.")
+                node = [stack.pop(), None, None]
+            elif token == "," and not stack:
+                raise ValueError("Newick trees must be enclosed in parentheses.")
+            elif token == ";":
+                if stack:
+                    raise ValueError("Parenthesis mismatch.")
+                yield "end", None, None, None
+        elif token == ":":
+            if node is None:
+                node = [None, None, None]
+            expectingLength = True
+        else:
+            if token.startswith("'"):
+                token = token[1:-1].replace("''", "'")
+            if node is None:
+                node = [None, token, None]
+            else:
+                node[1] = token
+    if stack:
+        raise ValueError("Parenthesis mismatch.")
+    if node is not None:  # The last tree is missing its terminating semicolon.
+        yield ("leaf" if node[0] is None else "close"), node[0], node[1], node[2]
+        yield "end", None, None, None
+
+
+# 5: Gets the confidence value held in an internal node's label, or None if the label is not a number.
+def parseConfidence(label):
+    try:
+        return float(label)
+    except ValueError:
+        return None
+
+
+# 6: Reads the labels and branch lengths of every internal node of a Newick file into compact tables indexed by
+#    node number. Returns (names, branch lengths, confidences). Missing values are NaN (or absent from names).
+def getInternalNodeTable(handle):
+    names = {}
+    lengths = array("d")
+    confidences = array("d")
+    for event, index, label, length in parseNewickEvents(tokenizeNewick(handle)):
+        if event == "open":
+            lengths.append(float("nan"))
+            confidences.append(float("nan"))
+        elif event == "close":
+            if length is not None:
+                lengths[index] = length
+            if label:
+                confidence = parseConfidence(label)
+                if confidence is None:
+                    names[index] = label
+                else:
+                    confidences[index] = confidence
+    return names, lengths, confidences
+
+
+# 7: Formats a float the same way as Biopython's PhyloXML writer.
+def formatFloat(value):
+    return str(float(value)).upper()
+
+
+# 8: Gets the PhyloXML lines describing a clade (name, branch length and confidence).
+def getCladeData(indent, name, length, confidence):
+    lines = []
+    if name:
+        lines.append(indent + "<name>" + escape(name) + "</name>\n")
+    if length is not None and not math.isnan(length):
+        lines.append(indent + "<branch_length>" + formatFloat(length) + "</branch_length>\n")
+    if confidence is not None and not math.isnan(confidence):
+        lines.append(indent + '<confidence type="unknown">' + formatFloat(confidence) + "</confidence>\n")
+    return "".join(lines)
+
+
+# 9: Converts a Newick file to PhyloXML. The file is read twice: once for the internal node table and once to
+#    write the PhyloXML. Returns the number of trees converted.
+def convertTree(inFile, outFile):
+    handle = open(inFile, "r")
+    names, lengths, confidences = getInternalNodeTable(handle)
+    handle.seek(0)
+
+    treeCount = 0
+    depth = 0  # Number of open clades.
+    inTree = False
+    writer = open(outFile, "w")
+    writer.write(PhyloXMLHeader)
+    for event, index, label, length in parseNewickEvents(tokenizeNewick(handle)):
+        if event == "end":
+            writer.write("  </phylogeny>\n")
+            inTree = False
+            treeCount += 1
+            continue
+        if not inTree:
+            writer.write('  <phylogeny rooted="false">\n')
+            inTree = True
+        indent = "  " * (min(depth, maxIndentDepth) + 2)
+        if event == "open":
+            writer.write(indent + "<clade>\n")
+            writer.write(getCladeData(indent + "  ", names.get(index), lengths[index], confidences[index]))
+            depth += 1
+        elif event == "close":
+            depth -= 1
+            writer.write("  " * (min(depth, maxIndentDepth) + 2) + "</clade>\n")
+        else:
+            cladeData = getCladeData(indent + "  ", label, length, None)
+            if cladeData:
+                writer.write(indent + "<clade>\n" + cladeData + indent + "</clade>\n")
+            else:
+                writer.write(indent + "<clade />\n")
+    writer.write("</phyloxml>")
+    writer.close()
+    handle.close()
+    return treeCount
+
+
+# 10: Converts one Newick file in a worker process. Returns (file, trees converted, error). A PhyloXML file that
+#     could not be fully written is removed.
+def convertWorker(inFile):
+    outFile = path.splitext(inFile)[0] + ".xml"
+    try:
+        open(inFile, "r").close()
+    except IOError:
+        return inFile, 0, "Failed to open " + inFile
+    try:
+        return inFile, convertTree(inFile, outFile), None
+    except IOError as error:
+        if path.isfile(outFile):
+            remove(outFile)
+        return inFile, 0, "Failed to write " + outFile + ": " + (error.strerror or str(error))
+    except ValueError as error:
+        return inFile, 0, "Failed to parse " + inFile + ": " + str(error)
+
 
 # ===========================================================================================================
 # Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
 
-# House keeping...
-argsCheck(2)  # Checks if the number of arguments are correct.
+    # Stores file one for input checking.
+    print(">> Opening Newicktree...")
+    treeFiles = getTreeFiles(args.trees)
 
-# Stores file one for input checking.
-print(">> Opening Newicktree...")
-inFile = sys.argv[1]
-outFile = inFile.split(".")[0] + ".xml"
+    # File extension check
+    for inFile in treeFiles:
+        if not inFile.endswith(".nwk"):
+            print("[Warning] " + inFile + " may not be a Newick file!")
 
-# File extension check
-if not inFile.endswith(".nwk"):
-    print("[Warning] " + inFile + " may not be a Newick file!")
+    print(">> Converting to PhyloXML...")
+    processes = args.processes if args.processes > 0 else cpu_count()
+    if processes > 1 and len(treeFiles) > 1:
+        pool = Pool(min(processes, len(treeFiles)))
+        results = pool.imap(convertWorker, treeFiles)
+    else:
+        pool = None
+        results = map(convertWorker, treeFiles)
 
-print(">> Converting to PhyloXML...")
-# Converts Newick to PhyloXML.
-try:
-    Phylo.convert(inFile, 'newick', outFile, 'phyloxml')
-except IOError:
-    print("Failed to open " + inFile + "or" + outFile)
-    exit(1)
+    for inFile, treeCount, error in results:
+        if error:
+            print(error)
+            exit(1)
+        print(inFile + ": " + str(treeCount) + " tree(s) converted.")
+    if pool:
+        pool.close()
+        pool.join()
 
-print(">> Done...")
+    print(">> Done...")
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: Opt-in instrumentation for 16SBLAST.py and 16SHMMER.py (--metrics <Metrics.jsonl>). Each stage of
+#              a run (reading the genome, building its reverse complement, blastn or hmmsearch, Stockholm
+#              parsing, writing output...) records its wall time, CPU time (including that of waited for
+#              subprocesses), bytes in and out and subprocess exit status. Stage totals are written as one JSON
+#              record per genome (or BLAST batch), with the process's peak memory, and a summary record is
+#              written at the end of the run. Genomes that miss a tier (the amplicon or cache) before being
+#              searched get a "miss" record, so each genome has one "genome" record with its result.
+#              Stage times are exclusive: a stage timed inside another stage (in the same thread) names it as its
+#              parent and its time is taken off the parent's, so stage times can be summed without counting any
+#              time twice. Stages timed in other threads (eg. alignment parsing running alongside hmmsearch)
+#              overlap in wall time, but not in CPU time. When no metrics file is given every call is a no-op.
+#              Run on its own it summarises a metrics file.
+#
+# Requirements: - None beyond the Python standard library.
+#
+# Usage: PipelineMetrics.py <Metrics.jsonl>
+# Example: PipelineMetrics.py 16SHMMERMetrics.jsonl
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports:
+import json
+import resource
+import sys
+import threading
+import time
+
+stageFields = ["calls", "wallSeconds", "cpuSeconds", "childCPUSeconds", "bytesIn", "bytesOut"]
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Checks if in proper number of arguments are passed gives instructions on proper use.
+def argsCheck():
+    if len(sys.argv) != 2:
+        print("Pipeline Metrics Summary")
+        print("By Lee Bergstrand\n")
+        print("Usage: " + sys.argv[0] + " <Metrics.jsonl>")
+        print("Examples: " + sys.argv[0] + " 16SHMMERMetrics.jsonl\n")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Gets the CPU time used by this process's waited for subprocesses.
+def getChildCPUTime():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: Gets the peak resident set size (in KB on Linux) of this process and of its largest waited for subprocess.
+def getPeakMemory():
+    return {"peakRSSKB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "childPeakRSSKB": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss}
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Adds one set of stage totals to another.
+def addStageTotals(totals, stages):
+    for name, stage in stages.items():
+        total = totals.setdefault(name, dict((field, 0) for field in stageFields))
+        for field in stageFields:
+            total[field] += stage[field]
+        if "parent" in stage:
+            total["parent"] = stage["parent"]
+        if "exitStatus" in stage:
+            total.setdefault("exitStatuses", {})
+            exitStatus = str(stage["exitStatus"])
+            total["exitStatuses"][exitStatus] = total["exitStatuses"].get(exitStatus, 0) + 1
+
+
+# -------------------------------------------------------------------------------------------------
+# 5: Times a block of code as one call of a stage. Wall time, this thread's CPU time and the CPU time of any
+#    subprocesses waited for inside the block are added to the stage, less the time of any stages timed inside it.
+class StageTimer(object):
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.nestedTimes = [0.0, 0.0, 0.0]  # Wall, CPU and child CPU time of the stages timed inside this one.
+        self.recorder.getOpenStages().append(self)
+        self.startTime = time.time()
+        self.startCPU = time.thread_time()
+        self.startChildCPU = getChildCPUTime()
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        times = [time.time() - self.startTime, time.thread_time() - self.startCPU,
+                 getChildCPUTime() - self.startChildCPU]
+        self.recorder.getOpenStages().pop()
+        self.recorder.addNested(self.name, times, self.nestedTimes)
+        return False
+
+
+# -------------------------------------------------------------------------------------------------
+# 6: A stand in for StageTimer that does nothing, used when metrics are off.
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        return False
+
+
+nullTimer = NullTimer()
+
+
+# -------------------------------------------------------------------------------------------------
+# 7: Records per stage metrics and writes them as JSON lines. Stages accumulate until emit is called, which
+#    writes them as one record (eg. for one genome) and adds them to the run's totals.
+class MetricsRecorder(object):
+    def __init__(self, metricsFile=None, script=""):
+        self.enabled = metricsFile is not None
+        self.script = script
+        self.stages = {}
+        self.totals = {}
+        self.recordCounts = {}
+        self.results = {}
+        self.lock = threading.Lock()  # Stages may be updated from feeder threads.
+        self.threadState = threading.local()  # Each thread's stack of open StageTimers.
+        self.startTime = time.time()
+        self.startCPU = time.process_time()
+        self.handle = open(metricsFile, "a") if self.enabled else None
+
+    # Gets a context manager that times a block of code as a call of the named stage.
+    def stage(self, name):
+        if not self.enabled:
+            return nullTimer
+        return StageTimer(self, name)
+
+    # Adds to the named stage's totals. Keyword arguments are any of the stage fields.
+    def add(self, name, **values):
+        if not self.enabled:
+            return
+        with self.lock:
+            stage = self.stages.setdefault(name, dict((field, 0) for field in stageFields))
+            for field, value in values.items():
+                stage[field] += value
+
+    # Gets the stack of stages open in the calling thread, innermost last.
+    def getOpenStages(self):
+        if not hasattr(self.threadState, "openStages"):
+            self.threadState.openStages = []
+        return self.threadState.openStages
+
+    # Adds one call's (wall, CPU, child CPU) times to a stage, less the times of the stages nested inside it, and
+    # adds them to the nested times of the stage enclosing it (if any), which is recorded as its parent.
+    def addNested(self, name, times, nestedTimes=(0.0, 0.0, 0.0)):
+        openStages = self.getOpenStages()
+        if openStages:
+            for i in range(3):
+                openStages[-1].nestedTimes[i] += times[i]
+            with self.lock:
+                self.stages.setdefault(name, dict((field, 0) for field in stageFields))["parent"] = openStages[-1].name
+        self.add(name, calls=1, wallSeconds=times[0] - nestedTimes[0], cpuSeconds=times[1] - nestedTimes[1],
+                 childCPUSeconds=times[2] - nestedTimes[2])
+
+    def addBytes(self, name, bytesIn=0, bytesOut=0):
+        self.add(name, bytesIn=bytesIn, bytesOut=bytesOut)
+
+    def setExitStatus(self, name, exitStatus):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.stages.setdefault(name, dict((field, 0) for field in stageFields))["exitStatus"] = exitStatus
+
+    # Wraps an iterable of strings, counting their length as bytes in or out of a stage.
+    def countBytes(self, name, iterable, field="bytesIn"):
+        if not self.enabled:
+            return iterable
+        return self.countBytesGenerator(name, iterable, field)
+
+    def countBytesGenerator(self, name, iterable, field):
+        for item in iterable:
+            self.add(name, **{field: len(item)})
+            yield item
+
+    # Wraps an iterable (usually a generator) so the time spent producing its items is added to a stage, and the
+    # length of the items to the stage's bytes out. Time spent by the consumer between items is not counted. The
+    # stage is nested in whichever stage the consumer has open while it waits for each item.
+    def timeIterable(self, name, iterable):
+        if not self.enabled:
+            return iterable
+        return self.timeIterableGenerator(name, iterable)
+
+    def timeIterableGenerator(self, name, iterable):
+        iterator = iter(iterable)
+        parent = None
+        wallSeconds = 0.0
+        cpuSeconds = 0.0
+        byteCount = 0
+        try:
+            while True:
+                startTime = time.time()
+                startCPU = time.thread_time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    itemWall = time.time() - startTime
+                    itemCPU = time.thread_time() - startCPU
+                    wallSeconds += itemWall
+                    cpuSeconds += itemCPU
+                    openStages = self.getOpenStages()
+                    if openStages:
+                        openStages[-1].nestedTimes[0] += itemWall
+                        openStages[-1].nestedTimes[1] += itemCPU
+                        parent = openStages[-1].name
+                byteCount += len(item)
+                yield item
+        finally:
+            self.add(name, calls=1, wallSeconds=wallSeconds, cpuSeconds=cpuSeconds, bytesOut=byteCount)
+            if parent:
+                with self.lock:
+                    self.stages[name]["parent"] = parent
+
+    # Writes the stages recorded since the last record as a JSON record and adds them to the run's totals.
+    # Keyword arguments are added to the record. A "result" field is also counted in the summary.
+    def emit(self, recordType, **fields):
+        if not self.enabled:
+            return
+        with self.lock:
+            stages = self.stages
+            self.stages = {}
+        record = {"type": recordType, "script": self.script, "time": time.time()}
+        record.update(fields)
+        record["stages"] = stages
+        record.update(getPeakMemory())
+        self.handle.write(json.dumps(record, sort_keys=True) + "\n")
+        self.handle.flush()
+        addStageTotals(self.totals, stages)
+        self.recordCounts[recordType] = self.recordCounts.get(recordType, 0) + 1
+        if "result" in fields:
+            self.results[fields["result"]] = self.results.get(fields["result"], 0) + 1
+
+    # Writes the summary record for the run and closes the metrics file.
+    def close(self):
+        if not self.enabled:
+            return
+        if self.stages:
+            self.emit("unattributed")  # Stages recorded after the last record.
+        summary = {"type": "summary", "script": self.script, "time": time.time(),
+                   "wallSeconds": time.time() - self.startTime, "cpuSeconds": time.process_time() - self.startCPU,
+                   "childCPUSeconds": getChildCPUTime(), "records": self.recordCounts, "results": self.results,
+                   "stages": self.totals}
+        summary.update(getPeakMemory())
+        self.handle.write(json.dumps(summary, sort_keys=True) + "\n")
+        self.handle.close()
+        self.enabled = False
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    argsCheck()  # Checks if the number of arguments are correct.
+
+    totals = {}
+    results = {}
+    genomeCount = 0
+    try:
+        inFile = open(sys.argv[1], "r")
+        for line in inFile:
+            record = json.loads(line)
+            if record["type"] == "summary":
+                continue  # Summaries are recomputed, so metrics files appended to by several runs are combined.
+            addStageTotals(totals, record["stages"])
+            if record["type"] == "genome":
+                genomeCount += 1
+                results[record.get("result")] = results.get(record.get("result"), 0) + 1
+        inFile.close()
+    except IOError:
+        print("Failed to open " + sys.argv[1])
+        exit(1)
+
+    print(str(genomeCount) + " genome(s): " + ", ".join(str(count) + " " + str(result)
+                                                       for result, count in sorted(results.items(), key=str)))
+    print("Stage".ljust(20) + "Calls".rjust(8) + "Wall (s)".rjust(12) + "CPU (s)".rjust(12) +
+          "Child CPU (s)".rjust(15) + "MB in".rjust(10) + "MB out".rjust(10))
+    for name, stage in sorted(totals.items(), key=lambda item: -item[1]["wallSeconds"]):
+        print(name.ljust(20) + str(stage["calls"]).rjust(8) + "{0:.2f}".format(stage["wallSeconds"]).rjust(12) +
+              "{0:.2f}".format(stage["cpuSeconds"]).rjust(12) +
+              "{0:.2f}".format(stage["childCPUSeconds"]).rjust(15) +
+              "{0:.1f}".format(stage["bytesIn"] / 1e6).rjust(10) + "{0:.1f}".format(stage["bytesOut"] / 1e6).rjust(10))
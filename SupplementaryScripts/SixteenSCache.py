@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: A persistent on-disk cache of 16S extraction results used by 16SBLAST.py and 16SHMMER.py.
+#              Results are keyed on the content hash of the genome, the content hash of the BLAST database
+#              or HMM it was searched with and the search parameters. Each entry stores either the best 16S
+#              sequence or a "no 16S" verdict. When the cache grows past its size limit the least recently
+#              used entries are evicted. Run on its own it reports on (or clears) a cache directory.
+#
+# Requirements: - None beyond the Python standard library.
+#
+# Usage: SixteenSCache.py <CacheDirectory> [--clear]
+# Example: SixteenSCache.py ./16SCache
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports:
+import hashlib
+import os
+import sys
+import tempfile
+from os import path
+
+defaultCacheSize = 1024 * 1024 * 1024  # Default cache size limit of 1 GB.
+foundMarker = "FOUND"  # First line of an entry holding a 16S sequence.
+notFoundMarker = "NONE"  # First line of an entry recording that no 16S was found.
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Checks if in proper number of arguments are passed gives instructions on proper use.
+def argsCheck():
+    if len(sys.argv) < 2 or len(sys.argv) > 3 or (len(sys.argv) == 3 and sys.argv[2] != "--clear"):
+        print("16S Result Cache")
+        print("By Lee Bergstrand\n")
+        print("Usage: " + sys.argv[0] + " <CacheDirectory> [--clear]")
+        print("Examples: " + sys.argv[0] + " ./16SCache\n")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Gets the SHA-256 hash of a file's content. The file is read in blocks so it is never fully in memory.
+def hashFile(filePath):
+    fileHash = hashlib.sha256()
+    inFile = open(filePath, "rb")
+    block = inFile.read(1024 * 1024)
+    while block:
+        fileHash.update(block)
+        block = inFile.read(1024 * 1024)
+    inFile.close()
+    return fileHash.hexdigest()
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: A size limited on-disk cache of 16S extraction results. Entries are stored one per file, sharded into
+#    sub-directories by the first two characters of their key. An entry's modification time is refreshed
+#    each time it is read so that eviction removes the least recently used entries first.
+class ResultCache(object):
+    def __init__(self, cacheDirectory, maxSize=defaultCacheSize):
+        self.cacheDirectory = cacheDirectory
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.referenceHashes = {}  # Reference files are only hashed once per run.
+        if not path.isdir(cacheDirectory):
+            os.makedirs(cacheDirectory)
+        self.currentSize = sum(path.getsize(entry) for entry in self.listEntries())
+
+    # Lists the paths of every entry in the cache.
+    def listEntries(self):
+        entries = []
+        for shard in os.listdir(self.cacheDirectory):
+            shardDirectory = path.join(self.cacheDirectory, shard)
+            if path.isdir(shardDirectory):
+                for entry in os.listdir(shardDirectory):
+                    if entry.endswith(".entry"):
+                        entries.append(path.join(shardDirectory, entry))
+        return entries
+
+    # Builds a cache key from the genome's content, the reference (BLAST database or HMM) and the search parameters.
+    def makeKey(self, genome, reference, parameters):
+        if reference not in self.referenceHashes:
+            self.referenceHashes[reference] = hashFile(reference)
+        keyText = hashFile(genome) + ":" + self.referenceHashes[reference] + ":" + parameters
+        return hashlib.sha256(keyText.encode("utf-8")).hexdigest()
+
+    def getEntryPath(self, key):
+        return path.join(self.cacheDirectory, key[:2], key + ".entry")
+
+    # Returns (True, sequence) for a cached 16S, (False, None) for a cached "no 16S" verdict or None on a miss.
+    def get(self, key):
+        entryPath = self.getEntryPath(key)
+        try:
+            entry = open(entryPath, "r")
+            marker = entry.readline().strip()
+            sequence = entry.read().strip()
+            entry.close()
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(entryPath, None)  # Marks the entry as recently used.
+        except OSError:
+            pass
+        self.hits += 1
+        if marker == foundMarker:
+            return True, sequence
+        return False, None
+
+    # Stores a 16S sequence (or None for a "no 16S" verdict) then evicts old entries if the cache is too large.
+    # Entries are written to a temporary file and renamed into place so readers never see a partial entry.
+    def put(self, key, sequence):
+        entryPath = self.getEntryPath(key)
+        if not path.isdir(path.dirname(entryPath)):
+            os.makedirs(path.dirname(entryPath))
+        if sequence:
+            content = foundMarker + "\n" + sequence + "\n"
+        else:
+            content = notFoundMarker + "\n"
+        tempHandle, tempPath = tempfile.mkstemp(dir=path.dirname(entryPath), suffix=".tmp")
+        os.write(tempHandle, content.encode("utf-8"))
+        os.close(tempHandle)
+        if path.exists(entryPath):
+            self.currentSize -= path.getsize(entryPath)
+        os.rename(tempPath, entryPath)
+        self.currentSize += len(content)
+        if self.currentSize > self.maxSize:
+            self.evict()
+
+    # Removes least recently used entries until the cache is back under 90% of its size limit.
+    def evict(self):
+        entries = []
+        for entryPath in self.listEntries():
+            try:
+                entries.append((path.getmtime(entryPath), path.getsize(entryPath), entryPath))
+            except OSError:
+                pass  # Removed by another process.
+        entries.sort()
+        self.currentSize = sum(entry[1] for entry in entries)
+        for modifiedTime, size, entryPath in entries:
+            if self.currentSize <= self.maxSize * 0.9:
+                break
+            try:
+                os.remove(entryPath)
+            except OSError:
+                pass
+            self.currentSize -= size
+
+    # Removes every entry from the cache.
+    def clear(self):
+        for entryPath in self.listEntries():
+            os.remove(entryPath)
+        self.currentSize = 0
+
+    def report(self):
+        print("Cache: " + str(self.hits) + " hit(s), " + str(self.misses) + " miss(es).")
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    argsCheck()  # Checks if the number of arguments are correct.
+
+    cache = ResultCache(sys.argv[1])
+    if len(sys.argv) == 3:
+        print(">> Clearing " + sys.argv[1] + "...")
+        cache.clear()
+    else:
+        print(">> " + sys.argv[1] + " holds " + str(len(cache.listEntries())) + " entries using " +
+              str(cache.currentSize) + " bytes.")
+    print(">> Done.")
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: An indexed SQLite store of 16S extraction results, used in place of the append-only
+#              Found16SGenes and No16SGenomes files by 16SBLAST.py, 16SHMMER.py and SixteenSWorker.py
+#              (--store <Results.db>). Results are keyed on genome accession and method, so rerunning a
+#              genome replaces its old result instead of adding a duplicate. Each result records whether a
+#              16S was found, its sequence, length, strand and score (when the method reports them) and the
+#              tier that found it. Results are buffered and written in batches, each in one transaction.
+#              The database runs in write-ahead log mode so several runs can write to it at once while it
+#              is being read. Run on its own it summarises a store, looks up genomes, lists the genomes that
+#              lack a 16S or exports the found 16S genes back to FASTA. Gyrase B results from 16SHMMER.py
+#              --gyrb-hmm are stored under the gyrB method.
+#
+# Requirements: - None beyond the Python standard library.
+#
+# Usage: SixteenSResultStore.py <Results.db> (summary | get <Accession> ... | missing | export)
+#                               [--method hmm|blast|gyrB]
+# Example: SixteenSResultStore.py 16SResults.db missing
+# Example: SixteenSResultStore.py 16SResults.db export --method hmm > Found16SGenesHMM.fna
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports:
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+
+defaultBatchSize = 100  # Results buffered before they are written.
+busyTimeout = 60  # Seconds to wait for another writer to finish its transaction.
+FASTALineLength = 70  # Bases per line of exported FASTA.
+otherMarkers = ("gyrB",)  # Methods holding markers other than 16S, left out unless asked for by name.
+StoreError = sqlite3.Error  # Raised when the store cannot be opened or written to.
+schema = ["CREATE TABLE IF NOT EXISTS results (accession TEXT NOT NULL, method TEXT NOT NULL, "
+          "found INTEGER NOT NULL, sequence TEXT, length INTEGER, strand TEXT, score REAL, tier TEXT, genome TEXT, "
+          "updated REAL NOT NULL, PRIMARY KEY (accession, method))",
+          "CREATE INDEX IF NOT EXISTS resultsByFound ON results (found, method)"]
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Checks if in proper number of arguments are passed gives instructions on proper use.
+def argsCheck():
+    if len(sys.argv) < 3:
+        print("16S Result Store")
+        print("By Lee Bergstrand\n")
+        print("Usage: " + sys.argv[0] + " <Results.db> (summary | get <Accession> ... | missing | export)"
+                                        " [--method hmm|blast|gyrB]")
+        print("Examples: " + sys.argv[0] + " 16SResults.db missing\n")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+
+    parser = argparse.ArgumentParser(description="Queries a 16S result store.")
+    parser.add_argument("storeFile", help="The SQLite result store.")
+    parser.add_argument("command", choices=["summary", "get", "missing", "export"])
+    parser.add_argument("accessions", nargs="*", help="Genome accessions to look up (for get).")
+    parser.add_argument("--method", choices=["hmm", "blast", "gyrB"], help="Only use results from this method.")
+    return parser.parse_args()
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Wraps a sequence into FASTA lines.
+def wrapSequence(sequence):
+    return "\n".join(sequence[i:i + FASTALineLength] for i in range(0, len(sequence), FASTALineLength))
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: A store of 16S extraction results in an SQLite database. Results are added to a buffer which is written in
+#    a single transaction once it holds batchSize results, when flush is called or when the store is closed.
+class ResultStore(object):
+    def __init__(self, storeFile, batchSize=defaultBatchSize):
+        self.storeFile = storeFile
+        self.batchSize = batchSize
+        self.pending = []
+        self.lock = threading.RLock()  # Results may be added from several threads (eg. by SixteenSWorker.py).
+        # Transactions are managed by hand (isolation_level=None) so each batch is one explicit transaction.
+        self.connection = sqlite3.connect(storeFile, timeout=busyTimeout, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in schema:
+            self.connection.execute(statement)
+
+    # Adds a genome's result. A sequence of None records that no 16S was found.
+    def add(self, accession, method, sequence=None, strand=None, score=None, tier=None, genome=None):
+        with self.lock:
+            self.pending.append((accession, method, 1 if sequence else 0, sequence or None,
+                                 len(sequence) if sequence else None, strand, score, tier, genome, time.time()))
+            if len(self.pending) >= self.batchSize:
+                self.flush()
+
+    # Writes the buffered results in one transaction. Results for genomes already in the store replace them.
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers wait rather than fail part way.
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany("INSERT OR REPLACE INTO results (accession, method, found, sequence, "
+                                            "length, strand, score, tier, genome, updated) "
+                                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self.pending)
+            except sqlite3.Error:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+            self.pending = []
+
+    # Gets the results for a genome accession as a list of dictionaries.
+    def get(self, accession, method=None):
+        self.flush()
+        query = "SELECT * FROM results WHERE accession = ?"
+        parameters = [accession]
+        if method:
+            query += " AND method = ?"
+            parameters.append(method)
+        cursor = self.connection.execute(query, parameters)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    # Gets the accessions of genomes with no 16S (or other marker, if its method is given). Without a method these
+    # are the genomes no method found a 16S in.
+    def missing(self, method=None):
+        self.flush()
+        if method:
+            cursor = self.connection.execute("SELECT accession FROM results WHERE found = 0 AND method = ? "
+                                             "ORDER BY accession", [method])
+        else:
+            cursor = self.connection.execute("SELECT accession FROM results WHERE method NOT IN (%s) "
+                                             "GROUP BY accession HAVING MAX(found) = 0 ORDER BY accession" %
+                                             ", ".join("?" * len(otherMarkers)), otherMarkers)
+        return [row[0] for row in cursor]
+
+    # Writes the found 16S genes to a handle as FASTA. Without a method genomes found by both 16S methods are written
+    # once, preferring the longer sequence.
+    def export(self, handle, method=None):
+        self.flush()
+        if method:
+            cursor = self.connection.execute("SELECT accession, sequence FROM results WHERE found = 1 AND method = ? "
+                                             "ORDER BY accession", [method])
+        else:
+            cursor = self.connection.execute("SELECT accession, sequence, MAX(length) FROM results WHERE found = 1 "
+                                             "AND method NOT IN (%s) GROUP BY accession ORDER BY accession" %
+                                             ", ".join("?" * len(otherMarkers)), otherMarkers)
+        count = 0
+        for row in cursor:
+            handle.write(">" + row[0] + "\n" + wrapSequence(row[1]) + "\n")
+            count += 1
+        return count
+
+    # Gets (method, found, genome count) for every method in the store.
+    def summary(self):
+        self.flush()
+        return self.connection.execute("SELECT method, found, COUNT(*) FROM results GROUP BY method, found "
+                                       "ORDER BY method, found").fetchall()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    try:
+        store = ResultStore(args.storeFile)
+    except StoreError:
+        print("Failed to open " + args.storeFile)
+        exit(1)
+
+    if args.command == "summary":
+        for method, found, count in store.summary():
+            print(method + ": " + str(count) + " genome(s) " + ("with" if found else "without") +
+                  (" a hit" if method in otherMarkers else " a 16S"))
+    elif args.command == "get":
+        for accession in args.accessions:
+            results = store.get(accession, args.method)
+            if not results:
+                print(accession + ": not in store")
+            for result in results:
+                isOtherMarker = result["method"] in otherMarkers  # Other markers are proteins.
+                print(accession + " (" + result["method"] + "): " +
+                      ("found, " + str(result["length"]) + (" aa" if isOtherMarker else " B.P.") + ", strand " +
+                       str(result["strand"]) + ", score " + str(result["score"]) + ", tier " + str(result["tier"])
+                       if result["found"] else "no " + ("hit" if isOtherMarker else "16S")))
+    elif args.command == "missing":
+        for accession in store.missing(args.method):
+            print(accession)
+    else:
+        store.export(sys.stdout, args.method)
+    store.close()
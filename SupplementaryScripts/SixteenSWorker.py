@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------------------
+# Created by: Lee Bergstrand
+# Description: A long running worker for 16SHMMER.py and 16SBLAST.py that keeps everything warm between genomes.
+#              The finder script is loaded once, the HMM is pressed with hmmpress (so hmmsearch reads the
+#              binary profile) and a pool of ready worker processes searches genomes as they arrive. With
+#              --method blast genomes that arrive close together are BLASTed as one multi-query batch, so the
+#              BLAST database is opened once per batch rather than once per genome. Genomes are submitted either
+#              over a local Unix socket (one path per line, results are streamed back as JSON lines as they
+#              finish) or by moving them into a spool directory, which is polled. Spooled genomes are moved to
+#              <Spool>/done once searched and their results are appended to the usual Found16SGenes and
+#              No16SGenomes files in the current directory. Genomes that could not be searched are moved to
+#              <Spool>/failed instead and no result is written for them. Genomes should be moved (not copied)
+#              into the spool so they are never seen half written. The submit command sends genomes to a running
+#              worker and writes the results it gets back to the usual files in the current directory. With
+#              --store results are written to an SQLite store made by SixteenSResultStore.py instead of the usual
+#              files.
+#
+# Requirements: - HMMER 3.0 or later (for --method hmm) or BLAST+ 2.2.9 or later (for --method blast).
+#
+# Usage: SixteenSWorker.py serve [--method hmm|blast] [--workers N] [--cache <CacheDirectory>]
+#                                (--socket <Socket> | --spool <SpoolDirectory>) <16S.hmm|16SDataBase.fna>
+#        SixteenSWorker.py submit --socket <Socket> <QueryGenome.fna> [QueryGenome2.fna ...]
+# Example: SixteenSWorker.py serve --socket /tmp/16S.sock 16S.hmm
+# Example: SixteenSWorker.py submit --socket /tmp/16S.sock *.fna
+# Example: SixteenSWorker.py serve --method blast --spool ./Incoming RDPActinoBacter16S.fna
+# ----------------------------------------------------------------------------------------
+# ===========================================================================================================
+
+# Imports:
+import argparse
+import atexit
+import importlib.util
+import json
+import os
+import queue
+import shutil
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import Pool, cpu_count
+from os import devnull, path
+
+import SixteenSCache
+import SixteenSResultStore
+
+scriptDirectory = path.dirname(path.abspath(__file__))
+finderScripts = {"hmm": path.join(scriptDirectory, "..", "HMMToFind16S", "16SHMMER.py"),
+                 "blast": path.join(scriptDirectory, "..", "BLASTToFind16S", "16SBLAST.py")}
+# Cache parameters must match those used by the finder scripts so that the cache is shared with them.
+cacheParameters = {"hmm": "16SHMMER 1000<length<2000", "blast": "16SBLAST 1000<length<2000"}
+outputFiles = {"hmm": ("Found16SGenesHMM.fna", "No16SGenomesHMM.txt"),
+               "blast": ("Found16SGenesBLAST.fna", "No16SGenomesBLAST.txt")}
+genomeExtensions = {"hmm": (".fna", ".2bit"), "blast": (".fna",)}
+pressedExtensions = [".h3m", ".h3i", ".h3f", ".h3p"]
+finder = None  # The finder script loaded by each worker process.
+workerSettings = {}  # The reference and search options of each worker process.
+store = None  # The SixteenSResultStore.ResultStore results are written to when running with --store.
+
+
+# ===========================================================================================================
+# Functions:
+
+# 1: Checks if in proper number of arguments are passed gives instructions on proper use.
+def argsCheck():
+    if len(sys.argv) < 4:
+        print("16S Finder Worker")
+        print("By Lee Bergstrand\n")
+        print("Please refer to source code for documentation\n")
+        print("Usage: " + sys.argv[0] + " serve [--method hmm|blast] (--socket <Socket> | --spool <SpoolDirectory>)"
+                                        " <16S.hmm|16SDataBase.fna>")
+        print("       " + sys.argv[0] + " submit --socket <Socket> <QueryGenome.fna> [QueryGenome2.fna ...]")
+        print("Examples: " + sys.argv[0] + " serve --socket /tmp/16S.sock 16S.hmm\n")
+        exit(1)  # Aborts program. (exit(1) indicates that an error occurred)
+
+    parser = argparse.ArgumentParser(description="Keeps 16SHMMER.py or 16SBLAST.py warm between genomes.")
+    subparsers = parser.add_subparsers(dest="command")
+    serveParser = subparsers.add_parser("serve", help="Run a worker.")
+    serveParser.add_argument("reference", help="The 16S HMM (--method hmm) or BLAST database FASTA (--method blast).")
+    serveParser.add_argument("--method", choices=["hmm", "blast"], default="hmm",
+                             help="Search genomes with HMMER or BLASTn (default: hmm).")
+    inputGroup = serveParser.add_mutually_exclusive_group(required=True)
+    inputGroup.add_argument("--socket", metavar="Socket", help="Accept genomes over this Unix socket.")
+    inputGroup.add_argument("--spool", metavar="SpoolDirectory", help="Accept genomes moved into this directory.")
+    serveParser.add_argument("--workers", type=int, default=0,
+                             help="Number of HMMER worker processes (default: 0, a quarter of the cores).")
+    serveParser.add_argument("--batch-size", type=int, default=250,
+                             help="Most genomes BLASTed together (default: 250).")
+    serveParser.add_argument("--batch-wait", type=float, default=2.0,
+                             help="Seconds to wait for more genomes before BLASTing a batch (default: 2).")
+    serveParser.add_argument("--poll", type=float, default=5.0,
+                             help="Seconds between checks of the spool directory (default: 5).")
+    serveParser.add_argument("--cache", metavar="CacheDirectory",
+                             help="Reuse (and store) results from the cache used by the finder scripts.")
+    serveParser.add_argument("--cache-size", type=int, default=1024,
+                             help="Size limit of the cache in megabytes (default: 1024).")
+    serveParser.add_argument("--store", metavar="Results.db",
+                             help="Write results of spooled genomes to this SQLite result store.")
+    submitParser = subparsers.add_parser("submit", help="Send genomes to a running worker.")
+    submitParser.add_argument("genomes", nargs="+", help="Query genome files.")
+    submitParser.add_argument("--socket", metavar="Socket", required=True, help="The worker's Unix socket.")
+    submitParser.add_argument("--store", metavar="Results.db",
+                              help="Write the results to this SQLite result store instead of the output files.")
+    return parser.parse_args()
+
+
+# -------------------------------------------------------------------------------------------------
+# 2: Loads 16SHMMER.py or 16SBLAST.py as a module. Their names are not valid module names so they are loaded from
+#    their paths. Their directories are added to the module search path for the modules they import.
+def loadFinder(method):
+    scriptPath = path.abspath(finderScripts[method])
+    if path.dirname(scriptPath) not in sys.path:
+        sys.path.insert(0, path.dirname(scriptPath))
+    spec = importlib.util.spec_from_file_location("SixteenSFinder" + method.upper(), scriptPath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# -------------------------------------------------------------------------------------------------
+# 3: Presses an HMM with hmmpress unless its pressed files are already newer than it. hmmsearch reads the binary
+#    profile of a pressed HMM instead of parsing the text one. Returns true if the HMM is pressed.
+def pressHMM(HMMFile):
+    pressedFiles = [HMMFile + extension for extension in pressedExtensions]
+    if all(path.isfile(pressedFile) and path.getmtime(pressedFile) >= path.getmtime(HMMFile)
+           for pressedFile in pressedFiles):
+        return True
+    try:
+        subprocess.check_call(["hmmpress", "-f", HMMFile], stdout=open(devnull, "w"))
+    except (OSError, subprocess.CalledProcessError):
+        print("[Warning] Could not press " + HMMFile + " with hmmpress. Searching with the text HMM.")
+        return False
+    return True
+
+
+# -------------------------------------------------------------------------------------------------
+# 4: Sets up a worker process. The finder is loaded once per process and its progress messages are silenced,
+#    as they would be interleaved between workers.
+def initWorker(method, reference, processors):
+    global finder
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Interrupts are handled by the main process.
+    finder = loadFinder(method)
+    finder.processors = processors
+    workerSettings["reference"] = reference
+    sys.stdout = open(devnull, "w")
+
+
+# -------------------------------------------------------------------------------------------------
+# 5: Gets a result record for a genome.
+def makeResult(method, genome, accession, result, sequence=None, tier=None, error=None, strand=None, score=None):
+    return {"genome": genome, "accession": accession, "method": method, "result": result, "sequence": sequence,
+            "tier": tier or method, "error": error, "strand": strand, "score": score}
+
+
+# -------------------------------------------------------------------------------------------------
+# 6: Searches one genome with hmmsearch in a worker process. Both strands are searched in a single pass.
+def searchGenomeHMM(genome):
+    accession = finder.getAccession(genome)
+    try:
+        SixteenSSubunits = finder.search16SInGenome(genome, workerSettings["reference"], singlePass=True)
+    except (IOError, ValueError, subprocess.CalledProcessError) as error:
+        return makeResult("hmm", genome, accession, "error", error=str(error))
+    if not SixteenSSubunits:
+        return makeResult("hmm", genome, accession, "none")
+    Top16S = finder.getTop16S(SixteenSSubunits)
+    if not Top16S:
+        return makeResult("hmm", genome, accession, "partial")
+    return makeResult("hmm", genome, accession, "found", finder.fastaHeaderSwap(Top16S, accession),
+                      strand=finder.getStrand(Top16S))
+
+
+# -------------------------------------------------------------------------------------------------
+# 7: BLASTs a batch of genomes as one multi-query blastn run. Returns a result record for each genome.
+def searchBatchBLAST(BLASTFinder, genomes, BLASTDBFile):
+    batch = list(enumerate(genomes))
+    unreadableGenomes = set()
+    try:
+        Top16SGenes, genomesWithHits = BLASTFinder.getTop16SPerGenome(
+            BLASTFinder.runBLASTFor16S(batch, BLASTDBFile, unreadableGenomes=unreadableGenomes))
+    except (IOError, OSError, subprocess.CalledProcessError) as error:
+        return [makeResult("blast", genome, BLASTFinder.getHeaderAccession(genome), "error", error=str(error))
+                for genome in genomes]
+    results = []
+    for genomeIndex, genome in batch:
+        accession = BLASTFinder.getHeaderAccession(genome)
+        if genomeIndex in unreadableGenomes:
+            results.append(makeResult("blast", genome, accession, "error", error="Failed to read " + genome))
+        elif genomeIndex in Top16SGenes:
+            Top16SLength, Top16S, strand, score = Top16SGenes[genomeIndex]
+            FASTA = BLASTFinder.fastaClean(">" + accession + "\n" + Top16S)
+            results.append(makeResult("blast", genome, accession, "found", FASTA, strand=strand, score=score))
+        else:
+            results.append(makeResult("blast", genome, accession,
+                                      "partial" if genomeIndex in genomesWithHits else "none"))
+    return results
+
+
+# -------------------------------------------------------------------------------------------------
+# 8: Appends a result to the Found16SGenes or No16SGenomes file of its method (or adds it to the --store).
+#    Genomes that could not be searched are not written, so that they are not mistaken for genomes without a 16S.
+def writeResult(result):
+    if result["result"] == "error":
+        return
+    if store:
+        sequence = result["sequence"].split("\n", 1)[1] if result["result"] == "found" else None
+        store.add(result["accession"], result["method"], sequence, result["strand"], result["score"],
+                  result["tier"], result["genome"])
+        return
+    FoundFile, NotFoundFile = outputFiles[result["method"]]
+    try:
+        if result["result"] == "found":
+            outFile = open(FoundFile, "a")
+            outFile.write(result["sequence"] + "\n")
+        else:
+            outFile = open(NotFoundFile, "a")
+            outFile.write(result["accession"] + "\n")
+        outFile.close()
+    except IOError:
+        print("Failed to write the result for " + result["genome"] + ".")
+
+
+# -------------------------------------------------------------------------------------------------
+# 9: Searches genomes submitted to it, keeping the finder, reference and worker processes ready between them.
+#    Results are passed to the callback given with each genome, from a background thread.
+class SixteenSWorker(object):
+    def __init__(self, method, reference, workers=0, batchSize=250, batchWait=2.0, cache=None):
+        self.method = method
+        self.reference = path.abspath(reference)
+        self.batchSize = batchSize
+        self.batchWait = batchWait
+        self.cache = cache
+        self.lock = threading.Lock()  # Guards the cache, which results are stored in from several threads.
+        self.finder = loadFinder(method)  # Used for accessions (and for BLAST, the searches themselves).
+        if method == "hmm":
+            pressHMM(self.reference)
+            workers = workers if workers > 0 else max(1, cpu_count() // 4)
+            self.pool = Pool(workers, initWorker, (method, self.reference, max(1, cpu_count() // workers)))
+        else:
+            self.pool = None
+            self.jobs = queue.Queue()
+            self.batcher = threading.Thread(target=self.runBLASTBatches)
+            self.batcher.daemon = True
+            self.batcher.start()
+
+    def getAccession(self, genome):
+        if self.method == "hmm":
+            return self.finder.getAccession(genome)
+        return self.finder.getHeaderAccession(genome)
+
+    # Queues a genome for searching. Cached results are passed straight to the callback.
+    def submit(self, genome, callback):
+        cacheKey = None
+        if self.cache:
+            try:
+                with self.lock:
+                    cacheKey = self.cache.makeKey(genome, self.reference, cacheParameters[self.method])
+                    cachedResult = self.cache.get(cacheKey)
+            except IOError as error:
+                callback(makeResult(self.method, genome, self.getAccession(genome), "error", error=str(error)))
+                return
+            if cachedResult is not None:
+                Found16S, Top16S = cachedResult
+                accession = self.getAccession(genome)
+                callback(makeResult(self.method, genome, accession, "found" if Found16S else "none",
+                                    ">" + accession + "\n" + Top16S if Found16S else None, tier="cache"))
+                return
+        if self.pool:
+            errorResult = makeResult(self.method, genome, self.getAccession(genome), "error")
+            self.pool.apply_async(searchGenomeHMM, (genome,),
+                                  callback=lambda result: self.finish(result, cacheKey, callback),
+                                  error_callback=lambda error: callback(dict(errorResult, error=str(error))))
+        else:
+            self.jobs.put((genome, cacheKey, callback))
+
+    # Stores a finished result in the cache and passes it on.
+    def finish(self, result, cacheKey, callback):
+        if cacheKey and result["result"] != "error":
+            with self.lock:
+                self.cache.put(cacheKey, result["sequence"].split("\n", 1)[1] if result["sequence"] else None)
+        callback(result)
+
+    # Collects queued genomes into batches (waiting briefly for more to arrive) and BLASTs each batch.
+    def runBLASTBatches(self):
+        while True:
+            batch = [self.jobs.get()]
+            deadline = time.time() + self.batchWait
+            while len(batch) < self.batchSize:
+                try:
+                    batch.append(self.jobs.get(timeout=max(deadline - time.time(), 0)))
+                except queue.Empty:
+                    break
+            results = searchBatchBLAST(self.finder, [genome for genome, cacheKey, callback in batch], self.reference)
+            for (genome, cacheKey, callback), result in zip(batch, results):
+                self.finish(result, cacheKey, callback)
+
+    def close(self):
+        if self.pool:
+            self.pool.terminate()
+            self.pool.join()
+        if self.cache:
+            self.cache.report()
+
+
+# -------------------------------------------------------------------------------------------------
+# 10: Handles one socket connection. Genome paths are read one per line until the client stops sending, then a
+#     JSON result line is sent back for each genome as its search finishes.
+class SubmissionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        results = queue.Queue()
+        submitted = 0
+        for line in self.rfile:
+            genome = line.decode("utf-8").strip()
+            if genome:
+                print("Searching " + genome + "...")
+                self.server.worker.submit(genome, results.put)
+                submitted += 1
+        for index in range(submitted):
+            result = results.get()
+            print(result["genome"] + ": " + result["result"])
+            self.wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+# -------------------------------------------------------------------------------------------------
+# 11: Serves genomes submitted over a Unix socket until interrupted.
+def serveSocket(worker, socketPath):
+    if path.exists(socketPath):
+        os.remove(socketPath)  # Left behind by a worker that did not shut down cleanly.
+    server = socketserver.ThreadingUnixStreamServer(socketPath, SubmissionHandler)
+    server.daemon_threads = True
+    server.worker = worker
+    print("Listening on " + socketPath + "...")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socketPath)
+
+
+# -------------------------------------------------------------------------------------------------
+# 12: Serves genomes moved into a spool directory until interrupted. Genomes are moved to <Spool>/working while
+#     they are searched and to <Spool>/done afterwards, or to <Spool>/failed if they could not be searched (they can
+#     be moved back into the spool to retry them). Genomes left in working by an interrupted worker are searched
+#     again.
+def serveSpool(worker, spoolDirectory, pollInterval):
+    workingDirectory = path.join(spoolDirectory, "working")
+    doneDirectory = path.join(spoolDirectory, "done")
+    failedDirectory = path.join(spoolDirectory, "failed")
+    for directory in [workingDirectory, doneDirectory, failedDirectory]:
+        if not path.isdir(directory):
+            os.makedirs(directory)
+    for genomeFile in sorted(os.listdir(workingDirectory)):
+        shutil.move(path.join(workingDirectory, genomeFile), path.join(spoolDirectory, genomeFile))
+
+    def finishGenome(result):
+        if result["result"] == "error":
+            shutil.move(result["genome"], path.join(failedDirectory, path.basename(result["genome"])))
+            print("Failed to search " + result["genome"] + ": " + result["error"])
+            return
+        writeResult(result)
+        shutil.move(result["genome"], path.join(doneDirectory, path.basename(result["genome"])))
+        print(result["genome"] + ": " + result["result"])
+
+    print("Watching " + spoolDirectory + "...")
+    while True:
+        for genomeFile in sorted(os.listdir(spoolDirectory)):
+            if genomeFile.endswith(genomeExtensions[worker.method]):
+                genome = path.join(workingDirectory, genomeFile)
+                shutil.move(path.join(spoolDirectory, genomeFile), genome)
+                print("Searching " + genome + "...")
+                worker.submit(genome, finishGenome)
+        if store:
+            store.flush()  # So results reach the store while the worker waits for more genomes.
+        time.sleep(pollInterval)
+
+
+# -------------------------------------------------------------------------------------------------
+# 13: Sends genomes to a running worker and writes the results streamed back to the usual files. Returns the
+#     number of genomes that could not be searched.
+def submitGenomes(socketPath, genomes):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socketPath)
+    client.sendall("".join(path.abspath(genome) + "\n" for genome in genomes).encode("utf-8"))
+    client.shutdown(socket.SHUT_WR)
+    errors = 0
+    for line in client.makefile("r"):
+        result = json.loads(line)
+        if result["result"] == "error":
+            print("Failed to search " + result["genome"] + ": " + result["error"])
+            errors += 1
+            continue
+        print(result["genome"] + ": " + result["result"] + " (" + result["tier"] + ")")
+        writeResult(result)
+    client.close()
+    return errors
+
+
+# ===========================================================================================================
+# Main program code:
+if __name__ == "__main__":
+    # House keeping...
+    args = argsCheck()  # Checks if the number of arguments are correct.
+
+    if args.store:
+        try:
+            store = SixteenSResultStore.ResultStore(args.store)
+        except SixteenSResultStore.StoreError:
+            print("Failed to open " + args.store)
+            exit(1)
+        atexit.register(store.close)  # Writes any buffered results when the worker or submission ends.
+
+    if args.command == "submit":
+        try:
+            failedGenomes = submitGenomes(args.socket, args.genomes)
+        except (IOError, OSError):
+            print("Failed to connect to " + args.socket)
+            exit(1)
+        if failedGenomes:
+            exit(1)
+        print("Done.\n")
+        exit(0)
+
+    if not path.isfile(args.reference):
+        print("Failed to open " + args.reference)
+        exit(1)
+    cache = None
+    if args.cache:
+        cache = SixteenSCache.ResultCache(args.cache, args.cache_size * 1024 * 1024)
+
+    print("Loading " + args.reference + "...")
+    signal.signal(signal.SIGTERM, lambda signalNumber, frame: sys.exit(0))  # Shuts down cleanly when killed.
+    worker = SixteenSWorker(args.method, args.reference, args.workers, args.batch_size, args.batch_wait, cache)
+    try:
+        if args.socket:
+            serveSocket(worker, args.socket)
+        else:
+            serveSpool(worker, args.spool, args.poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.close()
+    print("Done.\n")